@@ -0,0 +1,133 @@
+"""
+登入令牌與使用者快取
+/token 簽發 HS256 JWT（sub 為使用者名稱，exp 為到期時間），驗證只需要 AUTH_SECRET，不必查詢資料庫；
+令牌另含密碼指紋 pwd，修改密碼後先前簽發的令牌即失效
+
+使用者資料（含 disabled）在記憶體中保留 AUTH_USER_CACHE_TTL 秒，連續的上傳不必每次查詢 users 集合；
+經由 /api/admin/users/{username} 修改時立即失效（多個 worker 時其他 worker 依 TTL 更新，直接修改資料庫時亦同）
+
+環境變數：
+- AUTH_SECRET：簽章金鑰；未設定時每次啟動隨機產生，重新啟動後需重新登入，多個 worker 時必須設定
+- AUTH_TOKEN_TTL：令牌有效秒數
+- AUTH_USER_CACHE_TTL：使用者資料快取秒數，0 表示停用
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+from typing import Dict, Optional, Tuple
+
+import database
+from models import User, UserInDB
+
+logger = logging.getLogger(__name__)
+
+AUTH_TOKEN_TTL = int(os.getenv('AUTH_TOKEN_TTL', '43200'))
+AUTH_USER_CACHE_TTL = float(os.getenv('AUTH_USER_CACHE_TTL', '30'))
+
+# 第一次使用時才決定，未設定時的警告才會經過 logs.configure() 設定的 handler
+_secret: Optional[bytes] = None
+
+_HEADER = {'alg': 'HS256', 'typ': 'JWT'}
+
+# 使用者 -> (使用者資料, 到期時間)
+_users: Dict[str, Tuple[UserInDB, float]] = {}
+
+
+def _encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def secret() -> bytes:
+    """簽章金鑰；lifespan 啟動時先呼叫一次，未設定 AUTH_SECRET 的警告在啟動時輸出"""
+    global _secret
+    if _secret is None:
+        _secret = os.getenv('AUTH_SECRET', '').encode()
+        if not _secret:
+            _secret = secrets.token_bytes(32)
+            logger.warning("AUTH_SECRET is not set, tokens will not survive a restart or work across workers")
+    return _secret
+
+
+def _sign(message: str) -> str:
+    return _encode(hmac.new(secret(), message.encode(), hashlib.sha256).digest())
+
+
+def password_fingerprint(password: str) -> str:
+    """密碼的 HMAC 前 16 字元，令牌中不會出現密碼本身"""
+    return hmac.new(secret(), b'password:' + password.encode(), hashlib.sha256).hexdigest()[:16]
+
+
+# ============================================================================
+# 令牌
+# ============================================================================
+
+def issue_token(user: UserInDB, ttl: int = AUTH_TOKEN_TTL) -> str:
+    claims = {'sub': user.username, 'exp': int(time.time()) + ttl, 'pwd': password_fingerprint(user.password)}
+    message = '.'.join(_encode(json.dumps(part, separators=(',', ':')).encode()) for part in (_HEADER, claims))
+    return f'{message}.{_sign(message)}'
+
+
+def verify_token(token: str) -> Optional[dict]:
+    """驗證簽章與到期時間，回傳令牌內容；不合法或已過期時回傳 None"""
+    try:
+        header, claims, signature = token.split('.')
+        if not hmac.compare_digest(signature.encode(), _sign(f'{header}.{claims}').encode()):
+            return None
+        if json.loads(_decode(header)) != _HEADER:
+            return None
+        claims = json.loads(_decode(claims))
+    except ValueError:
+        return None
+    if not isinstance(claims, dict) or not isinstance(claims.get('exp'), int) or claims['exp'] < time.time():
+        return None
+    return claims
+
+
+# ============================================================================
+# 使用者快取
+# ============================================================================
+
+def remember_user(user: UserInDB):
+    if AUTH_USER_CACHE_TTL > 0:
+        _users[user.username] = (user, time.monotonic() + AUTH_USER_CACHE_TTL)
+
+
+def invalidate_user(username: str):
+    """使用者資料修改後呼叫"""
+    _users.pop(username, None)
+
+
+async def get_user(username: str) -> Optional[UserInDB]:
+    """取得使用者資料，TTL 內直接使用快取；使用者不存在時回傳 None（不快取）"""
+    cached = _users.get(username)
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+    document = await database.find_user(username)
+    if document is None:
+        _users.pop(username, None)
+        return None
+    user = UserInDB(**document)
+    remember_user(user)
+    return user
+
+
+async def authenticate(token: str) -> Optional[User]:
+    """由令牌取得使用者；令牌不合法、已過期、使用者不存在或密碼已修改時回傳 None"""
+    claims = verify_token(token)
+    if claims is None or not isinstance(claims.get('sub'), str):
+        return None
+    user = await get_user(claims['sub'])
+    fingerprint = str(claims.get('pwd')).encode()
+    if user is None or not hmac.compare_digest(fingerprint, password_fingerprint(user.password).encode()):
+        return None
+    return User(username=user.username, disabled=user.disabled)
@@ -0,0 +1,334 @@
+"""
+API 效能與負載測試
+以可設定大小的光表（玩家數 x 影格數 x 有顏色的部位數）測量各端點的吞吐量與 p50 / p99 延遲，
+結果輸出為 JSON，可比較不同 commit 之間的差異
+
+測量項目：
+- upload_items：POST /api/upload_items 上傳整份光表（每次建立新版本，依序送出）
+- items_full：GET /api/items/{user}/LATEST
+- items_player：GET /api/items/{user}/LATEST/{player}
+- items_chunk：GET /api/items/{user}/LATEST/player={player}/chunk={chunk}
+- timelist：GET /api/timelist/{user}
+- music_download：GET /api/get_music/{user}/{filename}
+GET 項目先送出 --warmup 個請求（第一個請求的延遲記錄為 cold_ms），再以 --concurrency 個並行連線送出 --requests 個請求
+
+預設在同一個行程中以 ASGI 直接呼叫 main.app（不經過網路，包含 lifespan），資料庫使用本機的 MongoDB，
+例如 docker compose -f ../docker-compose.dev.yml up -d mongo；
+測試資料庫（--db，名稱必須以 bench 開頭）會在開始與結束時清空，音樂檔案寫入暫存目錄。
+指定 --base-url 時改對執行中的伺服器測試，需提供已存在的帳號，上傳的版本與音樂會留在該帳號中
+
+使用方法（於 backend 目錄下執行，需先安裝 pip install -e '.[bench]'）：
+    python benchmarks/bench_api.py --players 10 --frames 6000 --output before.json
+    python benchmarks/bench_api.py --players 10 --frames 6000 --output after.json --compare before.json
+    python benchmarks/bench_api.py --base-url http://localhost:8000 --username bench --password bench
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from packing import FRAME_FIELDS, PART_FIELDS  # noqa: E402
+
+SCENARIOS = ('upload_items', 'items_full', 'items_player', 'items_chunk', 'timelist', 'music_download')
+
+MUSIC_FILENAME = 'bench.mp3'
+
+
+def log(message: str):
+    # 結果 JSON 可能輸出到 stdout，進度與表格一律輸出到 stderr
+    print(message, file=sys.stderr)
+
+
+# ============================================================================
+# 測試資料
+# ============================================================================
+
+def make_show(player_count: int, frame_count: int, part_count: int, interval: int, seed: int) -> bytes:
+    """
+    產生 /upload_items 的請求內容（已編碼的 JSON，避免把用戶端的序列化算進延遲）
+    只有前 part_count 個部位有隨機顏色，其餘為 0
+    """
+    import generator
+
+    players = []
+    for player in range(player_count):
+        rows = generator.generate_player('random', seed, player, frame_count, interval)
+        rows[1 + part_count:] = 0
+        players.append([dict(zip(FRAME_FIELDS, frame)) for frame in rows.T.tolist()])
+    return json.dumps({'players': players}, separators=(',', ':')).encode()
+
+
+# ============================================================================
+# 測量
+# ============================================================================
+
+def summarize(latencies: list, seconds: float, errors: int, received: int, cold_ms=None) -> dict:
+    values = np.array(latencies) * 1000
+    result = {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': round(seconds, 4),
+        'requests_per_s': round(len(latencies) / seconds, 2) if seconds else None,
+        'bytes_per_s': round(received / seconds) if seconds else None,
+        'response_bytes': received // len(latencies) if latencies else 0,
+        'latency_ms': {
+            'min': round(float(values.min()), 3),
+            'p50': round(float(np.percentile(values, 50)), 3),
+            'p90': round(float(np.percentile(values, 90)), 3),
+            'p99': round(float(np.percentile(values, 99)), 3),
+            'max': round(float(values.max()), 3),
+            'mean': round(float(values.mean()), 3),
+        } if latencies else None,
+    }
+    if cold_ms is not None:
+        result['cold_ms'] = round(cold_ms, 3)
+    return result
+
+
+async def measure(send, count: int, concurrency: int, warmup: int = 0) -> dict:
+    """以 concurrency 個 worker 共送出 count 個請求；send(i) 回傳 httpx.Response"""
+    cold_ms = None
+    for i in range(warmup):
+        start = time.perf_counter()
+        await send(i)
+        if i == 0:
+            cold_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    stats = {'errors': 0, 'received': 0}
+    pending = iter(range(count))
+
+    async def worker():
+        for i in pending:
+            start = time.perf_counter()
+            response = await send(i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                stats['errors'] += 1
+            stats['received'] += len(response.content)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(concurrency, 1))))
+    return summarize(latencies, time.perf_counter() - start, stats['errors'], stats['received'], cold_ms)
+
+
+async def run_scenarios(client, username: str, headers: dict, args) -> dict:
+    results = {}
+    selected = args.only.split(',') if args.only else SCENARIOS
+
+    log(f"generating {args.players} players x {args.frames} frames x {args.parts} parts")
+    show = make_show(args.players, args.frames, args.parts, args.interval, args.seed)
+    upload_headers = dict(headers, **{'Content-Type': 'application/json'})
+
+    async def upload(_):
+        return await client.post('/api/upload_items', content=show, headers=upload_headers)
+
+    # 讀取項目需要至少一個版本
+    if 'upload_items' in selected:
+        results['upload_items'] = await measure(upload, args.uploads, 1)
+        seconds = results['upload_items']['seconds']
+        results['upload_items']['frames_per_s'] = round(args.players * args.frames * args.uploads / seconds)
+        results['upload_items']['request_bytes'] = len(show)
+    else:
+        response = await upload(0)
+        response.raise_for_status()
+
+    chunk_count = max(args.frames // 10, 1)
+    reads = {
+        'items_full': lambda i: client.get(f'/api/items/{username}/LATEST'),
+        'items_player': lambda i: client.get(f'/api/items/{username}/LATEST/{i % args.players}'),
+        'items_chunk': lambda i: client.get(
+            f'/api/items/{username}/LATEST/player={i % args.players}/chunk={i // args.players % chunk_count}'
+        ),
+        'timelist': lambda i: client.get(f'/api/timelist/{username}'),
+        'music_download': lambda i: client.get(f'/api/get_music/{username}/{MUSIC_FILENAME}'),
+    }
+
+    if 'music_download' in selected:
+        music = np.random.default_rng(args.seed).bytes(args.music_kb * 1024)
+        response = await client.post(
+            '/api/upload_music', headers=headers,
+            files={'file': (MUSIC_FILENAME, music, 'audio/mpeg')},
+        )
+        response.raise_for_status()
+
+    for name, send in reads.items():
+        if name in selected:
+            log(f"running {name}")
+            results[name] = await measure(send, args.requests, args.concurrency, args.warmup)
+    return results
+
+
+# ============================================================================
+# 執行環境
+# ============================================================================
+
+def configure_in_process(args) -> tempfile.TemporaryDirectory:
+    """設定測試資料庫與音樂目錄的環境變數，必須在匯入任何會連線資料庫的模組之前呼叫"""
+    if not args.db.startswith('bench'):
+        raise SystemExit("--db must start with 'bench', the database is dropped before and after the run")
+    os.environ['MONGO_CONNECT_URI'] = args.mongo_uri
+    os.environ['MONGO_DB_NAME'] = args.db
+    music_dir = tempfile.TemporaryDirectory(prefix='lightdance-bench-')
+    os.environ['MUSIC_FILE_PATH'] = music_dir.name
+    return music_dir
+
+
+async def run_in_process(args, music_dir: tempfile.TemporaryDirectory) -> dict:
+    """於同一行程中以 ASGI 呼叫 main.app（包含 lifespan）"""
+    import httpx
+    import database
+    import main
+
+    await database.client.drop_database(args.db)
+    try:
+        async with main.app.router.lifespan_context(main.app):
+            await database.user_list.insert_one({'username': 'bench', 'password': 'bench', 'disabled': False})
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+                headers = await login(client, 'bench', 'bench')
+                return await run_scenarios(client, 'bench', headers, args)
+    finally:
+        await database.client.drop_database(args.db)
+        music_dir.cleanup()
+
+
+async def run_remote(args) -> dict:
+    import httpx
+
+    if not args.username or not args.password:
+        raise SystemExit("--base-url requires --username and --password")
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=None, limits=limits) as client:
+        headers = await login(client, args.username, args.password)
+        return await run_scenarios(client, args.username, headers, args)
+
+
+async def login(client, username: str, password: str) -> dict:
+    response = await client.post('/api/token', data={'username': username, 'password': password})
+    response.raise_for_status()
+    return {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ============================================================================
+# 輸出與比較
+# ============================================================================
+
+def print_table(results: dict):
+    log(f"{'scenario':<16} {'req':>6} {'err':>4} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'MB/s':>9}")
+    for name, result in results.items():
+        latency = result['latency_ms'] or {}
+        log(f"{name:<16} {result['requests']:>6} {result['errors']:>4} {result['requests_per_s'] or 0:>10.1f} "
+            f"{latency.get('p50', 0):>10.2f} {latency.get('p99', 0):>10.2f} {(result['bytes_per_s'] or 0) / 1e6:>9.2f}")
+
+
+def compare(baseline: dict, results: dict, threshold: float) -> list:
+    """與先前的結果比較 p50 / p99，回傳變慢超過 threshold（比例）的項目"""
+    regressions = []
+    log(f"compared with {baseline['meta'].get('commit') or 'baseline'}:")
+    for name, result in results.items():
+        before = baseline['results'].get(name)
+        if not before or not before.get('latency_ms') or not result['latency_ms']:
+            continue
+        ratios = {
+            key: result['latency_ms'][key] / before['latency_ms'][key]
+            for key in ('p50', 'p99') if before['latency_ms'][key] > 0
+        }
+        slower = [key for key, ratio in ratios.items() if ratio > 1 + threshold]
+        if slower:
+            regressions.append(name)
+        log(f"  {name:<16} " + "  ".join(f"{key} x{ratio:.2f}" for key, ratio in ratios.items())
+            + ("  REGRESSION" if slower else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the LightDance API")
+    parser.add_argument('--players', type=int, default=10)
+    parser.add_argument('--frames', type=int, default=6000)
+    parser.add_argument('--parts', type=int, default=len(PART_FIELDS),
+                        help="number of parts with random colours, the rest are 0")
+    parser.add_argument('--interval', type=int, default=1, help="average frame spacing (time units)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--uploads', type=int, default=5, help="number of /upload_items requests")
+    parser.add_argument('--requests', type=int, default=200, help="requests per read scenario")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--music-kb', type=int, default=4096)
+    parser.add_argument('--only', help=f"comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_CONNECT_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--db', default='bench_lightdance')
+    parser.add_argument('--base-url', help="benchmark a running server instead, e.g. http://localhost:8000")
+    parser.add_argument('--username')
+    parser.add_argument('--password')
+    parser.add_argument('--output', default='-', help="result JSON path, '-' for stdout")
+    parser.add_argument('--compare', help="previous result JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="exit with status 1 when p50 or p99 grows by more than this fraction")
+    args = parser.parse_args()
+
+    if not 0 <= args.parts <= len(PART_FIELDS):
+        parser.error(f"--parts must be between 0 and {len(PART_FIELDS)}")
+    if args.only and set(args.only.split(',')) - set(SCENARIOS):
+        parser.error(f"--only accepts {','.join(SCENARIOS)}")
+
+    music_dir = None if args.base_url else configure_in_process(args)
+    import generator
+    try:
+        generator.check_request('random', args.players, args.frames, args.interval, args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+
+    results = asyncio.run(run_remote(args) if args.base_url else run_in_process(args, music_dir))
+    parameters = {key: value for key, value in vars(args).items()
+                  if key not in ('password', 'output', 'compare', 'threshold')}
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'target': args.base_url or 'in-process',
+            'parameters': parameters,
+        },
+        'results': results,
+    }
+
+    print_table(results)
+    content = json.dumps(report, indent=2)
+    if args.output == '-':
+        print(content)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(content + '\n')
+        log(f"results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(json.load(f), results, args.threshold):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+/upload_items 解析效能比較
+比較原本的 Data -> Player -> PlayerData 逐影格驗證與 ingest.py 的整欄驗證
+
+使用方法（於 backend 目錄下執行）：
+    python benchmarks/bench_ingest.py --players 10 --frames 6000 --repeat 5
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest  # noqa: E402
+import storage  # noqa: E402
+from models import Data, Player, PlayerData  # noqa: E402
+from packing import FRAME_FIELDS  # noqa: E402
+
+
+def make_players(player_count: int, frame_count: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [
+        [
+            {field: (t if field == 'time' else rng.getrandbits(32)) for field in FRAME_FIELDS}
+            for t in range(frame_count)
+        ]
+        for _ in range(player_count)
+    ]
+
+
+def legacy_parse(players):
+    user_data = Data(
+        user='bench',
+        last_updated_time='bench',
+        players=[Player(data=[PlayerData(**item) for item in sublist]) for sublist in players]
+    )
+    return [[player_data.model_dump() for player_data in player.data] for player in user_data.players]
+
+
+def fast_parse(players):
+    return ingest.parse_players(players)
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare /upload_items parsing paths")
+    parser.add_argument('--players', type=int, default=10)
+    parser.add_argument('--frames', type=int, default=6000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    players = make_players(args.players, args.frames)
+    total = args.players * args.frames
+    print(f"{args.players} players x {args.frames} frames = {total} frames, best of {args.repeat}")
+
+    rows = [
+        ("legacy parse", lambda: legacy_parse(players)),
+        ("fast parse", lambda: fast_parse(players)),
+        ("legacy parse + chunks", lambda: storage.split_players(legacy_parse(players))),
+        ("fast parse + chunks", lambda: storage.split_players(fast_parse(players))),
+    ]
+    results = {}
+    for name, fn in rows:
+        results[name] = best_of(fn, args.repeat)
+        print(f"{name:<24} {results[name] * 1000:10.1f} ms  {total / results[name]:12.0f} frames/s")
+
+    print(f"speedup (parse)          {results['legacy parse'] / results['fast parse']:10.1f}x")
+    print(f"speedup (parse + chunks) {results['legacy parse + chunks'] / results['fast parse + chunks']:10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
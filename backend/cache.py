@@ -0,0 +1,240 @@
+"""
+光表版本快取
+以 LRU 方式在記憶體中保存最近讀取的版本，上限以位元組數計算
+
+快取內容（版本以 user + update_time 識別，寫入後不會再改變）：
+- items：/items/{username}/{query_time} 序列化後的 JSON
+- packed：欄式壓縮內容（見 packing.py），單一玩家與分塊端點直接由此切出影格；
+  版本大於快取上限（或快取停用）時，這兩個端點改為只讀取範圍所在的分塊
+- raw：/raw/{username}/{query_time} 序列化後的 JSON
+
+同一個版本同時有多個請求未命中時只讀取一次
+
+LATEST 會先解析為實際的 update_time，解析結果保留 VERSION_CACHE_LATEST_TTL 秒，
+並在該使用者上傳新版本時立即失效（多個 worker 時其他 worker 依 TTL 更新）
+
+環境變數：
+- VERSION_CACHE_MAX_BYTES：快取上限（位元組），0 表示停用
+- VERSION_CACHE_LATEST_TTL：LATEST 解析結果的有效秒數
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import database
+import packing
+import storage
+from database import collection_raw
+
+VERSION_CACHE_MAX_BYTES = int(os.getenv('VERSION_CACHE_MAX_BYTES', str(128 * 1024 * 1024)))
+VERSION_CACHE_LATEST_TTL = float(os.getenv('VERSION_CACHE_LATEST_TTL', '5'))
+
+
+class LRUCache:
+    """以位元組數為上限的 LRU 快取，並記錄命中統計"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key) -> bool:
+        """是否已快取，不影響 LRU 順序與命中統計"""
+        return key in self._entries
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, size: int):
+        if size > self.max_bytes:
+            return
+        self.discard(lambda k: k == key)
+        self._entries[key] = (value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def discard(self, predicate: Callable) -> int:
+        """移除所有符合 predicate(key) 的項目，回傳移除數量"""
+        keys = [key for key in self._entries if predicate(key)]
+        for key in keys:
+            self.bytes -= self._entries.pop(key)[1]
+        return len(keys)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+        }
+
+
+version_cache = LRUCache(VERSION_CACHE_MAX_BYTES)
+
+# (種類, 使用者) -> (update_time, 到期時間)
+_latest_times = {}
+
+# 快取鍵 -> 讀取中的 task，同一個版本同時未命中時只讀取一次
+_loading: Dict[tuple, asyncio.Task] = {}
+
+
+def invalidate_latest(username: str):
+    """使用者上傳新版本後呼叫，LATEST 重新解析"""
+    for kind in ('color', 'raw'):
+        _latest_times.pop((kind, username), None)
+
+
+def invalidate_user(username: str):
+    """移除使用者所有的快取內容（版本被刪除時）"""
+    invalidate_latest(username)
+    version_cache.discard(lambda key: key[1] == username)
+
+
+async def _find_latest_time(kind: str, username: str) -> Optional[str]:
+    if kind == 'color':
+        header = await storage.find_color_header(username, 'LATEST')
+    else:
+        header = await database.find_version(collection_raw, username, 'LATEST', {'_id': 0, 'update_time': 1})
+    return header['update_time'] if header else None
+
+
+async def resolve_query_time(kind: str, username: str, query_time: str) -> Optional[str]:
+    """將 LATEST 解析為實際的 update_time，其餘原樣回傳；找不到版本時回傳 None"""
+    if query_time != "LATEST":
+        return query_time
+    cached = _latest_times.get((kind, username))
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+    update_time = await _find_latest_time(kind, username)
+    if update_time is not None:
+        _latest_times[(kind, username)] = (update_time, time.monotonic() + VERSION_CACHE_LATEST_TTL)
+    return update_time
+
+
+async def _cached(key, load):
+    """
+    快取命中時直接回傳，否則執行 load() 並放入快取
+    同一個 key 同時有多個請求未命中時，後到的請求等待同一個 load()；
+    以 shield 等待，單一請求被取消不會中斷其他請求共用的讀取
+    """
+    value = version_cache.get(key)
+    if value is not None:
+        return value
+    task = _loading.get(key)
+    if task is None:
+        async def run():
+            try:
+                result = await load()
+                if result is not None:
+                    version_cache.put(key, result, len(result))
+                return result
+            finally:
+                _loading.pop(key, None)
+
+        task = _loading[key] = asyncio.ensure_future(run())
+    return await asyncio.shield(task)
+
+
+def _render_json(document: dict) -> bytes:
+    return JSONResponse(jsonable_encoder(document, custom_encoder={ObjectId: str})).body
+
+
+async def get_items_json(username: str, query_time: str) -> Optional[bytes]:
+    """/items/{username}/{query_time} 的 JSON 內容，找不到版本時回傳 None"""
+    update_time = await resolve_query_time('color', username, query_time)
+    if update_time is None:
+        return None
+
+    async def load():
+        document = await storage.load_color_version(username, update_time)
+        return _render_json(document) if document else None
+
+    return await _cached(('items', username, update_time), load)
+
+
+async def _load_packed(username: str, update_time: str) -> Optional[bytes]:
+    async def load():
+        result = await storage.load_packed_version(username, update_time)
+        return result[1] if result else None
+
+    return await _cached(('packed', username, update_time), load)
+
+
+async def get_packed(username: str, query_time: str):
+    """
+    欄式壓縮內容，找不到版本時回傳 None，否則回傳 (update_time, 位元組)
+    數值超出 uint32 範圍時拋出 OverflowError
+    """
+    update_time = await resolve_query_time('color', username, query_time)
+    if update_time is None:
+        return None
+    content = await _load_packed(username, update_time)
+    return None if content is None else (update_time, content)
+
+
+def _fits_cache(header: dict) -> bool:
+    """版本的欄式壓縮內容能否放入快取；舊格式文件沒有影格數，視為不能"""
+    if 'frame_counts' not in header:
+        return False
+    return packing.packed_size(header['frame_counts']) <= version_cache.max_bytes
+
+
+async def get_raw_json(username: str, query_time: str) -> Optional[bytes]:
+    """/raw/{username}/{query_time} 的 JSON 內容，找不到版本時回傳 None"""
+    update_time = await resolve_query_time('raw', username, query_time)
+    if update_time is None:
+        return None
+
+    async def load():
+        document = await storage.load_raw_version(username, update_time)
+        return _render_json(document) if document else None
+
+    return await _cached(('raw', username, update_time), load)
+
+
+async def get_player_frames(username: str, query_time: str, player: int,
+                            start: int = 0, count: Optional[int] = None):
+    """
+    取出單一玩家的影格，回傳值與 storage.load_player_frames 相同
+    快取中已有欄式壓縮內容時直接切出；否則只在整個版本放得進快取時才讀取整個版本，
+    快取停用、版本超過快取上限或數值超出 uint32 範圍時，改為只讀取範圍所在的分塊
+    """
+    update_time = await resolve_query_time('color', username, query_time)
+    if update_time is None:
+        return None
+    if ('packed', username, update_time) not in version_cache:
+        header = await storage.find_color_header(username, update_time)
+        if header is None:
+            return None
+        if not _fits_cache(header):
+            return await storage.load_header_player_frames(header, player, start=start, count=count)
+    try:
+        content = await _load_packed(username, update_time)
+    except OverflowError:
+        return await storage.load_player_frames(username, update_time, player, start=start, count=count)
+    if content is None:
+        return None
+    return packing.packed_player_frames(content, player, start, count)
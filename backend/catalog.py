@@ -0,0 +1,164 @@
+"""
+光表版本目錄
+collection_catalog 為每個光表版本保存一筆摘要，時間清單只需讀取此集合
+
+欄位：user, update_time, size（儲存的 BSON 位元組數）, player_count, frame_count, delta
+
+上傳、轉換、整併與清除版本時由 storage.py / retention.py 維護；
+既有資料可用 rebuild 重新建立
+"""
+
+import base64
+import json
+from typing import Dict, Iterable, List, Optional
+
+import bson
+from pymongo import ASCENDING, DESCENDING
+
+from database import collection_catalog, collection_color, collection_color_chunks, collection_color_patches
+
+# 時間清單的排序：使用者遞增、更新時間遞減（最新的在前）
+CATALOG_SORT = [('user', ASCENDING), ('update_time', DESCENDING)]
+
+_LIST_PROJECTION = {'_id': 0, 'user': 1, 'update_time': 1, 'size': 1, 'player_count': 1, 'frame_count': 1}
+
+
+def build_entry(header: dict, size: int) -> dict:
+    return {
+        'user': header['user'],
+        'update_time': header['update_time'],
+        'size': size,
+        'player_count': header.get('player_count', 0),
+        'frame_count': sum(header.get('frame_counts', [])),
+        'delta': 'base_id' in header,
+    }
+
+
+async def record_version(header: dict, size: int):
+    """新增或更新單一版本的摘要"""
+    entry = build_entry(header, size)
+    await collection_catalog.update_one(
+        {'user': entry['user'], 'update_time': entry['update_time']},
+        {'$set': entry},
+        upsert=True
+    )
+
+
+async def remove_versions(user: str, update_times: Iterable[str]):
+    await collection_catalog.delete_many({'user': user, 'update_time': {'$in': list(update_times)}})
+
+
+# ============================================================================
+# 分頁查詢
+# ============================================================================
+
+def encode_cursor(entry: dict, keys=('user', 'update_time')) -> str:
+    """以最後一筆的排序鍵（預設為 user, update_time）作為下一頁的游標"""
+    raw = json.dumps([entry[key] for key in keys]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str, size: int = 2) -> list:
+    """解析游標，格式錯誤時拋出 ValueError"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception as e:
+        raise ValueError(f"invalid cursor: {cursor}") from e
+    if not isinstance(values, list) or len(values) != size or not all(isinstance(v, str) for v in values):
+        raise ValueError(f"invalid cursor: {cursor}")
+    return values
+
+
+async def list_versions(username: Optional[str] = None, limit: Optional[int] = None,
+                        cursor: Optional[str] = None):
+    """
+    依 CATALOG_SORT 排序取得版本摘要
+    limit 為 None 時回傳全部；回傳 (摘要清單, 下一頁游標或 None)
+    """
+    query = {}
+    if username is not None:
+        query['user'] = username
+    if cursor is not None:
+        last_user, last_time = decode_cursor(cursor)
+        after = [{'user': last_user, 'update_time': {'$lt': last_time}}]
+        if username is None:
+            after.append({'user': {'$gt': last_user}})
+        query = {'$and': [query, {'$or': after}]} if query else {'$or': after}
+
+    find = collection_catalog.find(query, _LIST_PROJECTION).sort(CATALOG_SORT)
+    if limit is not None:
+        # 多取一筆以判斷是否還有下一頁
+        find = find.limit(limit + 1)
+    entries = await find.to_list(length=None)
+
+    next_cursor = None
+    if limit is not None and len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = encode_cursor(entries[-1])
+    return entries, next_cursor
+
+
+async def active_users(since: str, limit: int) -> List[str]:
+    """最新版本的 update_time 不早於 since 的使用者，依最新版本由新到舊排序，最多 limit 位"""
+    cursor = await collection_catalog.aggregate([
+        {'$match': {'update_time': {'$gte': since}}},
+        {'$group': {'_id': '$user', 'latest': {'$max': '$update_time'}}},
+        {'$sort': {'latest': DESCENDING}},
+        {'$limit': limit},
+    ])
+    return [entry['_id'] for entry in await cursor.to_list(length=None)]
+
+
+# ============================================================================
+# 重建
+# ============================================================================
+
+async def _sizes_by_version(collection, match: Optional[dict] = None) -> dict:
+    pipeline = [{'$group': {'_id': '$version_id', 'bytes': {'$sum': {'$bsonSize': '$$ROOT'}}}}]
+    if match is not None:
+        pipeline.insert(0, {'$match': match})
+    cursor = await collection.aggregate(pipeline)
+    return {entry['_id']: entry['bytes'] for entry in await cursor.to_list(length=None)}
+
+
+async def record_stored_version(header: dict):
+    """由已寫入的表頭、分塊與 patch 計算大小並更新單一版本的摘要（寫入中斷後補上目錄時使用）"""
+    match = {'version_id': header['_id']}
+    size = len(bson.encode(header))
+    for collection in (collection_color_chunks, collection_color_patches):
+        size += (await _sizes_by_version(collection, match)).get(header['_id'], 0)
+    await record_version(header, size)
+
+
+async def rebuild() -> int:
+    """
+    由 collection_color 重新建立整個目錄，回傳版本數
+    update_time 只到秒，舊資料可能有相同 user + update_time 的文件；目錄的這組鍵是唯一的，
+    因此只保留最早寫入的一筆（與依 update_time 查詢時 find_one 取得的文件相同）
+    """
+    chunk_sizes = await _sizes_by_version(collection_color_chunks)
+    patch_sizes = await _sizes_by_version(collection_color_patches)
+
+    cursor = await collection_color.aggregate([
+        {'$sort': {'_id': ASCENDING}},
+        {'$project': {
+            'user': 1, 'update_time': 1, 'player_count': 1, 'frame_counts': 1, 'base_id': 1,
+            'legacy_counts': {'$map': {'input': {'$ifNull': ['$players', []]}, 'in': {'$size': '$$this'}}},
+            'bytes': {'$bsonSize': '$$ROOT'},
+        }},
+    ])
+    entries: Dict[tuple, dict] = {}
+    for header in await cursor.to_list(length=None):
+        key = (header['user'], header['update_time'])
+        if key in entries:
+            continue
+        if 'frame_counts' not in header:
+            header['frame_counts'] = header['legacy_counts']
+            header['player_count'] = len(header['legacy_counts'])
+        size = header['bytes'] + chunk_sizes.get(header['_id'], 0) + patch_sizes.get(header['_id'], 0)
+        entries[key] = build_entry(header, size)
+
+    await collection_catalog.delete_many({})
+    if entries:
+        await collection_catalog.insert_many(list(entries.values()))
+    return len(entries)
@@ -0,0 +1,154 @@
+"""
+資料庫存取層
+此檔案集中管理 MongoDB 非同步連線池，並提供各路由共用的查詢函式
+
+所有函式皆為 async，底層使用 pymongo 的 AsyncMongoClient，
+不會在 uvicorn 的 event loop 中執行阻塞式 I/O。
+
+連線池設定（環境變數）：
+- MONGO_CONNECT_URI：MongoDB 連線字串
+- MONGO_DB_NAME：資料庫名稱（預設 test）
+- MONGO_MAX_POOL_SIZE / MONGO_MIN_POOL_SIZE：連線池大小上下限
+- MONGO_MAX_IDLE_TIME_MS：閒置連線回收時間
+- MONGO_WAIT_QUEUE_TIMEOUT_MS：等待可用連線的逾時
+- MONGO_SERVER_SELECTION_TIMEOUT_MS / MONGO_CONNECT_TIMEOUT_MS / MONGO_SOCKET_TIMEOUT_MS：各類逾時
+"""
+
+import os
+from typing import Optional
+
+from dotenv import load_dotenv
+from pymongo import AsyncMongoClient
+
+import metrics
+
+load_dotenv()
+
+
+def _env_int(name: str, default: Optional[int]) -> Optional[int]:
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return int(value)
+
+
+# ============================================================================
+# 連線池設定
+# ============================================================================
+
+MONGO_CONNECT_URI = os.getenv('MONGO_CONNECT_URI')
+MONGO_DB_NAME = os.getenv('MONGO_DB_NAME', 'test')
+
+MONGO_MAX_POOL_SIZE = _env_int('MONGO_MAX_POOL_SIZE', 100)
+MONGO_MIN_POOL_SIZE = _env_int('MONGO_MIN_POOL_SIZE', 0)
+MONGO_MAX_IDLE_TIME_MS = _env_int('MONGO_MAX_IDLE_TIME_MS', None)
+MONGO_WAIT_QUEUE_TIMEOUT_MS = _env_int('MONGO_WAIT_QUEUE_TIMEOUT_MS', None)
+MONGO_SERVER_SELECTION_TIMEOUT_MS = _env_int('MONGO_SERVER_SELECTION_TIMEOUT_MS', 30000)
+MONGO_CONNECT_TIMEOUT_MS = _env_int('MONGO_CONNECT_TIMEOUT_MS', 20000)
+MONGO_SOCKET_TIMEOUT_MS = _env_int('MONGO_SOCKET_TIMEOUT_MS', None)
+
+# 建立時不連線，第一次查詢（或 lifespan 中的 ping，見 health.py）時才連線
+client = AsyncMongoClient(
+    MONGO_CONNECT_URI,
+    connect=False,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+    # 每個指令的來回時間計入 /api/metrics（見 metrics.py）
+    event_listeners=[metrics.MongoListener()],
+)
+
+db = client[MONGO_DB_NAME]
+collection_color = db['color']
+collection_color_chunks = db['color_chunks']
+collection_color_patches = db['color_patches']
+collection_catalog = db['version_catalog']
+collection_raw = db['raw_json']
+collection_upload_sessions = db['upload_sessions']
+collection_upload_parts = db['upload_parts']
+collection_pico = db['pico']
+collection_music = db['music']
+user_list = db['users']
+
+
+async def ping():
+    """確認資料庫可連線，失敗時拋出例外"""
+    await client.admin.command('ping')
+
+
+async def close():
+    """關閉連線池"""
+    await client.close()
+
+
+# ============================================================================
+# 版本資料查詢（collection_color / collection_raw 共用）
+# ============================================================================
+
+async def find_version(collection, username: str, query_time: str, projection=None):
+    """
+    取得使用者特定版本的文件
+    query_time 為 "LATEST" 時回傳最新一筆
+    """
+    if query_time == "LATEST":
+        return await collection.find_one(
+            {"user": username},
+            projection,
+            sort=[("update_time", -1)]  # Sort by update_time in descending order to get the latest entry
+        )
+    return await collection.find_one({"user": username, "update_time": query_time}, projection)
+
+
+async def find_player_frames(collection, username: str, query_time: str, player: int,
+                             start: int = 0, count: Optional[int] = None):
+    """
+    只取出單一玩家（可再指定影格範圍）的燈光資料
+    篩選在 MongoDB 端以 aggregation 完成，回傳資料量只和請求範圍有關
+
+    回傳 None 表示找不到版本，否則回傳 (玩家總數, 影格清單)
+    """
+    match = {"user": username}
+    if query_time != "LATEST":
+        match["update_time"] = query_time
+
+    player_frames = {"$ifNull": [{"$arrayElemAt": ["$players", player]}, []]}
+    if count is not None:
+        player_frames = {"$slice": [player_frames, start, count]}
+
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"update_time": -1}},
+        {"$limit": 1},
+        {"$project": {
+            "_id": 0,
+            "player_count": {"$size": {"$ifNull": ["$players", []]}},
+            "frames": player_frames,
+        }},
+    ]
+    cursor = await collection.aggregate(pipeline)
+    result = await cursor.to_list(length=1)
+    if not result:
+        return None
+    return result[0]["player_count"], result[0]["frames"]
+
+
+async def insert_version(collection, document: dict):
+    return await collection.insert_one(document)
+
+
+# ============================================================================
+# 使用者查詢
+# ============================================================================
+
+async def find_user(username: str):
+    return await user_list.find_one({"username": username})
+
+
+async def update_user(username: str, fields: dict) -> bool:
+    """更新使用者欄位，回傳使用者是否存在"""
+    result = await user_list.update_one({"username": username}, {"$set": fields})
+    return result.matched_count > 0
@@ -0,0 +1,88 @@
+"""
+增量儲存（patch）的格式檢查與套用
+此檔案只包含純函式，讀寫資料庫的部分見 storage.py
+
+光表 patch（/upload_items_patch）：
+    player_count：可選，先將玩家數截斷或補足為此數量
+    ops：依序套用的區段替換 [{player, start, end, frames}]
+         players[player][start:end] = frames，player 等於目前玩家數時新增一位玩家
+
+原始資料 patch（/upload_raw_patch）：
+    ops：依序套用的字串替換 [{start, end, text}]
+         raw_data[start:end] = text，位置以 Unicode code point 計算
+"""
+
+from typing import List, Optional
+
+
+class PatchError(ValueError):
+    """patch 內容與基準版本不符"""
+
+
+def _check_range(start, end, length: int, where: str):
+    if type(start) is not int or type(end) is not int or not 0 <= start <= end <= length:
+        raise PatchError(f"{where}: invalid range [{start}, {end}) for length {length}")
+
+
+# ============================================================================
+# 光表 patch
+# ============================================================================
+
+def resize_players(players: list, player_count: Optional[int]) -> list:
+    if player_count is None:
+        return players
+    return players[:player_count] + [[] for _ in range(player_count - len(players))]
+
+
+def check_color_ops(frame_counts: List[int], player_count: Optional[int], ops: list) -> List[int]:
+    """
+    只用影格數檢查 ops 是否可套用在基準版本上
+    ops 中的 frames 以影格數 length 表示；回傳套用後每位玩家的影格數
+    """
+    if player_count is not None and (type(player_count) is not int or player_count < 0):
+        raise PatchError(f"invalid player_count: {player_count}")
+    counts = list(frame_counts)
+    if player_count is not None:
+        counts = counts[:player_count] + [0] * (player_count - len(counts))
+
+    for index, op in enumerate(ops):
+        player = op['player']
+        if type(player) is not int or not 0 <= player <= len(counts):
+            raise PatchError(f"ops[{index}]: invalid player {player}")
+        if player == len(counts):
+            counts.append(0)
+        _check_range(op['start'], op['end'], counts[player], f"ops[{index}]")
+        counts[player] += op['length'] - (op['end'] - op['start'])
+    return counts
+
+
+def apply_color_ops(players: List[list], player_count: Optional[int], ops: list) -> List[list]:
+    """套用光表 patch，ops 的 frames 為影格清單"""
+    players = [list(frames) for frames in resize_players(players, player_count)]
+    for op in ops:
+        if op['player'] == len(players):
+            players.append([])
+        players[op['player']][op['start']:op['end']] = op['frames']
+    return players
+
+
+def apply_player_ops(frames: list, player: int, ops: list) -> list:
+    """只套用與單一玩家有關的 ops"""
+    frames = list(frames)
+    for op in ops:
+        if op['player'] == player:
+            frames[op['start']:op['end']] = op['frames']
+    return frames
+
+
+# ============================================================================
+# 原始資料 patch
+# ============================================================================
+
+def apply_text_ops(text: str, ops: list) -> str:
+    for index, op in enumerate(ops):
+        _check_range(op.get('start'), op.get('end'), len(text), f"ops[{index}]")
+        if not isinstance(op.get('text'), str):
+            raise PatchError(f"ops[{index}]: text must be a string")
+        text = text[:op['start']] + op['text'] + text[op['end']:]
+    return text
@@ -0,0 +1,142 @@
+"""
+光表版本的差異比對
+比對同一位使用者的兩個版本，回傳每位玩家、每個部位顏色不同的時間範圍，檢視兩次儲存之間的修改時
+不需下載兩個完整版本在瀏覽器中比對
+
+比對使用 timeline.py 的區間索引（每個部位只保留顏色改變的影格）：
+- 取兩個版本區間起點的聯集，聯集中相鄰兩點之間，兩個版本各自落在單一區間內
+- 每一段以 (顏色, 漸變起點, 漸變終點, 漸變目標顏色) 描述，不漸變時後三者為 0，
+  描述相同即該段顏色完全相同；整個部位的比對以 numpy 一次完成，沒有逐影格的迴圈
+- 相鄰且兩個版本的描述都不變的不同段合併為一個範圍
+影格內容相同、只是切分方式不同（例如合併了重複的影格）時不視為修改
+
+範圍以毫秒表示，end 為 None 表示持續到最後；old / new 為範圍起點所在影格的值（0xRRGGBBXX，
+最低位元為 1 表示正漸變到下一個影格的顏色），第一個影格之前為 0（熄滅）；
+結果依版本保存在 cache.py 的版本快取中
+
+環境變數：
+- DIFF_MAX_CHANGES：單一比對回傳的範圍數上限，超過時截斷並標示 truncated
+"""
+
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+import cache
+import timeline
+
+DIFF_MAX_CHANGES = int(os.getenv('DIFF_MAX_CHANGES', '100000'))
+
+FIELDS = ('player', 'part', 'start', 'end', 'old', 'new')
+
+_EMPTY = (np.zeros(0, dtype='<u4'), np.zeros(0, dtype='<u4'))
+
+
+def _segments(starts: np.ndarray, values: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """各段的描述，形狀為 (4, 段數)：顏色、漸變起點、漸變終點、漸變目標顏色"""
+    result = np.zeros((4, len(points)), dtype=np.int64)
+    if not len(starts):
+        return result
+    index = np.searchsorted(starts, points, side='right') - 1
+    current = np.maximum(index, 0)
+    following = np.minimum(current + 1, len(starts) - 1)
+    value = values[current].astype(np.int64)
+    target = values[following].astype(np.int64)
+    # 與 timeline.part_colors 相同：最後一個影格、或與下一個影格顏色相同時實際上不漸變
+    fading = (index >= 0) & ((value & 1) == 1) & (starts[following] > starts[current]) & ((value >> 1) != (target >> 1))
+    result[0] = np.where(index >= 0, np.where(fading, value, value & ~1), 0)
+    result[1] = np.where(fading, starts[current], 0)
+    result[2] = np.where(fading, starts[following], 0)
+    result[3] = np.where(fading, target & ~1, 0)
+    return result
+
+
+def diff_part(old: timeline.PartIntervals, new: timeline.PartIntervals) -> List[tuple]:
+    """單一部位顏色不同的範圍：[(起點, 終點或 None, 舊值, 新值)]，時間單位為 timeline.TIME_UNIT_MS"""
+    if np.array_equal(old[0], new[0]) and np.array_equal(old[1], new[1]):
+        return []
+    points = np.union1d(old[0], new[0])
+    before, after = _segments(*old, points), _segments(*new, points)
+    changed = (before != after).any(axis=0)
+    if not changed.any():
+        return []
+
+    # 新範圍的起點：有修改，且前一段沒有修改或任一版本的描述不同
+    same_as_previous = np.zeros(len(points), dtype=bool)
+    same_as_previous[1:] = ((before[:, 1:] == before[:, :-1]) & (after[:, 1:] == after[:, :-1])).all(axis=0)
+    previous_changed = np.zeros(len(points), dtype=bool)
+    previous_changed[1:] = changed[:-1]
+    run_starts = np.flatnonzero(changed & ~(previous_changed & same_as_previous))
+    boundaries = np.flatnonzero(~changed | ~(previous_changed & same_as_previous))
+    run_ends = np.searchsorted(boundaries, run_starts, side='right')
+
+    ranges = []
+    for start, end in zip(run_starts.tolist(), run_ends.tolist()):
+        end_time = int(points[boundaries[end]]) if end < len(boundaries) else None
+        ranges.append((int(points[start]), end_time, int(before[0, start]), int(after[0, start])))
+    return ranges
+
+
+def diff_indexes(old: List[Dict[str, timeline.PartIntervals]], new: List[Dict[str, timeline.PartIntervals]],
+                 players: Optional[List[int]] = None, max_changes: int = DIFF_MAX_CHANGES) -> dict:
+    """
+    比對兩個版本的區間索引（阻塞式，請在 threadpool 中執行）
+    只存在於其中一個版本的玩家，另一個版本視為全程熄滅
+    """
+    players = range(max(len(old), len(new))) if players is None else players
+    changes = []
+    truncated = False
+    for player in players:
+        old_parts = old[player] if player < len(old) else {}
+        new_parts = new[player] if player < len(new) else {}
+        for column, part in enumerate(timeline.COLOR_PARTS):
+            for start, end, before, after in diff_part(old_parts.get(part, _EMPTY), new_parts.get(part, _EMPTY)):
+                if len(changes) >= max_changes:
+                    truncated = True
+                    break
+                changes.append([
+                    player, column, start * timeline.TIME_UNIT_MS,
+                    None if end is None else end * timeline.TIME_UNIT_MS, before, after,
+                ])
+            if truncated:
+                break
+        if truncated:
+            break
+    return {
+        'player_counts': [len(old), len(new)],
+        'changed_players': sorted({change[0] for change in changes}),
+        'truncated': truncated,
+        'changes': changes,
+    }
+
+
+async def get_diff(username: str, old_time: str, new_time: str, player: Optional[int] = None) -> Optional[bytes]:
+    """
+    比對兩個版本（update_time 需已解析），回傳 JSON 內容；找不到任一版本時回傳 None
+    玩家不存在於兩個版本時拋出 IndexError，數值超出 uint32 範圍時拋出 OverflowError
+    """
+    key = ('diff', username, old_time, new_time, player)
+    content = cache.version_cache.get(key)
+    if content is not None:
+        return content
+
+    old = await timeline.get_index(username, old_time)
+    new = await timeline.get_index(username, new_time)
+    if old is None or new is None:
+        return None
+    if player is not None and not 0 <= player < max(len(old), len(new)):
+        raise IndexError(player)
+
+    result = await run_in_threadpool(diff_indexes, old, new, None if player is None else [player])
+    content = json.dumps({
+        'from': old_time,
+        'to': new_time,
+        'parts': list(timeline.COLOR_PARTS),
+        'fields': list(FIELDS),
+        **result,
+    }, separators=(',', ':')).encode()
+    cache.version_cache.put(key, content, len(content))
+    return content
@@ -0,0 +1,106 @@
+"""
+隨機與測試光表產生器
+以 NumPy 一次產生整位玩家的所有影格（欄位 x 影格 的 uint32 陣列），不逐影格、逐部位呼叫 random，
+可產生遠大於一般演出的多玩家光表，供壓力測試與韌體長時間測試使用
+
+模式：
+- random：time 由 0 開始、間隔為 1 ~ 2 * interval 的隨機值；各部位為隨機 uint32 顏色
+          每位玩家以 (seed, player) 建立亂數產生器，相同 seed 產生相同內容
+- test：time 為 frame * interval；部位 k 每 2^(k mod 8) 個影格換一次 TEST_COLORS 中的顏色，
+        玩家依編號錯開，內容可預測，韌體可逐影格比對
+
+輸出與一般光表相同的 PlayerData 欄位：
+- JSON：與 /items/{username}/{query_time} 相同的 {"players": [[...], ...]}，逐位玩家產生
+- 二進位：與 /items/{username}/{query_time}/packed 相同的格式（見 packing.py）
+
+環境變數：
+- GENERATOR_MAX_FRAMES：單一請求的影格總數（玩家數 x 影格數）上限
+"""
+
+import os
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+import packing
+import streaming
+
+GENERATOR_MAX_FRAMES = int(os.getenv('GENERATOR_MAX_FRAMES', '2000000'))
+
+MODES = ('random', 'test')
+
+# 測試模式的顏色（0xRRGGBBXX），亮度（XX 的高 7 位元）與舊版測試光表的 0x05 相同；
+# 最低位元（漸變，見 timeline.py）為 0，每個影格都是固定顏色，韌體可逐影格比對
+TEST_COLORS = np.array([
+    0x00000004, 0xFF000004, 0x00FF0004, 0x0000FF04,
+    0xFFFF0004, 0x00FFFF04, 0xFF00FF04, 0xFFFFFF04,
+], dtype=np.uint32)
+
+_UINT32_MAX = 0xFFFFFFFF
+
+# JSON 輸出時每次轉換的影格數，限制單一字串的大小
+_JSON_BLOCK_FRAMES = 10000
+
+
+def check_request(mode: str, player_count: int, frame_count: int, interval: int, seed: Optional[int] = None):
+    """檢查產生參數，不合法時拋出 ValueError"""
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {list(MODES)}")
+    if player_count < 1 or frame_count < 1:
+        raise ValueError("players and frames must be positive")
+    if player_count * frame_count > GENERATOR_MAX_FRAMES:
+        raise ValueError(f"players x frames must not exceed {GENERATOR_MAX_FRAMES}")
+    if interval < 1 or 2 * interval * frame_count > _UINT32_MAX:
+        raise ValueError("interval must be positive and keep every time within uint32")
+    if seed is not None and seed < 0:
+        raise ValueError("seed must not be negative")
+
+
+def generate_player(mode: str, seed: int, player: int, frame_count: int, interval: int = 1,
+                    start: int = 0, end: Optional[int] = None) -> np.ndarray:
+    """
+    產生單一玩家的影格 [start, end)，回傳形狀為 (len(FRAME_FIELDS), 影格數) 的 uint32 陣列
+    列的順序與 packing.FRAME_FIELDS 相同
+    """
+    end = frame_count if end is None else min(end, frame_count)
+    start = min(max(start, 0), end)
+    parts = len(packing.PART_FIELDS)
+
+    if mode == 'test':
+        frames = np.arange(start, end, dtype=np.uint32)
+        shifts = (np.arange(parts, dtype=np.uint32) % 8)[:, None]
+        colors = TEST_COLORS[((frames[None, :] >> shifts) + player) % len(TEST_COLORS)]
+        return np.vstack([frames * np.uint32(interval), colors])
+
+    # 隨機模式需由頭產生才能得到相同的時間與顏色，再取出範圍
+    rng = np.random.default_rng([seed, player])
+    gaps = rng.integers(1, 2 * interval + 1, size=frame_count, dtype=np.uint32)
+    gaps[0] = 0
+    times = np.cumsum(gaps, dtype=np.uint32)
+    colors = rng.integers(0, _UINT32_MAX, size=(parts, frame_count), dtype=np.uint32, endpoint=True)
+    return np.vstack([times, colors])[:, start:end]
+
+
+def iter_json(mode: str, seed: int, player_count: int, frame_count: int, interval: int = 1,
+              start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+    """逐位玩家產生 JSON，一次只保留一位玩家的陣列（阻塞式，StreamingResponse 會在 threadpool 中執行）"""
+    yield b'{"players":['
+    for player in range(player_count):
+        rows = generate_player(mode, seed, player, frame_count, interval, start, end)
+        yield b"[" if player == 0 else b"],["
+        for block in range(0, rows.shape[1], _JSON_BLOCK_FRAMES):
+            content = streaming.rows_json(map(tuple, rows[:, block:block + _JSON_BLOCK_FRAMES].T.tolist()))
+            yield (content if block == 0 else "," + content).encode()
+    yield b"]]}"
+
+
+def packed(mode: str, seed: int, player_count: int, frame_count: int, interval: int = 1,
+           start: int = 0, end: Optional[int] = None) -> bytes:
+    """產生傳輸用的二進位內容（阻塞式，請在 threadpool 中執行）"""
+    players_columns: List[dict] = []
+    frame_counts: List[int] = []
+    for player in range(player_count):
+        rows = generate_player(mode, seed, player, frame_count, interval, start, end).astype('<u4', copy=False)
+        players_columns.append({field: rows[index].tobytes() for index, field in enumerate(packing.FRAME_FIELDS)})
+        frame_counts.append(rows.shape[1])
+    return packing.encode_packed(players_columns, frame_counts)
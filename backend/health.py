@@ -0,0 +1,158 @@
+"""
+啟動狀態、存活與就緒檢查、快取預熱
+匯入模組與啟動 worker 時不連線資料庫（database.py 的連線池在第一次使用時才建立連線），
+lifespan 於背景執行啟動程序：重試連線直到成功 -> 建立索引與目錄 -> （選用）預熱 -> 就緒；
+建立索引與目錄時發生錯誤（例如 MongoDB 切換 primary、逾時）會以相同的間隔重試，
+只有 INDEX_STRICT 的 COLLSCAN 視為永久失敗
+
+- 存活（/api/health/live）：行程與 event loop 仍在回應，不檢查資料庫
+- 就緒（/api/health/ready）：啟動程序已完成，且資料庫在 HEALTH_PING_TIMEOUT 秒內回應 ping；
+  未就緒時回傳 503，負載平衡器不會把請求送到這個 worker
+
+預熱：將最近 WARMUP_ACTIVE_DAYS 天內有上傳的使用者（最多 WARMUP_USERS 位）的 LATEST 版本
+載入版本快取（cache.py，完整 JSON 與欄式壓縮內容），新 worker 的第一批請求不必讀取資料庫；
+快取將滿或超過 WARMUP_TIMEOUT 秒時停止，預熱失敗或逾時不影響就緒
+
+環境變數：
+- HEALTH_PING_TIMEOUT：就緒檢查的 ping 逾時（秒）
+- STARTUP_RETRY_MAX_DELAY：啟動時連線失敗的最長重試間隔（秒）
+- WARMUP_USERS：預熱的使用者數上限，0 表示停用
+- WARMUP_ACTIVE_DAYS：只預熱最近幾天內有上傳的使用者
+- WARMUP_TIMEOUT：預熱的時間上限（秒）
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable
+
+import cache
+import catalog
+import database
+import indexes
+
+logger = logging.getLogger(__name__)
+
+HEALTH_PING_TIMEOUT = float(os.getenv('HEALTH_PING_TIMEOUT', '2'))
+STARTUP_RETRY_MAX_DELAY = float(os.getenv('STARTUP_RETRY_MAX_DELAY', '30'))
+WARMUP_USERS = int(os.getenv('WARMUP_USERS', '0'))
+WARMUP_ACTIVE_DAYS = float(os.getenv('WARMUP_ACTIVE_DAYS', '30'))
+WARMUP_TIMEOUT = float(os.getenv('WARMUP_TIMEOUT', '60'))
+
+# 快取使用量超過上限的比例時停止預熱，保留空間給實際的請求
+_WARMUP_CACHE_FRACTION = 0.8
+
+state = {
+    'started_at': time.time(),
+    'database': False,
+    'setup': False,
+    'failed': False,
+    'warmup': 'pending' if WARMUP_USERS > 0 and cache.version_cache.max_bytes > 0 else 'disabled',
+    'warmed_users': 0,
+    'attempts': 0,
+    'error': None,
+}
+
+
+async def _ping() -> bool:
+    try:
+        await asyncio.wait_for(database.ping(), HEALTH_PING_TIMEOUT)
+        state['error'] = None
+        return True
+    except Exception as e:
+        state['error'] = f"{type(e).__name__}: {e}"
+        return False
+
+
+def _next_delay(delay: float) -> float:
+    return min(delay * 2, STARTUP_RETRY_MAX_DELAY)
+
+
+async def wait_for_database():
+    """重試 ping 直到資料庫可連線，間隔由 1 秒倍增至 STARTUP_RETRY_MAX_DELAY"""
+    delay = 1.0
+    while True:
+        state['attempts'] += 1
+        if await _ping():
+            state['database'] = True
+            return
+        logger.warning("MongoDB is not reachable (attempt %d), retrying in %.0fs: %s",
+                       state['attempts'], delay, state['error'])
+        await asyncio.sleep(delay)
+        delay = _next_delay(delay)
+
+
+async def _set_up(setup: Callable[[], Awaitable[None]]) -> bool:
+    """連線後執行 setup，暫時性的錯誤以與連線相同的間隔重試；永久失敗時回傳 False"""
+    delay = 1.0
+    while True:
+        await wait_for_database()
+        logger.info("Pinged your deployment. You successfully connected to MongoDB!")
+        try:
+            await setup()
+            return True
+        except indexes.QueryPlanError as e:
+            state['error'] = f"{type(e).__name__}: {e}"
+            logger.exception("Startup failed, the worker will stay not ready")
+            return False
+        except Exception as e:
+            state['error'] = f"{type(e).__name__}: {e}"
+            logger.warning("Startup setup failed, retrying in %.0fs: %s", delay, state['error'], exc_info=True)
+        await asyncio.sleep(delay)
+        delay = _next_delay(delay)
+
+
+async def warm_up() -> int:
+    """預熱活躍使用者的 LATEST 版本，回傳完成的使用者數"""
+    cache_limit = cache.version_cache.max_bytes * _WARMUP_CACHE_FRACTION
+    since = time.strftime("%Y-%m-%d-%H:%M:%S", time.localtime(time.time() - WARMUP_ACTIVE_DAYS * 86400))
+    for username in await catalog.active_users(since, WARMUP_USERS):
+        if cache.version_cache.bytes >= cache_limit:
+            break
+        await cache.get_items_json(username, 'LATEST')
+        await cache.get_packed(username, 'LATEST')
+        state['warmed_users'] += 1
+    return state['warmed_users']
+
+
+async def start_up(setup: Callable[[], Awaitable[None]]):
+    """背景執行的啟動程序；setup 為連線成功後的初始化（索引、目錄重建），需可重複執行"""
+    if not await _set_up(setup):
+        # INDEX_STRICT 時的 COLLSCAN：維持未就緒，不接收流量
+        state['failed'] = True
+        return
+    state['setup'] = True
+    state['error'] = None
+
+    if state['warmup'] == 'pending':
+        state['warmup'] = 'running'
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(warm_up(), WARMUP_TIMEOUT)
+            state['warmup'] = 'done'
+        except asyncio.TimeoutError:
+            state['warmup'] = 'timeout'
+        except Exception:
+            state['warmup'] = 'failed'
+            logger.exception("Warm-up failed")
+        logger.info("Warm-up %s: %d users, %d bytes cached in %.1fs", state['warmup'], state['warmed_users'],
+                    cache.version_cache.bytes, time.perf_counter() - start)
+
+
+def liveness() -> dict:
+    return {'status': 'alive', 'uptime': round(time.time() - state['started_at'], 1)}
+
+
+async def readiness():
+    """回傳 (是否就緒, 狀態內容)；啟動完成後每次檢查都重新 ping 資料庫"""
+    ready = state['setup'] and state['warmup'] not in ('pending', 'running')
+    database_ok = await _ping() if ready else state['database']
+    report = dict(state, database=database_ok)
+    if state['failed']:
+        report['status'] = 'failed'
+    elif not ready:
+        report['status'] = 'starting'
+    else:
+        report['status'] = 'ready' if database_ok else 'unavailable'
+    return report['status'] == 'ready', report
@@ -0,0 +1,228 @@
+"""
+光表版本的 HTTP 快取與壓縮
+版本以 user + update_time 識別且寫入後不會改變，因此：
+- ETag 由版本識別產生，不需讀取內容即可比對 If-None-Match，相符時回傳 304
+- 指定時間的版本可長期快取（immutable）；LATEST 只快取 HTTP_LATEST_MAX_AGE 秒
+- 依 Accept-Encoding 回傳 br / gzip 壓縮內容，每個版本只壓縮一次並保存在 cache.py 的快取中
+- 串流回應（streaming.py）邊輸出邊壓縮，壓縮後的位元組與快取版本不同，因此使用弱 ETag
+- 韌體緩衝區（pico.py）支援 Range，只讀取請求範圍所在的分段
+
+brotli 為選用套件（pip install brotli），未安裝時只提供 gzip
+
+環境變數：
+- HTTP_LATEST_MAX_AGE：LATEST 回應的 Cache-Control max-age 秒數
+"""
+
+import gzip
+import hashlib
+import os
+import zlib
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+import cache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+HTTP_LATEST_MAX_AGE = int(os.getenv('HTTP_LATEST_MAX_AGE', '5'))
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 9
+
+# 內容格式變更時遞增，讓舊的 ETag 失效
+_ETAG_REVISION = 1
+
+
+def version_etag(kind: str, username: str, update_time: str) -> str:
+    digest = hashlib.sha1(f"{_ETAG_REVISION}\0{kind}\0{username}\0{update_time}".encode()).hexdigest()
+    return f'"{digest[:24]}"'
+
+
+def _encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    # 不同的 Content-Encoding 是不同的表示，強 ETag 必須不同
+    return etag if encoding is None else f'{etag[:-1]}-{encoding}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 以弱比對判斷，並忽略壓縮格式的後綴"""
+    if not if_none_match:
+        return False
+    opaque = etag.strip('"')
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        if candidate == opaque or candidate.rsplit('-', 1)[0] == opaque:
+            return True
+    return False
+
+
+def select_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """依 Accept-Encoding 選擇 br 或 gzip，都不接受時回傳 None"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    available = ['br', 'gzip'] if brotli is not None else ['gzip']
+    wildcard = accepted.get('*', 0.0)
+    best = max(available, key=lambda name: accepted.get(name, wildcard))
+    return best if accepted.get(best, wildcard) > 0 else None
+
+
+def compress(content: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(content, quality=BROTLI_QUALITY)
+    return gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _cache_control(query_time: str) -> str:
+    if query_time == "LATEST":
+        return f"public, max-age={HTTP_LATEST_MAX_AGE}"
+    return IMMUTABLE_CACHE_CONTROL
+
+
+async def version_response(request: Request, kind: str, username: str, query_time: str,
+                           update_time: str, load: Callable[[], Awaitable[Optional[bytes]]],
+                           media_type: str, headers: Optional[dict] = None) -> Optional[Response]:
+    """
+    回傳版本內容，處理 If-None-Match 與壓縮
+    update_time 為已解析的版本時間；ETag 相符時直接回傳 304，不呼叫 load 讀取內容
+    kind 為快取種類（items / raw / packed），壓縮結果以相同的鍵保存在版本快取中
+    load 回傳 None（版本已不存在）時回傳 None
+    """
+    etag = version_etag(kind, username, update_time)
+    headers = dict(headers or {})
+    headers['Cache-Control'] = _cache_control(query_time)
+    headers['Vary'] = 'Accept-Encoding'
+    encoding = select_encoding(request.headers.get('accept-encoding'))
+    headers['ETag'] = _encoded_etag(etag, encoding)
+
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+
+    content = await load()
+    if content is None:
+        return None
+
+    if encoding is not None:
+        key = (f'{kind}.{encoding}', username, update_time)
+        encoded = cache.version_cache.get(key)
+        if encoded is None:
+            encoded = await run_in_threadpool(compress, content, encoding)
+            cache.version_cache.put(key, encoded, len(encoded))
+        content = encoded
+        headers['Content-Encoding'] = encoding
+
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+async def _compress_stream(stream: AsyncIterator[bytes], encoding: str) -> AsyncIterator[bytes]:
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        compress_part, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        compress_part, finish = compressor.compress, compressor.flush
+    async for part in stream:
+        compressed = compress_part(part)
+        if compressed:
+            yield compressed
+    yield finish()
+
+
+async def stream_response(request: Request, kind: str, username: str, query_time: str,
+                          update_time: str, open_stream: Callable[[], Awaitable[Optional[AsyncIterator[bytes]]]],
+                          media_type: str) -> Optional[Response]:
+    """
+    以串流方式回傳版本內容，ETag 與 Cache-Control 與 version_response 相同
+    open_stream 回傳 None（版本不存在）時回傳 None
+    """
+    etag = version_etag(kind, username, update_time)
+    headers = {'Cache-Control': _cache_control(query_time), 'Vary': 'Accept-Encoding'}
+    encoding = select_encoding(request.headers.get('accept-encoding'))
+    headers['ETag'] = etag if encoding is None else 'W/' + _encoded_etag(etag, encoding)
+
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+
+    stream = await open_stream()
+    if stream is None:
+        return None
+    if encoding is not None:
+        stream = _compress_stream(stream, encoding)
+        headers['Content-Encoding'] = encoding
+    return StreamingResponse(stream, media_type=media_type, headers=headers)
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[tuple]:
+    """
+    解析單一範圍的 Range 標頭，回傳 [start, end) 或 None（未指定、格式不支援或多個範圍時回傳完整內容）
+    範圍超出內容時拋出 ValueError（416）
+    """
+    if not range_header or not range_header.startswith('bytes=') or ',' in range_header:
+        return None
+    first, _, last = range_header[6:].strip().partition('-')
+    try:
+        if first == '':
+            length = int(last)
+            if length <= 0:
+                raise ValueError(range_header)
+            return max(size - length, 0), size
+        start = int(first)
+        end = size if last == '' else min(int(last) + 1, size)
+    except ValueError:
+        return None
+    if start >= size or end <= start:
+        raise ValueError(range_header)
+    return start, end
+
+
+async def range_response(request: Request, kind: str, username: str, query_time: str, update_time: str,
+                         size: int, read: Callable[[int, int], Awaitable[bytes]],
+                         media_type: str, headers: Optional[dict] = None) -> Response:
+    """
+    回傳可依 Range 讀取部分內容的版本資料（206），ETag 與 Cache-Control 與 version_response 相同
+    read(start, end) 只需讀取位元組 [start, end)；部分內容不壓縮
+    """
+    etag = version_etag(kind, username, update_time)
+    headers = dict(headers or {})
+    headers.update({'Cache-Control': _cache_control(query_time), 'ETag': etag, 'Accept-Ranges': 'bytes'})
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    # If-Range 與目前版本不符時回傳完整內容
+    if_range = request.headers.get('if-range')
+    if if_range is None or etag_matches(if_range, etag):
+        try:
+            byte_range = parse_range(request.headers.get('range'), size)
+        except ValueError:
+            headers['Content-Range'] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+
+    if byte_range is None:
+        return Response(content=await read(0, size), media_type=media_type, headers=headers)
+    start, end = byte_range
+    headers['Content-Range'] = f"bytes {start}-{end - 1}/{size}"
+    return Response(content=await read(start, end), status_code=206, media_type=media_type, headers=headers)
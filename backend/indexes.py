@@ -0,0 +1,113 @@
+"""
+索引管理與查詢計畫檢查
+啟動時建立常用查詢需要的索引，並以 explain 確認熱門查詢沒有退化為全集合掃描（COLLSCAN）
+
+環境變數：
+- INDEX_STRICT：設為 true 時，熱門查詢出現 COLLSCAN 會讓啟動失敗（worker 維持未就緒，見 health.py）；否則只輸出警告
+"""
+
+import logging
+import os
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+from database import (
+    collection_catalog, collection_color, collection_color_chunks, collection_color_patches,
+    collection_music, collection_pico, collection_raw, collection_upload_parts, collection_upload_sessions, user_list
+)
+
+logger = logging.getLogger(__name__)
+
+INDEX_STRICT = os.getenv('INDEX_STRICT', 'false').lower() == 'true'
+
+
+class QueryPlanError(RuntimeError):
+    """INDEX_STRICT 時熱門查詢出現 COLLSCAN；重試也不會改變，啟動程序不再重試"""
+
+
+# (集合, 索引鍵, 額外選項)
+INDEXES = [
+    (collection_color, [('user', ASCENDING), ('update_time', DESCENDING)], {}),
+    (collection_color, [('base_id', ASCENDING)], {'sparse': True}),
+    (collection_raw, [('user', ASCENDING), ('update_time', DESCENDING)], {}),
+    (collection_raw, [('base_id', ASCENDING)], {'sparse': True}),
+    (collection_color_chunks, [('version_id', ASCENDING), ('player', ASCENDING), ('start', ASCENDING)], {}),
+    (collection_color_patches, [('version_id', ASCENDING)], {'unique': True}),
+    (collection_catalog, [('user', ASCENDING), ('update_time', DESCENDING)], {'unique': True}),
+    (collection_upload_sessions, [('expires_at', ASCENDING)], {'expireAfterSeconds': 0}),
+    (collection_upload_parts, [('session_id', ASCENDING), ('player', ASCENDING), ('start', ASCENDING)], {}),
+    (collection_upload_parts, [('session_id', ASCENDING), ('index', ASCENDING)], {}),
+    (collection_upload_parts, [('expires_at', ASCENDING)], {'expireAfterSeconds': 0}),
+    (collection_music, [('user', ASCENDING), ('filename', ASCENDING)], {'unique': True}),
+    (collection_music, [('sha256', ASCENDING)], {}),
+    (collection_pico, [('version_id', ASCENDING), ('config', ASCENDING), ('player', ASCENDING),
+                       ('start_tick', ASCENDING)], {'unique': True}),
+    (user_list, [('username', ASCENDING)], {}),
+]
+
+# 查詢計畫檢查使用的範例值；等值查詢的計畫與實際的值無關
+_SAMPLE_USER = '__index_check__'
+_SAMPLE_TIME = '1970-01-01-00:00:00'
+
+
+def _hot_queries():
+    """回傳 (名稱, 產生 cursor 的函式) 清單，對應 main.py 中的熱門查詢"""
+    return [
+        ("LATEST lookup", lambda: collection_color.find({'user': _SAMPLE_USER})
+            .sort('update_time', DESCENDING).limit(1)),
+        ("version lookup", lambda: collection_color.find({'user': _SAMPLE_USER, 'update_time': _SAMPLE_TIME})),
+        ("raw LATEST lookup", lambda: collection_raw.find({'user': _SAMPLE_USER})
+            .sort('update_time', DESCENDING).limit(1)),
+        ("timelist", lambda: collection_catalog.find({})
+            .sort([('user', ASCENDING), ('update_time', DESCENDING)]).limit(50)),
+        ("timelist by user", lambda: collection_catalog.find({'user': _SAMPLE_USER})
+            .sort([('user', ASCENDING), ('update_time', DESCENDING)]).limit(50)),
+        ("chunk read", lambda: collection_color_chunks.find({'version_id': ObjectId(), 'player': 0})
+            .sort([('player', ASCENDING), ('start', ASCENDING)])),
+        ("pico read", lambda: collection_pico.find({'version_id': ObjectId(), 'config': '', 'player': 0,
+                                                     'start_tick': {'$gte': 0, '$lte': 0}})
+            .sort('start_tick', ASCENDING)),
+        ("music list", lambda: collection_music.find({})
+            .sort([('user', ASCENDING), ('filename', ASCENDING)]).limit(50)),
+        ("music list by user", lambda: collection_music.find({'user': _SAMPLE_USER})
+            .sort([('user', ASCENDING), ('filename', ASCENDING)]).limit(50)),
+        ("login", lambda: user_list.find({'username': _SAMPLE_USER}).limit(1)),
+    ]
+
+
+def _plan_stages(plan):
+    """遞迴列出查詢計畫中所有的 stage"""
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _plan_stages(value)
+
+
+async def ensure_indexes():
+    """建立所有索引；索引已存在時 MongoDB 不會重複建立"""
+    for collection, keys, options in INDEXES:
+        name = await collection.create_index(keys, **options)
+        logger.debug("Index ready: %s.%s", collection.name, name)
+
+
+async def check_query_plans(strict: bool = INDEX_STRICT):
+    """
+    檢查熱門查詢的查詢計畫，回傳出現 COLLSCAN 的查詢名稱
+    strict 時若有任何 COLLSCAN 則拋出 QueryPlanError
+    """
+    collscans = []
+    for name, make_cursor in _hot_queries():
+        explain = await make_cursor().explain()
+        winning_plan = explain.get('queryPlanner', {}).get('winningPlan', {})
+        if 'COLLSCAN' in set(_plan_stages(winning_plan)):
+            collscans.append(name)
+            logger.warning("query plan for '%s' falls back to COLLSCAN", name)
+
+    if collscans and strict:
+        raise QueryPlanError(f"COLLSCAN in hot queries: {', '.join(collscans)}")
+    return collscans
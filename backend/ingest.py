@@ -0,0 +1,57 @@
+"""
+光表上傳的快速解析
+/upload_items 的 players 以整欄方式驗證，不為每個影格建立 PlayerData 物件
+
+驗證方式：
+- 每位玩家逐欄位取出數值（缺少欄位或影格不是物件時會在此失敗）
+- 欄位型別只允許 int / bool（與 PlayerData 的轉換結果相同）
+- 以 array('I') 一次轉為 uint32 陣列，超出範圍時失敗
+
+任一步驟失敗時，該玩家改走原本的 PlayerData 逐影格驗證，
+因此可接受與拒絕的輸入和 Data / Player / PlayerData 模型完全一致
+"""
+
+from array import array
+from typing import Dict, List, Union
+
+from models import PlayerData
+from packing import FRAME_FIELDS
+
+# 快速路徑可接受的型別；其餘型別（字串、浮點數等）交由 PlayerData 轉換或拒絕
+_FAST_TYPES = {int, bool}
+
+# 每位玩家的解析結果：欄位 -> uint32 陣列，或 PlayerData 驗證後的影格清單
+ParsedPlayer = Union[Dict[str, array], List[dict]]
+
+
+def _parse_player_columns(sublist) -> Dict[str, array]:
+    """以整欄方式驗證單一玩家，失敗時拋出例外"""
+    if type(sublist) is not list:
+        raise TypeError("player data must be a list")
+    columns = {}
+    for field in FRAME_FIELDS:
+        values = [item[field] for item in sublist]
+        if not set(map(type, values)) <= _FAST_TYPES:
+            raise TypeError(f"non-integer values in '{field}'")
+        columns[field] = array('I', values)
+    return columns
+
+
+def _parse_player_frames(sublist) -> List[dict]:
+    """原本的逐影格驗證"""
+    return [PlayerData(**item).model_dump() for item in sublist]
+
+
+def parse_player(sublist) -> ParsedPlayer:
+    try:
+        return _parse_player_columns(sublist)
+    except (KeyError, TypeError, OverflowError):
+        return _parse_player_frames(sublist)
+
+
+def parse_players(players) -> List[ParsedPlayer]:
+    """
+    解析上傳的 players
+    驗證失敗時拋出與 PlayerData 相同的 ValidationError / TypeError
+    """
+    return [parse_player(sublist) for sublist in players]
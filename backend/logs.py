@@ -0,0 +1,61 @@
+"""
+日誌設定
+所有模組以 logging.getLogger(__name__) 取得 logger，不再直接 print；
+額外欄位以 extra={...} 傳入，文字格式附加為 key=value，JSON 格式輸出為同一層的欄位，方便日誌系統解析
+
+環境變數：
+- LOG_LEVEL：最低輸出等級（DEBUG、INFO、WARNING、ERROR）
+- LOG_FORMAT：text 或 json
+"""
+
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+
+# LogRecord 本身的屬性，其餘屬性皆為 extra 傳入的欄位
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+def _extra_fields(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            message += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        return message
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure():
+    """設定根 logger；已有 handler 時（例如由 uvicorn --log-config 設定）只調整等級"""
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    if not root.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter())
+        root.addHandler(handler)
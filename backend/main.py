@@ -1,59 +1,127 @@
 from typing import Union
-from pymongo import MongoClient
-from fastapi import Request, FastAPI, HTTPException, Depends, Path, status, Form, APIRouter
+from contextlib import asynccontextmanager
+from fastapi import Request, FastAPI, HTTPException, Depends, status, APIRouter, WebSocket
 from fastapi import File, UploadFile
 # 從 models.py 匯入所有資料模型
-from models import PlayerData, Player, Data, RAW, Item, User, UserInDB
+from models import Data, RAW, ColorPatch, RawPatch, VersionPin, UploadSession, RawUploadPart, PlaybackControl, User, UserInDB, UserUpdate
+# 非同步資料庫存取層（連線池設定見 database.py）
+import database
+import storage
+import packing
+import ingest
+import delta
+import retention
+import indexes
+import catalog
+import cache
+import http_cache
+import streaming
+import uploads
+import music_store
+import waveform
+import music_catalog
+import generator
+import pico
+import timeline
+import diff
+import playback
+import auth
+import health
+import logs
+import metrics
+from database import collection_color, collection_raw, collection_music
 # typing.List 已在 models.py 中使用
 # from app import app
 # from flask import Flask, send_file, render_template
+import hmac
 import json
+import logging
 import os
-import shutil
+import asyncio
 import random
 from dotenv import load_dotenv
 
-from bson import ObjectId
+from pydantic import ValidationError
 from time import strftime, localtime
 
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm #
-from fastapi.responses import FileResponse
-from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+logs.configure()
+logger = logging.getLogger(__name__)
+
+# 增量版本定期整併間隔（秒），0 表示停用
+DELTA_COMPACT_INTERVAL = int(os.getenv('DELTA_COMPACT_INTERVAL', '300'))
+
+async def compact_deltas_periodically():
+    while True:
+        await asyncio.sleep(DELTA_COMPACT_INTERVAL)
+        try:
+            color_count, raw_count = await storage.compact_deltas()
+            if color_count or raw_count:
+                logger.info("Compacted %d color / %d raw delta versions", color_count, raw_count)
+        except Exception:
+            logger.exception("Delta compaction failed")
+
+async def run_retention_periodically():
+    while True:
+        await asyncio.sleep(retention.RETENTION_INTERVAL)
+        try:
+            report = await retention.run_retention()
+            if report['versions_deleted']:
+                logger.info("Retention removed %d versions, freed %d bytes",
+                            report['versions_deleted'], report['bytes_freed'])
+        except Exception:
+            logger.exception("Retention failed")
+
+async def set_up_database():
+    # 建立索引並檢查熱門查詢的查詢計畫（INDEX_STRICT 時出現 COLLSCAN 會停在未就緒）
+    await indexes.ensure_indexes()
+    await indexes.check_query_plans()
+    # 首次部署時由既有版本建立目錄
+    if (await database.collection_catalog.estimated_document_count() == 0
+            and await collection_color.estimated_document_count() > 0):
+        logger.info("Rebuilt version catalog: %d versions", await catalog.rebuild())
+    # 首次部署時掃描既有的音樂檔案建立音樂目錄
+    if await collection_music.estimated_document_count() == 0:
+        logger.info("Rebuilt music catalog: %d files", await music_catalog.rebuild(MUSIC_FILE_PATH))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 在日誌設定完成後決定登入令牌的簽章金鑰（未設定 AUTH_SECRET 時輸出警告）
+    auth.secret()
+    # 啟動時不等待資料庫：連線、初始化與預熱在背景進行，完成前 /api/health/ready 回傳 503（見 health.py）
+    tasks = [asyncio.create_task(health.start_up(set_up_database))]
+    if DELTA_COMPACT_INTERVAL > 0:
+        tasks.append(asyncio.create_task(compact_deltas_periodically()))
+    if retention.RETENTION_INTERVAL > 0:
+        tasks.append(asyncio.create_task(run_retention_periodically()))
+    tasks.append(asyncio.create_task(waveform.run_worker(music_catalog.set_duration)))
+    yield
+    playback.stop_all()
+    for task in tasks:
+        task.cancel()
+    await database.close()
 
 app = FastAPI(
     title="LightDance API",
     description="API for LightDance project",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # 建立 API 路由器，統一管理所有 /api 路由
-api_router = APIRouter(prefix="/api")
+# 路由函式的執行時間計入 /api/metrics（見 metrics.py）
+api_router = APIRouter(prefix="/api", route_class=metrics.TimedRoute)
 
 load_dotenv()
-uri = os.getenv('MONGO_CONNECT_URI')
 
 # 音樂文件路徑配置
 # Docker容器內使用 /music，本地開發使用 ./music_file
 MUSIC_FILE_PATH = os.getenv('MUSIC_FILE_PATH', '/music')
-print(f"Music file path: {MUSIC_FILE_PATH}")
-
-client = MongoClient(uri)
-
-try:
-    client.admin.command('ping')
-    print("Pinged your deployment. You successfully connected to MongoDB!")
-except Exception as e:
-    print(e)
-
-SIZE = 256 # number of LED per board
-
-db = client['test']
-collection_color = db['color']
-collection_raw = db['raw_json']
-collection_pico = db['pico']
-collection_music = db['music']
-user_list = db['users']
+logger.info("Music file path: %s", MUSIC_FILE_PATH)
 
 origins = [
     "http://localhost",
@@ -72,23 +140,22 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 最後加入的 middleware 在最外層，量測的延遲與位元組數包含其他 middleware
+app.add_middleware(metrics.MetricsMiddleware)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/token") 
 
-# 資料模型已移至 models.py 檔案
+# 可使用管理端點的使用者（以逗號分隔）
+ADMIN_USERS = {name.strip() for name in os.getenv('ADMIN_USERS', '').split(',') if name.strip()}
 
-def get_user(list, username: str):
-    user_now = list.find_one({"username": username})
-    if user_now:
-        user_dict = user_now
-        return User(**user_dict)
+# 資料模型已移至 models.py 檔案
 
-def decode_token(token):
-    user = get_user(user_list, token)
-    return user
+async def decode_token(token):
+    # 令牌以簽章驗證，使用者資料由 auth.py 快取，驗證通常不需查詢資料庫
+    return await auth.authenticate(token)
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
-    user = decode_token(token)
+    user = await decode_token(token)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -102,23 +169,29 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
+async def get_current_admin_user(current_user: User = Depends(get_current_active_user)):
+    if current_user.username not in ADMIN_USERS:
+        raise HTTPException(status_code=403, detail="Admin privileges required")
+    return current_user
+
 # ============================================================================
 # 使用者資源 (User Resource) - 身份驗證與個人資訊管理
 # ============================================================================
 
-# 使用者登入驗證，返回存取令牌
+# 使用者登入驗證，返回存取令牌（簽章的 JWT，有效時間為 expires_in 秒，格式見 auth.py）
 # 使用方法：POST /api/token，Body: username & password (form-data)
 # 使用場景：前端登入、API 權限獲取
 @api_router.post("/token")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user_dict = user_list.find_one({"username": form_data.username})
+    user_dict = await database.find_user(form_data.username)
     if not user_dict:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
     user = UserInDB(**user_dict)
-    if not form_data.password == user.password:
+    if not hmac.compare_digest(form_data.password.encode(), user.password.encode()):
         raise HTTPException(status_code=400, detail="Incorrect username or password")
+    auth.remember_user(user)
 
-    return {"access_token": user.username, "token_type": "bearer"}
+    return {"access_token": auth.issue_token(user), "token_type": "bearer", "expires_in": auth.AUTH_TOKEN_TTL}
 
 # 取得當前登入使用者的基本資訊
 # 使用方法：GET /api/users/me，需要 Bearer Token
@@ -127,6 +200,20 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
 async def read_users_me(current_user: User = Depends(get_current_active_user)):
     return current_user
 
+# 停用、啟用使用者或重設密碼，立即清除此 worker 的使用者快取
+# 使用方法：POST /api/admin/users/{username}，Body 為 {"disabled": true | false, "password": "..."}（皆可省略），需要管理者的 Bearer Token
+# 使用場景：停用外流的帳號；修改密碼會讓該使用者的令牌全部失效，其他 worker 在 AUTH_USER_CACHE_TTL 秒內生效
+@api_router.post("/admin/users/{username}")
+async def update_user(username: str, update: UserUpdate, current_user: User = Depends(get_current_admin_user)):
+    fields = update.model_dump(exclude_none=True)
+    if not fields:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    if not await database.update_user(username, fields):
+        raise HTTPException(status_code=404, detail=f"user not found: '{username}'")
+    auth.invalidate_user(username)
+    user = await auth.get_user(username)
+    return User(username=user.username, disabled=user.disabled)
+
 # ============================================================================
 # 系統基礎功能 (System Utilities) - 系統狀態檢查與基礎服務
 # ============================================================================
@@ -136,65 +223,74 @@ async def read_users_me(current_user: User = Depends(get_current_active_user)):
 # 使用場景：系統狀態監控、服務可用性檢查
 @api_router.get("/")
 async def read_root():
-	print("Success!! OuOb")
+	logger.debug("Success!! OuOb")
 	return {"Hello": "World"}
 
+# 存活檢查：行程與 event loop 仍在回應即回傳 200，不檢查資料庫
+# 使用方法：GET /api/health/live，無需驗證
+# 使用場景：容器的 liveness probe，失敗時重新啟動容器
+@api_router.get("/health/live")
+async def read_liveness ():
+    return health.liveness()
+
+# 就緒檢查：啟動程序（連線、索引、預熱）已完成且資料庫可連線時回傳 200，否則回傳 503 與目前狀態
+# 使用方法：GET /api/health/ready，無需驗證
+# 使用場景：容器的 readiness probe、負載平衡器的健康檢查，部署或擴充時新 worker 預熱完成才接收流量
+@api_router.get("/health/ready")
+async def read_readiness ():
+    ready, report = await health.readiness()
+    return JSONResponse(report, status_code=200 if ready else 503)
+
 # ============================================================================
 # 光表項目資源 (Light Item Resource) - 光表資料的查詢與管理
 # ============================================================================
 
-# 取得所有使用者的光表資料時間清單
-# 使用方法：GET /api/timelist/，無需驗證
+async def read_catalog_page(username: Union[str, None], limit: Union[int, None], cursor: Union[str, None]):
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    try:
+        entries, next_cursor = await catalog.list_versions(username, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"list": entries, "next_cursor": next_cursor}
+
+# 取得所有使用者的光表資料時間清單（依使用者、更新時間由新到舊排序）
+# 使用方法：GET /api/timelist/?limit={limit}&cursor={next_cursor}，無需驗證，不指定 limit 時回傳全部
 # 使用場景：前端載入選單、顯示可用的光表資料列表
 @api_router.get("/timelist/")
-async def front_read_time():
-    # Only include user and update_time fields
-    all_entries = list(collection_color.find({}, {"user": 1, "update_time": 1}))
-
-    for entry in all_entries:
-        entry["_id"] = str(entry["_id"])
-    
-    # Sort the entries by username and update times
-    sorted_entries_pre = sorted(all_entries, key=lambda x: x['update_time'] , reverse=True)
-    sorted_entries = sorted(sorted_entries_pre, key=lambda x: x['user'] )
-    final_response = [{"user": entry["user"], "update_time": entry["update_time"]} for entry in sorted_entries]
-
-    return {"list": final_response}
+async def front_read_time(limit: Union[int, None] = None, cursor: Union[str, None] = None):
+    return await read_catalog_page(None, limit, cursor)
 
 # 取得特定使用者的光表資料時間清單
-# 使用方法：GET /api/timelist/{username}，無需驗證
+# 使用方法：GET /api/timelist/{username}?limit={limit}&cursor={next_cursor}，無需驗證
 # 使用場景：查看特定使用者的所有光表資料版本
 @api_router.get("/timelist/{username}")
-async def front_read_time(username: str):
-	# Only include user and update_time fields
-	all_entries = list(collection_color.find({"user": username}, {"user": 1, "update_time": 1}))
-
-	for entry in all_entries:
-		entry["_id"] = str(entry["_id"])
-	
-	# Sort the entries by username and update time
-	sorted_entries = sorted(all_entries, key=lambda x: (x['user'] != username, x['update_time']), reverse=True)
-
-	final_response = [{"user": entry["user"], "update_time": entry["update_time"]} for entry in sorted_entries]
-
-	return {"list": final_response}
+async def front_read_time(username: str, limit: Union[int, None] = None, cursor: Union[str, None] = None):
+    return await read_catalog_page(username, limit, cursor)
 
 # 取得特定使用者在特定時間的完整光表資料
 # 使用方法：GET /api/items/{username}/{query_time}，無需驗證
 # 使用場景：載入指定版本的光表資料進行編輯或播放
+# 支援 If-None-Match（304）與 gzip / br 壓縮，指定時間的版本可由瀏覽器長期快取（見 http_cache.py）
+# 加上 ?stream=true 時直接由資料庫逐段輸出（見 streaming.py），適合下載整場演出等大型版本
 @api_router.get("/items/{username}/{query_time}")
-async def get_user_color (username: str, query_time: str):
-    if query_time == "LATEST":
-        user_data = collection_color.find_one(
-            {"user": username}, 
-            sort=[("update_time", -1)]  # Sort by update_time in descending order to get the latest entry
+async def get_user_color (request: Request, username: str, query_time: str, stream: bool = False):
+    update_time = await cache.resolve_query_time('color', username, query_time)
+    response = None
+    if update_time is not None and stream:
+        response = await http_cache.stream_response(
+            request, 'items', username, query_time, update_time,
+            lambda: streaming.iter_color_version(username, update_time), "application/json"
+        )
+    elif update_time is not None:
+        # 版本內容寫入後不會改變，序列化後的 JSON 保存在記憶體快取中（見 cache.py）
+        response = await http_cache.version_response(
+            request, 'items', username, query_time, update_time,
+            lambda: cache.get_items_json(username, update_time), "application/json"
         )
-    else:
-        user_data = collection_color.find_one({"user": username, "update_time": query_time})
 
-    if user_data:
-        user_json = jsonable_encoder(user_data, custom_encoder={ObjectId: str})
-        return user_json
+    if response is not None:
+        return response
     else:
         return {"message": f"user not found: '{username}'"}
 
@@ -204,31 +300,217 @@ async def get_user_color (username: str, query_time: str):
 @api_router.get("/items/{username}/{query_time}/player={player}/chunk={chunk}")
 async def get_user_color_by_chunk (username: str, query_time: str, chunk: int, player: int):
     CHUNK_SIZE = 10
-    
-    if query_time == "LATEST":
-        user_data = collection_color.find_one(
-            {"user": username}, 
-            sort=[("update_time", -1)]  # Sort by update_time in descending order to get the latest entry
-        )
-    else:
-        user_data = collection_color.find_one({"user": username, "update_time": query_time})
 
-    if not user_data:
+    # 由快取的欄式壓縮內容只解出該玩家的這一段影格
+    result = await cache.get_player_frames(
+        username, query_time, player,
+        start=chunk * CHUNK_SIZE, count=CHUNK_SIZE
+    )
+
+    if result is None:
         return {"message": f"user not found: '{username}'"}
 
-    user_json = jsonable_encoder(user_data, custom_encoder={ObjectId: str})
+    player_count, chunk_data = result
 
-    if "players" not in user_json or player >= len(user_json["players"]):
+    if player >= player_count:
         return {"message": f"Invalid player index: {player}"}
 
-    player_data = user_json["players"][player]
+    return {"player_data": chunk_data}
 
-    start_idx = chunk * CHUNK_SIZE
-    end_idx = start_idx + CHUNK_SIZE    
+# ============================================================================
+# 顏色查詢資源 (Color Query Resource) - 指定時間所有部位的顏色
+# ============================================================================
 
-    chunk_data = player_data[start_idx:end_idx]
+# 查詢所有玩家、所有部位在某個時間點（或一段時間內每隔 dt 毫秒）的顏色，時間單位為毫秒
+# 使用方法：GET /api/colors/{username}/{query_time}?t={ms} 或 ?t0={ms}&t1={ms}&dt={ms}，可加上 player={player}、format=packed，無需驗證
+# 使用場景：3D 預覽、拖曳時間軸、硬體同步，不需下載整個版本（計算方式見 timeline.py）
+# JSON 的 colors[玩家][時間點][部位] 為 0xRRGGBBAA 整數；packed 為依相同順序排列的 RGBA 位元組
+@api_router.get("/colors/{username}/{query_time}")
+async def get_colors_at (username: str, query_time: str, t: Union[int, None] = None,
+                         t0: Union[int, None] = None, t1: Union[int, None] = None, dt: Union[int, None] = None,
+                         player: Union[int, None] = None, format: str = "json"):
+    if format not in ("json", "packed"):
+        raise HTTPException(status_code=400, detail="format must be json or packed")
+    try:
+        times = timeline.sample_times(t, t0, t1, dt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    update_time = await cache.resolve_query_time('color', username, query_time)
+    index = None
+    if update_time is not None:
+        try:
+            index = await timeline.get_index(username, update_time)
+        except OverflowError:
+            raise HTTPException(status_code=422, detail="color values out of uint32 range")
+    if index is None:
+        raise HTTPException(status_code=404, detail=f"user not found: '{username}'")
+
+    players = None
+    if player is not None:
+        if not 0 <= player < len(index):
+            raise HTTPException(status_code=404, detail=f"Invalid player index: {player}")
+        players = [player]
+    try:
+        colors = await run_in_threadpool(timeline.query, index, times, players)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers = {"X-Update-Time": update_time}
+    if format == "packed":
+        headers.update({
+            "X-Players": str(colors.shape[0]),
+            "X-Times": str(colors.shape[1]),
+            "X-Parts": ",".join(timeline.COLOR_PARTS),
+        })
+        return Response(content=colors.tobytes(), media_type="application/octet-stream", headers=headers)
+    return JSONResponse({
+        "update_time": update_time,
+        "parts": list(timeline.COLOR_PARTS),
+        "times": times.tolist(),
+        "colors": timeline.to_uint32(colors).tolist(),
+    }, headers=headers)
 
-    return {"player_data": chunk_data}
+# ============================================================================
+# 版本比對資源 (Diff Resource) - 兩個版本之間顏色改變的範圍
+# ============================================================================
+
+# 比對同一位使用者的兩個光表版本，回傳每位玩家、每個部位顏色不同的時間範圍（毫秒）
+# 使用方法：GET /api/diff/{username}/{from_time}/{to_time}，時間可為 LATEST，可加上 player={player}，無需驗證
+# 使用場景：檢視兩次儲存之間修改了哪些部分，不需下載兩個完整版本（計算方式見 diff.py）
+# changes 的每一列依 fields 排列：[玩家, parts 中的部位索引, 起點, 終點（null 為持續到最後）, 舊值, 新值]
+@api_router.get("/diff/{username}/{from_time}/{to_time}")
+async def get_version_diff (username: str, from_time: str, to_time: str, player: Union[int, None] = None):
+    old_time = await cache.resolve_query_time('color', username, from_time)
+    new_time = await cache.resolve_query_time('color', username, to_time)
+    content = None
+    if old_time is not None and new_time is not None:
+        try:
+            content = await diff.get_diff(username, old_time, new_time, player)
+        except IndexError:
+            raise HTTPException(status_code=404, detail=f"Invalid player index: {player}")
+        except OverflowError:
+            raise HTTPException(status_code=422, detail="color values out of uint32 range")
+    if content is None:
+        raise HTTPException(status_code=404, detail=f"version not found: '{username}'")
+    return Response(content=content, media_type="application/json",
+                    headers={"X-From-Update-Time": old_time, "X-To-Update-Time": new_time})
+
+# ============================================================================
+# 播放同步資源 (Playback Resource) - 以 WebSocket 推送共用時鐘的播放畫面
+# ============================================================================
+
+# 訂閱使用者的播放畫面（訊息格式見 playback.py）
+# 使用方法：WebSocket /api/playback/{username}/ws，板子加上 ?player={player} 只接收自己的部位，無需驗證
+# 使用場景：預覽畫面與板子依伺服器的時鐘同步播放；送出 {"type": "sync", "client_time": ...} 可校正時間差
+@api_router.websocket("/playback/{username}/ws")
+async def playback_socket (websocket: WebSocket, username: str, player: Union[int, None] = None):
+    await websocket.accept()
+    session = playback.get_session(username)
+    subscriber = playback.Subscriber(websocket, player)
+    session.subscribe(subscriber)
+    sender = asyncio.create_task(subscriber.send_loop())
+    try:
+        while True:
+            received = await websocket.receive()
+            if received['type'] == 'websocket.disconnect':
+                break
+            # 只處理文字訊息，二進位訊息與格式錯誤的內容直接忽略
+            if received.get('text') is None:
+                continue
+            try:
+                message = json.loads(received['text'])
+            except ValueError:
+                continue
+            if isinstance(message, dict) and message.get('type') == 'sync':
+                subscriber.offer(session.sync(message.get('client_time')))
+    finally:
+        sender.cancel()
+        session.unsubscribe(subscriber)
+        playback.release_session(session)
+
+# 查看使用者目前的播放狀態
+# 使用方法：GET /api/playback/{username}，無需驗證
+# 使用場景：頁面載入時顯示播放位置與載入的版本
+@api_router.get("/playback/{username}")
+async def get_playback_state (username: str):
+    session = playback.get_session(username)
+    state = session.state()
+    playback.release_session(session)
+    return state
+
+# 控制使用者的播放：載入版本、播放、暫停、跳轉，結果推送給所有訂閱者
+# 使用方法：POST /api/playback/{username}，Body 為 {"action": "load" | "play" | "pause" | "seek", "query_time", "position_ms"}，需要本人或管理者的 Bearer Token
+# 使用場景：排練時由編輯畫面控制所有預覽畫面與板子
+@api_router.post("/playback/{username}")
+async def control_playback (username: str, control: PlaybackControl,
+                            current_user: User = Depends(get_current_active_user)):
+    if current_user.username != username and current_user.username not in ADMIN_USERS:
+        raise HTTPException(status_code=403, detail="Not allowed to control this playback")
+    session = playback.get_session(username)
+    try:
+        if control.action == "load":
+            if not await session.load(control.query_time or "LATEST"):
+                raise HTTPException(status_code=404, detail=f"user not found: '{username}'")
+        elif control.action == "play":
+            session.play(control.position_ms)
+        elif control.action == "pause":
+            session.pause()
+        elif control.action == "seek":
+            if control.position_ms is None:
+                raise HTTPException(status_code=400, detail="position_ms is required for seek")
+            session.seek(control.position_ms)
+        else:
+            raise HTTPException(status_code=400, detail=f"unknown action: {control.action}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OverflowError:
+        raise HTTPException(status_code=422, detail="color values out of uint32 range")
+    finally:
+        playback.release_session(session)
+    return session.state()
+
+# ============================================================================
+# 韌體資源 (Pico Resource) - 編譯後的 LED 影格緩衝區
+# ============================================================================
+
+async def find_pico_compiled(username: str, query_time: str, player: int):
+    update_time = await cache.resolve_query_time('color', username, query_time)
+    compiled = None
+    if update_time is not None:
+        try:
+            compiled = await pico.find_compiled(username, update_time, player)
+        except OverflowError:
+            raise HTTPException(status_code=422, detail="color values out of uint32 range")
+    if compiled is None:
+        raise HTTPException(status_code=404, detail=f"version or player not found: '{username}' player {player}")
+    return update_time, compiled
+
+# 取得特定玩家板子的 LED 影格緩衝區（每個 tick 為 PICO_LED_COUNT 顆 LED 的 RGBA，格式見 pico.py）
+# 使用方法：GET /api/pico/{username}/{query_time}/{player}，可加上 Range: bytes={start}-{end} 只取部分 tick，無需驗證
+# 使用場景：板子直接下載可播放的位元組，第一次請求時編譯並保存在 collection_pico
+@api_router.get("/pico/{username}/{query_time}/{player}")
+async def get_pico_frames (request: Request, username: str, query_time: str, player: int):
+    update_time, compiled = await find_pico_compiled(username, query_time, player)
+    info = pico.describe(compiled)
+    return await http_cache.range_response(
+        request, f"pico.{pico.CONFIG}.{player}", username, query_time, update_time, info['size'],
+        lambda start, end: pico.read_bytes(compiled, start, end), pico.MEDIA_TYPE,
+        headers={
+            "X-Update-Time": update_time,
+            "X-Tick-Ms": str(info['tick_ms']),
+            "X-Led-Count": str(info['led_count']),
+            "X-Tick-Count": str(info['tick_count']),
+        }
+    )
+
+# 取得 LED 影格緩衝區的格式資訊（tick 長度、LED 數、總 tick 數、部位對應表）
+# 使用方法：GET /api/pico/{username}/{query_time}/{player}/info，無需驗證
+# 使用場景：板子或測試工具計算 Range 的位移
+@api_router.get("/pico/{username}/{query_time}/{player}/info")
+async def get_pico_info (username: str, query_time: str, player: int):
+    update_time, compiled = await find_pico_compiled(username, query_time, player)
+    return dict(pico.describe(compiled), update_time=update_time)
 
 # ============================================================================
 # 原始資料資源 (Raw Data Resource) - 原始 JSON 格式資料的存取
@@ -238,32 +520,56 @@ async def get_user_color_by_chunk (username: str, query_time: str, chunk: int, p
 # 使用方法：GET /api/raw/{username}/{query_time}，無需驗證
 # 使用場景：載入原始編輯資料、資料備份與還原
 @api_router.get("/raw/{username}/{query_time}")
-async def get_user_color (username: str, query_time: str):
-    if query_time == "LATEST":
-        user_data = collection_color.find_one(
-            {"user": username}, 
-            sort=[("update_time", -1)]  # Sort by update_time in descending order to get the latest entry
+async def get_user_color (request: Request, username: str, query_time: str):
+    update_time = await cache.resolve_query_time('raw', username, query_time)
+    response = None
+    if update_time is not None:
+        response = await http_cache.version_response(
+            request, 'raw', username, query_time, update_time,
+            lambda: cache.get_raw_json(username, update_time), "application/json"
         )
-    else:
-        user_data = collection_raw.find_one({"user": username, "update_time": query_time})
 
-    if user_data:
-        user_json = jsonable_encoder(user_data, custom_encoder={ObjectId: str})
-        return user_json
+    if response is not None:
+        return response
     else:
         return {"message": f"user not found: '{username}'"}
 
+# 取得特定使用者在特定時間的光表資料（二進位欄式壓縮格式）
+# 使用方法：GET /api/items/{username}/{query_time}/packed，無需驗證
+# 使用場景：前端與韌體載入大型光表，格式說明見 packing.py
+@api_router.get("/items/{username}/{query_time}/packed")
+async def get_user_color_packed (request: Request, username: str, query_time: str):
+    async def load():
+        result = await cache.get_packed(username, update_time)
+        return result[1] if result else None
+
+    update_time = await cache.resolve_query_time('color', username, query_time)
+    response = None
+    if update_time is not None:
+        try:
+            response = await http_cache.version_response(
+                request, 'packed', username, query_time, update_time, load,
+                packing.PACKED_MEDIA_TYPE, headers={"X-Update-Time": update_time}
+            )
+        except OverflowError:
+            raise HTTPException(status_code=422, detail="color values out of uint32 range")
+
+    if response is None:
+        raise HTTPException(status_code=404, detail=f"user not found: '{username}'")
+    return response
+
 # 取得特定玩家的光表資料
 # 使用方法：GET /api/items/{username}/{query_time}/{player_ID}，無需驗證
 # 使用場景：編輯單一玩家光表效果時使用
 @api_router.get("/items/{username}/{query_time}/{player_ID}")
 async def get_certain_player_color (username: str, query_time: str, player_ID: int):
-    user_data = collection_color.find_one({"user": username, "update_time": query_time})
+    result = await cache.get_player_frames(username, query_time, player_ID)
 	
-    if user_data:
-        if player_ID < len(user_data['players']):
+    if result:
+        player_count, color_data = result
+        if player_ID < player_count:
             return {
-                'color_data': user_data['players'][player_ID]
+                'color_data': color_data
             }
         else:
             return {"message": "no such player"}
@@ -281,24 +587,18 @@ async def upload_user_color (request: Request, current_user: User = Depends(get_
 
 	user_data = Data(
 		user = current_user.username,
-		last_updated_time = current_time,
-		players = [Player(data=[PlayerData(**item) for item in sublist]) for sublist in b['players']]
+		last_updated_time = current_time
 	)
-
-	existing_entries = collection_color.find({"user": user_data.user}).sort("update_time", 1)  # Sort by update time
-	existing_count = collection_color.count_documents({"user": user_data.user})
-
-	if existing_count >= 5:
-		oldest_entry = existing_entries[0]
-	#	collection_color.delete_one({"_id": oldest_entry["_id"]})
-
-	document = {
-		'user': user_data.user,
-		'update_time': user_data.last_updated_time,
-		'players': [[player_data.dict() for player_data in player.data] for player in user_data.players]
-	}
-
-	collection_color.insert_one(document)
+	# 以整欄方式驗證 players（見 ingest.py），不逐影格建立 PlayerData
+	players = await run_in_threadpool(ingest.parse_players, b['players'])
+
+	# 以表頭 + 分塊文件儲存（見 storage.py）
+	await storage.save_color_version(
+		user_data.user,
+		user_data.last_updated_time,
+		players
+	)
+	cache.invalidate_latest(user_data.user)
 
 	return {
 		'message': 'upload success d(OvO)y'
@@ -319,25 +619,203 @@ async def upload_raw_data (request: Request, current_user: User = Depends(get_cu
 		raw_data = b['raw_data']
 	)
 
-	existing_entries = collection_color.find({"user": user_data.user}).sort("update_time", 1)  # Sort by update time
-	existing_count = collection_color.count_documents({"user": user_data.user})
-
-	if existing_count >= 5:
-		oldest_entry = existing_entries[0]
-	#	collection_color.delete_one({"_id": oldest_entry["_id"]})
-
 	document = {
 		'user': user_data.user,
 		'update_time': user_data.last_updated_time,
 		'raw_data': user_data.raw_data
 	}
     
-	collection_raw.insert_one(document)
+	await database.insert_version(collection_raw, document)
+	cache.invalidate_latest(user_data.user)
 
 	return {
 		'message': 'raw data upload success d(OuO)y'
 	}
 
+# 上傳光表資料的增量修改（只傳送與基準版本不同的區段）
+# 使用方法：POST /api/upload_items_patch，需要 Bearer Token，Body 格式見 models.ColorPatch
+# 使用場景：編輯時只修改少數色塊，減少上傳量與儲存空間
+@api_router.post("/upload_items_patch")
+async def upload_user_color_patch (patch: ColorPatch, current_user: User = Depends(get_current_active_user)):
+    current_time = strftime("%Y-%m-%d-%H:%M:%S", localtime())
+
+    base = await storage.find_color_header(current_user.username, patch.base_time)
+    if base is None:
+        raise HTTPException(status_code=404, detail=f"base version not found: '{patch.base_time}'")
+
+    ops = []
+    for index, op in enumerate(patch.ops):
+        try:
+            frames = await run_in_threadpool(ingest.parse_player, op.frames)
+        except (ValidationError, TypeError) as e:
+            raise HTTPException(status_code=400, detail=f"invalid frames in op {index} (player {op.player}): {e}")
+        ops.append({'player': op.player, 'start': op.start, 'end': op.end, 'frames': frames})
+    try:
+        await storage.save_color_patch(current_user.username, current_time, base, patch.player_count, ops)
+    except delta.PatchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cache.invalidate_latest(current_user.username)
+
+    return {
+        'message': 'upload success d(OvO)y',
+        'update_time': current_time,
+        'base_time': base['update_time']
+    }
+
+# 上傳原始光表資料的增量修改
+# 使用方法：POST /api/upload_raw_patch，需要 Bearer Token，Body 格式見 models.RawPatch
+# 使用場景：儲存編輯中的光表資料時只傳送變更的字串區段
+@api_router.post("/upload_raw_patch")
+async def upload_raw_data_patch (patch: RawPatch, current_user: User = Depends(get_current_active_user)):
+    current_time = strftime("%Y-%m-%d-%H:%M:%S", localtime())
+
+    base = await database.find_version(collection_raw, current_user.username, patch.base_time)
+    if base is None:
+        raise HTTPException(status_code=404, detail=f"base version not found: '{patch.base_time}'")
+
+    try:
+        await storage.save_raw_patch(
+            current_user.username, current_time, base, [op.model_dump() for op in patch.ops]
+        )
+    except delta.PatchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cache.invalidate_latest(current_user.username)
+
+    return {
+        'message': 'raw data upload success d(OuO)y',
+        'update_time': current_time,
+        'base_time': base['update_time']
+    }
+
+# 建立分段上傳工作階段（大型光表或原始資料，流程見 uploads.py）
+# 使用方法：POST /api/upload_sessions，需要 Bearer Token，Body: {"kind": "items", "player_count": 8, "frame_counts": [...]}
+# 使用場景：在不穩定的網路上傳大型光表，中斷後可續傳
+@api_router.post("/upload_sessions")
+async def create_upload_session (config: UploadSession, current_user: User = Depends(get_current_active_user)):
+    try:
+        session = await uploads.create_session(
+            current_user.username, config.kind, config.player_count, config.frame_counts
+        )
+    except uploads.UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await uploads.session_status(session)
+
+async def get_upload_session (session_id: str, username: str):
+    session = await uploads.find_session(username, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"upload session not found: '{session_id}'")
+    return session
+
+# 查詢分段上傳工作階段已收到的段落與缺漏
+# 使用方法：GET /api/upload_sessions/{session_id}，需要 Bearer Token
+# 使用場景：連線中斷後決定要補傳哪些段落
+@api_router.get("/upload_sessions/{session_id}")
+async def read_upload_session (session_id: str, current_user: User = Depends(get_current_active_user)):
+    return await uploads.session_status(await get_upload_session(session_id, current_user.username))
+
+# 上傳單一玩家的一段影格，重新上傳會取代重疊的段落
+# 使用方法：PUT /api/upload_sessions/{session_id}/players/{player}?start={start}，需要 Bearer Token，Body 為 PlayerData 清單
+# 使用場景：依玩家或影格範圍分批上傳光表
+@api_router.put("/upload_sessions/{session_id}/players/{player}")
+async def upload_player_part (request: Request, session_id: str, player: int, start: int = 0,
+                              current_user: User = Depends(get_current_active_user)):
+    session = await get_upload_session(session_id, current_user.username)
+    b = await request.json()
+    try:
+        frames = await run_in_threadpool(ingest.parse_player, b)
+    except (ValidationError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"invalid frames: {e}")
+    try:
+        return await uploads.put_player_part(session, player, start, frames)
+    except uploads.UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# 上傳原始資料的一個片段
+# 使用方法：PUT /api/upload_sessions/{session_id}/raw/{index}，需要 Bearer Token，Body: {"text": "..."}
+# 使用場景：分批上傳大型原始資料
+@api_router.put("/upload_sessions/{session_id}/raw/{index}")
+async def upload_raw_part (session_id: str, index: int, part: RawUploadPart,
+                           current_user: User = Depends(get_current_active_user)):
+    session = await get_upload_session(session_id, current_user.username)
+    try:
+        return await uploads.put_raw_part(session, index, part.text)
+    except uploads.UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# 檢查段落完整後寫入為一個版本
+# 使用方法：POST /api/upload_sessions/{session_id}/commit，需要 Bearer Token
+# 使用場景：所有段落上傳完成後建立版本；中斷後可重新呼叫，不會產生重複版本（另一個 commit 處理中時回傳 409）
+@api_router.post("/upload_sessions/{session_id}/commit")
+async def commit_upload_session (session_id: str, current_user: User = Depends(get_current_active_user)):
+    session = await get_upload_session(session_id, current_user.username)
+    current_time = strftime("%Y-%m-%d-%H:%M:%S", localtime())
+    try:
+        update_time = await uploads.commit_session(session, current_time)
+    except uploads.CommitInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except uploads.UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cache.invalidate_latest(current_user.username)
+
+    return {
+        'message': 'upload success d(OvO)y',
+        'update_time': update_time
+    }
+
+# 放棄分段上傳並刪除已收到的段落
+# 使用方法：DELETE /api/upload_sessions/{session_id}，需要 Bearer Token
+# 使用場景：取消上傳；未處理的工作階段也會在 UPLOAD_SESSION_TTL 後自動清除
+@api_router.delete("/upload_sessions/{session_id}")
+async def delete_upload_session (session_id: str, current_user: User = Depends(get_current_active_user)):
+    await uploads.delete_session(await get_upload_session(session_id, current_user.username))
+    return {"message": "upload session deleted"}
+
+# 釘選或標記自己的版本，被釘選或標記的版本不會被保留規則清除
+# 使用方法：POST /api/versions/{query_time}/pin，需要 Bearer Token，Body: {"pinned": true, "tag": "final"}
+# 使用場景：保留演出版本、重要里程碑
+@api_router.post("/versions/{query_time}/pin")
+async def pin_version (query_time: str, pin: VersionPin, current_user: User = Depends(get_current_active_user)):
+    matched = 0
+    for collection in (collection_color, collection_raw):
+        result = await collection.update_many(
+            {"user": current_user.username, "update_time": query_time},
+            {"$set": {"pinned": pin.pinned, "tag": pin.tag}}
+        )
+        matched += result.matched_count
+
+    if not matched:
+        raise HTTPException(status_code=404, detail=f"version not found: '{query_time}'")
+    return {"update_time": query_time, "pinned": pin.pinned, "tag": pin.tag}
+
+# 依保留規則清除過期版本（連同分塊、patch 與原始資料），回傳釋放的空間
+# 使用方法：POST /api/admin/retention?dry_run=true&user={username}，需要管理者 Bearer Token
+# 使用場景：手動清理資料庫、預覽保留規則的清除結果
+@api_router.post("/admin/retention")
+async def run_version_retention (dry_run: bool = False, user: Union[str, None] = None,
+                                 current_user: User = Depends(get_current_admin_user)):
+    return await retention.run_retention(user, dry_run)
+
+# 由 collection_color 重新建立版本目錄
+# 使用方法：POST /api/admin/catalog/rebuild，需要管理者 Bearer Token
+# 使用場景：手動修改資料庫或還原備份後同步時間清單
+@api_router.post("/admin/catalog/rebuild")
+async def rebuild_version_catalog (current_user: User = Depends(get_current_admin_user)):
+    return {"versions": await catalog.rebuild()}
+
+# 查看版本快取的命中率與使用量
+# 使用方法：GET /api/cache/stats，無需驗證
+# 使用場景：調整 VERSION_CACHE_MAX_BYTES、監控讀取效能
+@api_router.get("/cache/stats")
+async def read_cache_stats ():
+    return cache.version_cache.stats()
+
+# 以 Prometheus 文字格式輸出各路由的延遲、請求與回應大小、MongoDB 與序列化時間，以及版本快取統計
+# 使用方法：GET /api/metrics，無需驗證
+# 使用場景：由 Prometheus 定期抓取，分辨變慢的原因在資料庫、序列化或網路
+@api_router.get("/metrics")
+async def read_metrics ():
+    return Response(metrics.render(cache.version_cache.stats()), media_type=metrics.CONTENT_TYPE)
+
 # ============================================================================
 # 音樂資源 (Music Resource) - 音樂檔案的上傳與管理
 # ============================================================================
@@ -347,257 +825,198 @@ async def upload_raw_data (request: Request, current_user: User = Depends(get_cu
 # 使用場景：為光表表演配對音樂檔案、建立音樂庫
 @api_router.post("/upload_music")
 async def upload_music(file: UploadFile = File(None), current_user: User = Depends(get_current_active_user)):
-	print(f"Received file: {file.filename}")  # Add this line to debug
-
 	if file is None:
 		raise HTTPException(status_code=400, detail="No file provided")
+	logger.debug("Received file: %s", file.filename)
 	if file.content_type != "audio/mpeg":
 		raise HTTPException(status_code=415, detail="File must be an MP3")
+	filename = os.path.basename(file.filename or "")
+	if not music_store.is_valid_filename(filename):
+		raise HTTPException(status_code=400, detail=f"Invalid file name: '{file.filename}'")
 
 	file_location = f"{MUSIC_FILE_PATH}/{current_user.username}"
 	if not os.path.exists(file_location):
-		print("make new directory")
+		logger.debug("make new directory: %s", file_location)
 		os.makedirs(file_location, exist_ok=True)
 			    
-	print("saving files")
-	file_loc = file_location + '/' + file.filename
-	# Save the uploaded file to the local server
-	with open(file_loc, "wb") as buffer:
-		shutil.copyfileobj(file.file, buffer)
+	logger.debug("saving files")
+	# 以內容雜湊儲存，相同的檔案只保存一份（見 music_store.py）
+	# 磁碟寫入交由 threadpool 執行，避免阻塞 event loop
+	saved = await run_in_threadpool(
+		music_store.save_upload, MUSIC_FILE_PATH, current_user.username, filename, file.file
+	)
+	# 波形峰值由背景 worker 計算，不延遲上傳回應；已計算過的內容直接沿用其長度
+	duration = None
+	if not waveform.enqueue(MUSIC_FILE_PATH, saved['sha256']):
+		duration = await run_in_threadpool(music_catalog.peaks_duration, MUSIC_FILE_PATH, saved['sha256'])
+	await music_catalog.record_upload(
+		current_user.username, filename, saved['size'], saved['sha256'], duration
+	)
 	    
-	return {"info": f"file '{file.filename}' saved at '{file_location}'"}
+	return {
+		"info": f"file '{filename}' saved at '{file_location}'",
+		"sha256": saved['sha256'],
+		"deduplicated": saved['deduplicated']
+	}
 
 
-# 取得特定使用者上傳的音樂檔案清單
-# 使用方法：GET /api/get_music_list/{username}，無需驗證
-# 使用場景：瀏覽特定使用者的音樂檔案庫
-@api_router.get("/get_music_list/{username}")
-async def get_music(username: str):
-	file_path = f"{MUSIC_FILE_PATH}/{username}"
-	files = os.listdir(file_path)
-	# Filtering only the files.
-	files = [f for f in files if os.path.isfile(file_path+'/'+f)]
-	print(*files, sep="\n")
+async def read_music_page(username: Union[str, None], search: Union[str, None],
+                          limit: Union[int, None], cursor: Union[str, None]):
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    try:
+        return await music_catalog.list_music(username, search, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-	return {
-		"music_list": files,
-		"message": f"get music list from {file_path}"
-	}
+# 取得特定使用者上傳的音樂檔案清單（由音樂目錄查詢，依檔名排序）
+# 使用方法：GET /api/get_music_list/{username}?search={keyword}&limit={limit}&cursor={next_cursor}，無需驗證
+# 使用場景：瀏覽特定使用者的音樂檔案庫；entries 另含大小、內容雜湊與長度
+@api_router.get("/get_music_list/{username}")
+async def get_music(username: str, search: Union[str, None] = None,
+                    limit: Union[int, None] = None, cursor: Union[str, None] = None):
+    entries, next_cursor = await read_music_page(username, search, limit, cursor)
+    return {
+        "music_list": [entry['filename'] for entry in entries],
+        "entries": entries,
+        "next_cursor": next_cursor,
+        "message": f"get music list of {username}"
+    }
 
 
 # 下載特定使用者的音樂檔案
 # 使用方法：GET /api/get_music/{username}/{filename}，無需驗證
 # 使用場景：播放或下載音樂檔案
+# 支援 Range（206）讓播放器直接跳轉；以內容雜湊作為 ETag，If-None-Match 相符時回傳 304
 @api_router.get("/get_music/{username}/{filename}")
-async def get_music(username: str, filename: str):
+async def get_music(request: Request, username: str, filename: str):
 	file_location = f'{MUSIC_FILE_PATH}/{username}/{filename}'
 	if not os.path.exists(file_location):
 		raise HTTPException(status_code=415, detail= f"file not found: {file_location}")
-	
-	
-	# Check if the file exiists before serving it
-	if not os.path.exists(file_location):
-		raise HTTPException(status_code=404, detail="File not found")
-
-	# Return the file as a response
-	return FileResponse(file_location, media_type='audio/mpeg', filename=filename)
-from os import listdir
-from os.path import isfile, join, isdir
 
-# 取得所有使用者的音樂檔案清單
-# 使用方法：GET /api/get_music_list，無需驗證
+	# 同名檔案可能被重新上傳，快取前須以 ETag 確認
+	headers = {"Cache-Control": "no-cache"}
+	digest = music_store.file_digest(MUSIC_FILE_PATH, file_location)
+	if digest is not None:
+		headers["ETag"] = f'"{digest}"'
+		if http_cache.etag_matches(request.headers.get('if-none-match'), headers["ETag"]):
+			return Response(status_code=304, headers=headers)
+
+	# Return the file as a response（FileResponse 會處理 Range 請求）
+	return FileResponse(file_location, media_type='audio/mpeg', filename=filename, headers=headers)
+
+# 取得音樂檔案預先計算的波形峰值（多種解析度，格式見 waveform.py）
+# 使用方法：GET /api/get_music_peaks/{username}/{filename}?level={samples_per_peak}，無需驗證
+# 使用場景：時間軸直接繪製波形，不必下載並解碼整個 MP3；尚未計算完成時回傳 202
+@api_router.get("/get_music_peaks/{username}/{filename}")
+async def get_music_peaks(request: Request, username: str, filename: str, level: Union[int, None] = None):
+    file_location = f'{MUSIC_FILE_PATH}/{username}/{filename}'
+    if not os.path.exists(file_location):
+        raise HTTPException(status_code=404, detail=f"file not found: {file_location}")
+    digest = music_store.file_digest(MUSIC_FILE_PATH, file_location)
+    if digest is None:
+        raise HTTPException(status_code=404, detail="no waveform peaks for this file, upload it again to compute them")
+
+    etag = f'"{digest}.peaks{level or ""}"'
+    encoding = http_cache.select_encoding(request.headers.get('accept-encoding'))
+    headers = {"Cache-Control": "no-cache", "ETag": http_cache._encoded_etag(etag, encoding), "Vary": "Accept-Encoding"}
+    if http_cache.etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+
+    content = await run_in_threadpool(waveform.load_peaks, MUSIC_FILE_PATH, digest)
+    if content is None:
+        if not waveform.available:
+            raise HTTPException(status_code=503, detail="waveform peaks unavailable: ffmpeg not installed")
+        if (MUSIC_FILE_PATH, digest) in waveform.failed:
+            raise HTTPException(status_code=422, detail="could not decode this file")
+        waveform.enqueue(MUSIC_FILE_PATH, digest)
+        return Response(content=json.dumps({"status": "pending"}), status_code=202, media_type="application/json")
+
+    if level is not None:
+        peaks = json.loads(content)
+        peaks['levels'] = [entry for entry in peaks['levels'] if entry['samples_per_peak'] == level]
+        if not peaks['levels']:
+            raise HTTPException(status_code=400, detail=f"level must be one of {list(waveform.LEVELS)}")
+        content = json.dumps(peaks, separators=(',', ':')).encode()
+
+    if encoding is not None:
+        content = await run_in_threadpool(http_cache.compress, content, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(content=content, media_type="application/json", headers=headers)
+
+# 取得所有使用者的音樂檔案清單（依使用者、檔名排序）
+# 使用方法：GET /api/get_music_list?search={keyword}&limit={limit}&cursor={next_cursor}，無需驗證
 # 使用場景：瀏覽所有可用的音樂檔案
 @api_router.get("/get_music_list")
-async def get_all_music_lists():
-    root_path = MUSIC_FILE_PATH
-    if not os.path.exists(root_path):
-        return {"message": f"Root directory '{root_path}' not found"}
+async def get_all_music_lists(search: Union[str, None] = None,
+                              limit: Union[int, None] = None, cursor: Union[str, None] = None):
+    entries, next_cursor = await read_music_page(None, search, limit, cursor)
     user_music_lists = {}
-    for username in listdir(root_path):
-        user_path = join(root_path, username)
-        if isdir(user_path):
-            files = [f for f in listdir(user_path) if isfile(join(user_path, f))]
-            user_music_lists[username] = files
-    return {"music_lists": user_music_lists, "message": "Retrieved all music lists"}
+    for entry in entries:
+        user_music_lists.setdefault(entry['user'], []).append(entry['filename'])
+    return {
+        "music_lists": user_music_lists,
+        "entries": entries,
+        "next_cursor": next_cursor,
+        "message": "Retrieved all music lists"
+    }
+
+# 重新掃描音樂目錄，同步音樂清單
+# 使用方法：POST /api/admin/music/rebuild，需要管理者 Bearer Token
+# 使用場景：手動複製檔案或還原備份後同步音樂清單
+@api_router.post("/admin/music/rebuild")
+async def rebuild_music_catalog (current_user: User = Depends(get_current_admin_user)):
+    return {"files": await music_catalog.rebuild(MUSIC_FILE_PATH)}
 
 # ============================================================================
 # 生成工具資源 (Generator Resource) - 隨機與測試資料生成
 # ============================================================================
 
-# 生成指定數量的隨機光表資料（可指定種子值）
-# 使用方法：GET /api/get_rand_lightlist/cnt={cnt}/seed={seed}，無需驗證
+async def generate_response(mode: str, player_count: int, frame_count: int, seed: Union[int, None],
+                            interval: int, format: str, start: int = 0, end: Union[int, None] = None):
+    try:
+        generator.check_request(mode, player_count, frame_count, interval, seed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if format not in ("json", "packed"):
+        raise HTTPException(status_code=400, detail="format must be json or packed")
+    # 未指定種子值時隨機產生，並在回應標頭中回傳以便重現
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    headers = {"X-Generator-Seed": str(seed)}
+    args = (mode, seed, player_count, frame_count, interval, start, end)
+    if format == "packed":
+        content = await run_in_threadpool(generator.packed, *args)
+        return Response(content=content, media_type=packing.PACKED_MEDIA_TYPE, headers=headers)
+    return StreamingResponse(generator.iter_json(*args), media_type="application/json", headers=headers)
+
+# 產生多玩家的隨機或測試光表（欄位與 PlayerData 相同，格式見 generator.py）
+# 使用方法：GET /api/generate/{mode}?players={players}&frames={frames}&seed={seed}&interval={interval}&format={json|packed}，無需驗證
+# 使用場景：壓力測試、韌體長時間測試；mode 為 random 或 test，相同 seed 產生相同內容
+@api_router.get("/generate/{mode}")
+async def generate_lightlist(mode: str, players: int = 1, frames: int = 1500, seed: Union[int, None] = None,
+                             interval: int = 1, format: str = "json"):
+    return await generate_response(mode, players, frames, seed, interval, format)
+
+# 生成指定數量的隨機光表資料（可指定種子值，另可指定 players 與 format）
+# 使用方法：GET /api/get_rand_lightlist/cnt={cnt}/seed={seed}、/get_rand_lightlist/cnt={cnt} 或 /get_rand_lightlist/json/cnt={cnt}，無需驗證
 # 使用場景：測試光表效果、產生演示資料
 @api_router.get("/get_rand_lightlist/cnt={cnt}/seed={seed}")
-async def get_rand_lightlist(cnt : int,seed : int):
-    if not (1 <= cnt <= 1500):
-        raise HTTPException(status_code=400, detail="cnt 必須介於 1 和 1500 之間")
-    random.seed(seed)
-    time_values = random.sample(range(1500), cnt)
-    
-    time_values.sort()
-    
-    data = []
-    for t in time_values:
-        item = {
-            "time": str(t),
-            "head": str(random.randint(0, 2147483647)),
-            "shoulder": str(random.randint(0, 2147483647)),
-            "chest": str(random.randint(0, 2147483647)),
-            "front": str(random.randint(0, 2147483647)),
-            "skirt": str(random.randint(0, 2147483647)),
-            "leg": str(random.randint(0, 2147483647)),
-            "shoes": str(random.randint(0, 2147483647))
-        }
-        data.append(item)
-    
-    response = {
-        "color_data": data
-    }
-    
-    json_str = json.dumps(response, ensure_ascii=False)
-    
-    # return json_str
-    return response
-
-# 生成指定數量的隨機光表資料（自動種子值）
-# 使用方法：GET /api/get_rand_lightlist/cnt={cnt}，無需驗證
-# 使用場景：快速生成隨機測試資料
 @api_router.get("/get_rand_lightlist/cnt={cnt}")
-async def get_rand_lightlist(cnt : int):
-    if not (1 <= cnt <= 1500):
-        raise HTTPException(status_code=400, detail="cnt 必須介於 1 和 1500 之間")
-    
-    time_values = random.sample(range(1500), cnt)
-    
-    time_values.sort()
-    
-    data = []
-    for t in time_values:
-        item = {
-            "time": str(t),
-            "head": str(random.randint(0, 2147483647)),
-            "shoulder": str(random.randint(0, 2147483647)),
-            "chest": str(random.randint(0, 2147483647)),
-            "arm_waist": str(random.randint(0, 2147483647)),
-            "leg1": str(random.randint(0, 2147483647)),
-            "leg2": str(random.randint(0, 2147483647)),
-            "shoes": str(random.randint(0, 2147483647))
-        }
-        data.append(item)
-    
-    response = {
-        "color_data": data
-    }
-    
-    json_str = json.dumps(response, ensure_ascii=False)
-    
-    # return json_str
-    return response
-
-# 生成指定數量的隨機光表資料（JSON 格式）
-# 使用方法：GET /api/get_rand_lightlist/json/cnt={cnt}，無需驗證
-# 使用場景：獲取原始 JSON 格式的隨機資料
 @api_router.get("/get_rand_lightlist/json/cnt={cnt}")
-async def get_rand_lightlist(cnt : int):
-    if not (1 <= cnt <= 1500):
-        raise HTTPException(status_code=400, detail="cnt 必須介於 1 和 1500 之間")
-    
-    time_values = random.sample(range(1500), cnt)
-    time_values.sort()
-    
-    data = []
-    for t in time_values:
-        item = {
-            "time": str(t),
-            "head": str(random.randint(0, 2147483647)),
-            "shoulder": str(random.randint(0, 2147483647)),
-            "chest": str(random.randint(0, 2147483647)),
-            "arm_waist": str(random.randint(0, 2147483647)),
-            "leg1": str(random.randint(0, 2147483647)),
-            "leg2": str(random.randint(0, 2147483647)),
-            "shoes": str(random.randint(0, 2147483647))
-        }
-        data.append(item)
-    
-    response = {
-        "color_data": data
-    }
-    
-    return response
+async def get_rand_lightlist(cnt: int, seed: Union[int, None] = None, players: int = 1, format: str = "json"):
+    return await generate_response("random", players, cnt, seed, 1, format)
 
-# 生成指定數量的測試光表資料（固定模式）
-# 使用方法：GET /api/get_test_lightlist/cnt={cnt}，無需驗證
-# 使用場景：系統測試、效能基準測量
+# 生成指定數量的測試光表資料（固定模式；指定 chunk 時只回傳第 chunk 段的 100 個影格）
+# 使用方法：GET /api/get_test_lightlist/cnt={cnt} 或 /get_test_lightlist/cnt={cnt}/chunk={chunk}，無需驗證
+# 使用場景：系統測試、效能基準測量、大量資料測試時分批載入
 @api_router.get("/get_test_lightlist/cnt={cnt}")
-async def get_test_lightlist(cnt : int):
-
-    BLACK  = int("0x000000FF", 16) 
-    RED    = int("0xFF0000FF", 16)
-    GREEN  = int("0x00FF00FF", 16)
-    BLUE   = int("0x0000FFFF", 16)
-    YELLOW = int("0xFFFF00FF", 16)
-    CYAN   = int("0x00FFFFFF", 16)
-    PURPLE = int("0xFF00FFFF", 16)
-    WHITE  = int("0xFFFFFFFF", 16)
-    COLOR  = [BLACK, RED, GREEN, BLUE, YELLOW, CYAN, PURPLE, WHITE]
-
-    data = []
-    for i in range(0, cnt):
-        item = {
-            "time"      : str(i),
-            "head"      : str(COLOR[(i>>8) & 3]-250),
-            "shoulder"  : str(COLOR[(i>>6) & 3]-250),
-            "chest"     : str(COLOR[(i>>4) & 3]-250),
-            "arm_waist" : str(COLOR[(i>>2) & 3]-250),
-            "leg1"      : str(COLOR[(i>>12) & 3]-250),
-            "leg2"      : str(COLOR[(i>>10) & 3]-250),
-            "shoes"     : str(COLOR[(i>>0) & 3]-250)        
-        }
-        data.append(item)
-
-    response = {
-        "color_data": data
-    }
-    
-    return response
-
-# 生成指定數量的測試光表資料（分塊模式）
-# 使用方法：GET /api/get_test_lightlist/cnt={cnt}/chunk={chunk}，無需驗證
-# 使用場景：大量資料測試時分批載入
 @api_router.get("/get_test_lightlist/cnt={cnt}/chunk={chunk}")
-async def get_test_lightlist(cnt : int, chunk : int):
-
-    BLACK  = int("0x000000FF", 16) 
-    RED    = int("0xFF0000FF", 16)
-    GREEN  = int("0x00FF00FF", 16)
-    BLUE   = int("0x0000FFFF", 16)
-    YELLOW = int("0xFFFF00FF", 16)
-    CYAN   = int("0x00FFFFFF", 16)
-    PURPLE = int("0xFF00FFFF", 16)
-    WHITE  = int("0xFFFFFFFF", 16)
-    COLOR  = [BLACK, RED, GREEN, BLUE, YELLOW, CYAN, PURPLE, WHITE]
-
+async def get_test_lightlist(cnt: int, chunk: Union[int, None] = None, players: int = 1, format: str = "json"):
+    if chunk is None:
+        return await generate_response("test", players, cnt, 0, 1, format)
     CHUNK_SIZE = 100
-
-    data = []
-    for i in range(chunk*CHUNK_SIZE, min((chunk+1)*CHUNK_SIZE, cnt)):
-        item = {
-            "time"      : str(i),
-            "head"      : str(COLOR[(i>>8) & 3]-250),
-            "shoulder"  : str(COLOR[(i>>6) & 3]-250),
-            "chest"     : str(COLOR[(i>>4) & 3]-250),
-            "arm_waist" : str(COLOR[(i>>2) & 3]-250),
-            "leg1"      : str(COLOR[(i>>12) & 3]-250),
-            "leg2"      : str(COLOR[(i>>10) & 3]-250),
-            "shoes"     : str(COLOR[(i>>0) & 3]-250)        
-        }
-        data.append(item)
-
-    response = {
-        "color_data": data
-    }
-    
-    return response
+    return await generate_response("test", players, cnt, 0, 1, format, chunk * CHUNK_SIZE, (chunk + 1) * CHUNK_SIZE)
 
 # 韌體組測試字串測試API
 # 使用方法：GET /api/get_test_lightlist/cnt={cnt}/chunk={chunk}，無需驗證
@@ -0,0 +1,269 @@
+"""
+請求量測與 Prometheus 指標
+每個請求記錄延遲、請求與回應的位元組數，以及其中花在 MongoDB 與回應序列化的時間，
+由 GET /api/metrics 以 Prometheus 文字格式輸出
+
+各段時間的定義：
+- handler：路由函式本身（含其中的 MongoDB 查詢），由 TimedRoute 包裝路由函式量測
+- mongo：請求期間 MongoDB 指令的來回時間總和，由 MongoListener（pymongo 指令監聽）累加
+- serialize：路由函式回傳之後到送出回應標頭之前，即 FastAPI 的 jsonable_encoder 與 JSON 編碼；
+             StreamingResponse 在產生內容時才序列化，這段時間會計入整體延遲而非 serialize
+路由標籤使用路由的路徑樣板（例如 /api/items/{username}/{query_time}），未符合任何路由時為 unmatched，
+避免標籤數量隨網址無限增加
+"""
+
+import functools
+import inspect
+import logging
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence
+
+from fastapi.routing import APIRoute
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+# 目前請求的量測資料，由 MetricsMiddleware 設定，路由函式與 MongoListener 在同一個 context 中累加
+_current: ContextVar[Optional[dict]] = ContextVar('metrics_request', default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # 標籤 -> [各區間的個數（不累計）..., 超出最大區間的個數, 總和]
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(series[-1])}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, labels)} {cumulative}')
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    'lightdance_http_request_duration_seconds', 'Time from request start to the last response byte',
+    ('method', 'route', 'status'), LATENCY_BUCKETS)
+HANDLER_SECONDS = Histogram(
+    'lightdance_http_handler_seconds', 'Time spent in the route function, MongoDB included',
+    ('method', 'route'), LATENCY_BUCKETS)
+MONGO_SECONDS = Histogram(
+    'lightdance_http_mongo_seconds', 'MongoDB round-trip time per request',
+    ('method', 'route'), LATENCY_BUCKETS)
+SERIALIZE_SECONDS = Histogram(
+    'lightdance_http_serialize_seconds', 'Time from route function return to response start',
+    ('method', 'route'), LATENCY_BUCKETS)
+REQUEST_BYTES = Histogram(
+    'lightdance_http_request_size_bytes', 'Request body size',
+    ('method', 'route'), SIZE_BUCKETS)
+RESPONSE_BYTES = Histogram(
+    'lightdance_http_response_size_bytes', 'Response body size as sent',
+    ('method', 'route'), SIZE_BUCKETS)
+MONGO_COMMAND_SECONDS = Histogram(
+    'lightdance_mongo_command_duration_seconds', 'MongoDB command round-trip time',
+    ('command',), LATENCY_BUCKETS)
+MONGO_COMMAND_FAILURES = Counter(
+    'lightdance_mongo_command_failures_total', 'MongoDB commands that returned an error', ('command',))
+
+_METRICS = [
+    REQUEST_SECONDS, HANDLER_SECONDS, MONGO_SECONDS, SERIALIZE_SECONDS,
+    REQUEST_BYTES, RESPONSE_BYTES, MONGO_COMMAND_SECONDS, MONGO_COMMAND_FAILURES,
+]
+
+
+def _cache_lines(stats: dict) -> List[str]:
+    """版本快取的統計（cache.version_cache.stats()）"""
+    lines = []
+    for key, kind in (('hits', 'counter'), ('misses', 'counter'), ('evictions', 'counter'),
+                      ('entries', 'gauge'), ('bytes', 'gauge'), ('max_bytes', 'gauge')):
+        name = f'lightdance_version_cache_{key}' + ('_total' if kind == 'counter' else '')
+        lines += [f'# TYPE {name} {kind}', f'{name} {stats[key]}']
+    return lines
+
+
+def render(cache_stats: Optional[dict] = None) -> str:
+    """輸出所有指標；database.py 匯入此模組，版本快取的統計由呼叫端傳入以避免循環匯入"""
+    lines = []
+    for metric in _METRICS:
+        lines += metric.render()
+    if cache_stats is not None:
+        lines += _cache_lines(cache_stats)
+    return '\n'.join(lines) + '\n'
+
+
+# ============================================================================
+# MongoDB 指令監聽
+# ============================================================================
+
+class MongoListener(monitoring.CommandListener):
+    """累加每個 MongoDB 指令的來回時間；於 database.py 建立連線時註冊"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event, True)
+
+    def failed(self, event):
+        self._record(event, False)
+
+    def _record(self, event, ok: bool):
+        seconds = event.duration_micros / 1e6
+        MONGO_COMMAND_SECONDS.observe((event.command_name,), seconds)
+        if not ok:
+            MONGO_COMMAND_FAILURES.inc((event.command_name,))
+        record = _current.get()
+        if record is not None:
+            record['mongo'] += seconds
+
+
+# ============================================================================
+# 路由與 middleware
+# ============================================================================
+
+def _timed(endpoint):
+    """包裝路由函式，記錄執行時間與回傳的時間點；functools.wraps 保留簽章，FastAPI 的參數解析不受影響"""
+    def done(record, start):
+        if record is not None:
+            now = time.perf_counter()
+            record['handler'] += now - start
+            record['returned'] = now
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            record, start = _current.get(), time.perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                done(record, start)
+        return async_wrapper
+
+    # 同步的路由函式由 FastAPI 在 threadpool 中執行，context 會一併複製
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        record, start = _current.get(), time.perf_counter()
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            done(record, start)
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    """記錄路由函式執行時間的路由類別，用於 APIRouter(route_class=TimedRoute)"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _timed(endpoint), **kwargs)
+
+
+class MetricsMiddleware:
+    """量測所有 HTTP 請求；以純 ASGI middleware 實作，不影響 StreamingResponse 與 FileResponse 的串流"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        record = {'mongo': 0.0, 'handler': 0.0, 'returned': None, 'started': None,
+                  'status': 500, 'request_bytes': 0, 'response_bytes': 0}
+        token = _current.set(record)
+        start = time.perf_counter()
+
+        async def counted_receive():
+            message = await receive()
+            if message['type'] == 'http.request':
+                record['request_bytes'] += len(message.get('body', b''))
+            return message
+
+        async def counted_send(message):
+            if message['type'] == 'http.response.start':
+                record['status'] = message['status']
+                record['started'] = time.perf_counter()
+            elif message['type'] == 'http.response.body':
+                record['response_bytes'] += len(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, counted_receive, counted_send)
+        finally:
+            _current.reset(token)
+            self._observe(scope, record, time.perf_counter() - start)
+
+    @staticmethod
+    def _observe(scope, record: dict, seconds: float):
+        route = scope.get('route')
+        labels = (scope['method'], route.path if route is not None else 'unmatched')
+        REQUEST_SECONDS.observe(labels + (str(record['status']),), seconds)
+        REQUEST_BYTES.observe(labels, record['request_bytes'])
+        RESPONSE_BYTES.observe(labels, record['response_bytes'])
+        MONGO_SECONDS.observe(labels, record['mongo'])
+        serialize = 0.0
+        if record['returned'] is not None:
+            HANDLER_SECONDS.observe(labels, record['handler'])
+            if record['started'] is not None:
+                serialize = max(record['started'] - record['returned'], 0.0)
+                SERIALIZE_SECONDS.observe(labels, serialize)
+        logger.debug("request", extra={
+            'method': labels[0], 'route': labels[1], 'status': record['status'],
+            'duration_ms': round(seconds * 1000, 3), 'handler_ms': round(record['handler'] * 1000, 3),
+            'mongo_ms': round(record['mongo'] * 1000, 3), 'serialize_ms': round(serialize * 1000, 3),
+            'request_bytes': record['request_bytes'], 'response_bytes': record['response_bytes'],
+        })
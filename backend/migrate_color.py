@@ -0,0 +1,61 @@
+"""
+collection_color 分塊格式轉換工具
+將舊格式（players 整份存在同一文件）的版本轉為表頭 + 分塊文件（見 storage.py）
+
+使用方法：
+    python migrate_color.py              # 轉換所有舊格式版本
+    python migrate_color.py --user NAME  # 只轉換特定使用者
+    python migrate_color.py --dry-run    # 只列出將被轉換的版本
+
+可重複執行；已轉換的版本會被略過，中斷後重新執行即可繼續
+"""
+
+import argparse
+import asyncio
+
+import database
+import storage
+from database import collection_color
+
+
+async def migrate(user=None, dry_run=False):
+    query = {'players': {'$exists': True}}
+    if user is not None:
+        query['user'] = user
+
+    migrated = 0
+    total_chunks = 0
+    cursor = collection_color.find(query, {'_id': 1, 'user': 1, 'update_time': 1})
+    legacy_entries = await cursor.to_list(length=None)
+
+    for entry in legacy_entries:
+        # 逐筆讀取完整文件，避免一次載入所有版本
+        document = await collection_color.find_one({'_id': entry['_id']})
+        if document is None or 'players' not in document:
+            continue
+        chunk_count = await storage.migrate_legacy_version(document, dry_run=dry_run)
+        migrated += 1
+        total_chunks += chunk_count
+        action = "would migrate" if dry_run else "migrated"
+        print(f"{action} {document['user']} @ {document['update_time']}: {chunk_count} chunks")
+
+    print(f"{migrated} version(s), {total_chunks} chunk(s) total")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate collection_color to the chunked storage format")
+    parser.add_argument('--user', help="only migrate versions of this user")
+    parser.add_argument('--dry-run', action='store_true', help="list versions without writing")
+    args = parser.parse_args()
+
+    async def run():
+        try:
+            await migrate(args.user, args.dry_run)
+        finally:
+            await database.close()
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
@@ -5,10 +5,10 @@
 模型分類：
 - 使用者相關：User, UserInDB
 - 燈光控制相關：PlayerData, Player, Data
-- 資料傳輸相關：RAW, Item
+- 資料傳輸相關：RAW, ColorPatch, RawPatch, VersionPin, UploadSession, RawUploadPart, Item
 """
 
-from typing import List, Union
+from typing import List, Optional, Union
 from pydantic import BaseModel
 
 
@@ -71,6 +71,82 @@ class RAW(BaseModel):
     raw_data: str
 
 
+class ColorPatchOp(BaseModel):
+    """
+    光表 patch 的單一區段替換
+    將玩家 player 的影格 [start, end) 替換為 frames（PlayerData 格式，由 ingest.py 驗證）
+    """
+    player: int
+    start: int
+    end: int
+    frames: list = []
+
+
+class ColorPatch(BaseModel):
+    """
+    光表增量上傳資料
+    以 base_time 指定的版本為基準，依序套用 ops
+    """
+    base_time: str
+    player_count: Optional[int] = None
+    ops: List[ColorPatchOp] = []
+
+
+class RawPatchOp(BaseModel):
+    """
+    原始資料 patch 的單一字串替換
+    將 raw_data 的 [start, end)（以 Unicode code point 計算）替換為 text
+    """
+    start: int
+    end: int
+    text: str = ""
+
+
+class RawPatch(BaseModel):
+    """
+    原始資料增量上傳資料
+    以 base_time 指定的版本為基準，依序套用 ops
+    """
+    base_time: str
+    ops: List[RawPatchOp] = []
+
+
+class VersionPin(BaseModel):
+    """
+    版本釘選設定
+    被釘選或帶有標籤的版本不會被保留規則清除
+    """
+    pinned: bool = True
+    tag: Optional[str] = None
+
+
+class UploadSession(BaseModel):
+    """
+    分段上傳工作階段的設定（流程見 uploads.py）
+    kind 為 items（光表，需指定 player_count）或 raw（原始資料）
+    frame_counts 可選，指定時 commit 會檢查每位玩家的影格數
+    """
+    kind: str
+    player_count: Optional[int] = None
+    frame_counts: Optional[List[int]] = None
+
+
+class RawUploadPart(BaseModel):
+    """原始資料分段上傳的單一片段，依 index 順序串接"""
+    text: str
+
+
+class PlaybackControl(BaseModel):
+    """
+    播放同步的控制指令（見 playback.py）
+    action 為 load（載入 query_time 指定的版本，預設 LATEST）、play、pause 或 seek
+    play 可指定 position_ms 由該位置開始，seek 必須指定 position_ms
+    """
+    action: str
+    query_time: Optional[str] = None
+    position_ms: Optional[int] = None
+
+
 class Item(BaseModel):
     """
     時間軸項目資料
@@ -99,4 +175,13 @@ class UserInDB(User):
     資料庫中的使用者資訊
     繼承基本使用者資訊，額外包含密碼欄位
     """
-    password: str
\ No newline at end of file
+    password: str
+
+
+class UserUpdate(BaseModel):
+    """
+    管理者修改使用者資料，只更新有提供的欄位
+    修改密碼後該使用者先前取得的令牌全部失效
+    """
+    disabled: Optional[bool] = None
+    password: Optional[str] = None
@@ -0,0 +1,131 @@
+"""
+音樂檔案目錄
+collection_music 為每個使用者的音樂檔案保存一筆摘要，清單端點只需讀取此集合，不必掃描目錄
+
+欄位：user, filename, size, sha256（內容雜湊，舊檔案為 None）, duration（秒，波形計算完成後填入）, updated_at
+
+上傳音樂時由 main.py 維護，長度在波形計算完成後由 waveform.run_worker 回呼填入；
+目錄與實際檔案不一致時（手動複製檔案、還原備份）可用 rebuild 重新掃描
+"""
+
+import json
+import os
+import re
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from pymongo import ASCENDING
+from starlette.concurrency import run_in_threadpool
+
+import music_store
+import waveform
+from catalog import decode_cursor, encode_cursor
+from database import collection_music
+
+MUSIC_SORT = [('user', ASCENDING), ('filename', ASCENDING)]
+
+_LIST_PROJECTION = {'_id': 0, 'user': 1, 'filename': 1, 'size': 1, 'sha256': 1, 'duration': 1}
+
+
+async def record_upload(user: str, filename: str, size: int, sha256: Optional[str],
+                        duration: Optional[float] = None):
+    """新增或更新單一檔案的摘要；重新上傳同名檔案時會取代舊的內容資訊"""
+    await collection_music.update_one(
+        {'user': user, 'filename': filename},
+        {'$set': {
+            'size': size,
+            'sha256': sha256,
+            'duration': duration,
+            'updated_at': datetime.now(timezone.utc),
+        }},
+        upsert=True
+    )
+
+
+async def set_duration(sha256: str, duration: float):
+    """波形計算完成後填入所有相同內容檔案的長度"""
+    await collection_music.update_many({'sha256': sha256}, {'$set': {'duration': duration}})
+
+
+async def list_music(username: Optional[str] = None, search: Optional[str] = None,
+                     limit: Optional[int] = None, cursor: Optional[str] = None):
+    """
+    依 MUSIC_SORT 排序取得音樂摘要，search 為檔名的部分字串（不分大小寫）
+    limit 為 None 時回傳全部；回傳 (摘要清單, 下一頁游標或 None)
+    """
+    conditions = []
+    if username is not None:
+        conditions.append({'user': username})
+    if search:
+        conditions.append({'filename': {'$regex': re.escape(search), '$options': 'i'}})
+    if cursor is not None:
+        last_user, last_filename = decode_cursor(cursor)
+        after = [{'user': last_user, 'filename': {'$gt': last_filename}}]
+        if username is None:
+            after.append({'user': {'$gt': last_user}})
+        conditions.append({'$or': after})
+    query = {'$and': conditions} if conditions else {}
+
+    find = collection_music.find(query, _LIST_PROJECTION).sort(MUSIC_SORT)
+    if limit is not None:
+        # 多取一筆以判斷是否還有下一頁
+        find = find.limit(limit + 1)
+    entries = await find.to_list(length=None)
+
+    next_cursor = None
+    if limit is not None and len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = encode_cursor(entries[-1], ('user', 'filename'))
+    return entries, next_cursor
+
+
+# ============================================================================
+# 重新掃描
+# ============================================================================
+
+def peaks_duration(root: str, digest: Optional[str]) -> Optional[float]:
+    """由已計算的波形峰值取得長度（秒），尚未計算時回傳 None"""
+    content = waveform.load_peaks(root, digest) if digest is not None else None
+    if content is None:
+        return None
+    try:
+        return json.loads(content).get('duration')
+    except ValueError:
+        return None
+
+
+def scan(root: str) -> List[dict]:
+    """掃描音樂目錄，回傳所有使用者檔案的摘要（阻塞式 I/O，請在 threadpool 中執行）"""
+    entries = []
+    if not os.path.isdir(root):
+        return entries
+    for username in sorted(os.listdir(root)):
+        user_path = os.path.join(root, username)
+        if not music_store.is_user_dir(username) or not os.path.isdir(user_path):
+            continue
+        for filename in sorted(os.listdir(user_path)):
+            path = os.path.join(user_path, filename)
+            if not os.path.isfile(path):
+                continue
+            digest = music_store.file_digest(root, path)
+            entries.append({
+                'user': username,
+                'filename': filename,
+                'size': os.path.getsize(path),
+                'sha256': digest,
+                'duration': peaks_duration(root, digest),
+            })
+    return entries
+
+
+async def rebuild(root: str) -> int:
+    """重新掃描音樂目錄並取代整個目錄，回傳檔案數"""
+    entries = await run_in_threadpool(scan, root)
+    now = datetime.now(timezone.utc)
+    for entry in entries:
+        entry['updated_at'] = now
+
+    await collection_music.delete_many({})
+    if entries:
+        await collection_music.insert_many(entries)
+    return len(entries)
@@ -0,0 +1,100 @@
+"""
+音樂檔案的內容定址儲存
+上傳時一邊寫入一邊計算 SHA-256，相同內容的檔案只保存一份：
+
+    {MUSIC_FILE_PATH}/.blobs/{hash 前兩碼}/{hash}.mp3     實際檔案
+    {MUSIC_FILE_PATH}/{username}/{filename}              指向實際檔案的相對 symlink
+
+使用者目錄的結構不變，既有檔案照常讀取（清單由 music_catalog.py 的目錄提供）；
+無法建立 symlink 的檔案系統改為複製一份。
+舊的（上傳於此功能之前的）檔案仍是一般檔案，重新上傳後即改為共用儲存。
+"""
+
+import hashlib
+import os
+import shutil
+import uuid
+from typing import BinaryIO, Optional
+
+BLOB_DIR_NAME = '.blobs'
+BLOB_SUFFIX = '.mp3'
+
+# 上傳時每次讀取的位元組數
+READ_SIZE = 1024 * 1024
+
+
+def is_user_dir(name: str) -> bool:
+    """MUSIC_FILE_PATH 底下的目錄是否為使用者目錄（排除 .blobs 等內部目錄）"""
+    return not name.startswith('.')
+
+
+def is_valid_filename(name: str) -> bool:
+    """上傳的檔名（已取 basename）是否可用；空字串、. 與 .. 會指向目錄本身，. 開頭會與 .blobs 衝突"""
+    return bool(name) and not name.startswith('.') and os.path.basename(name) == name
+
+
+def blob_path(root: str, digest: str) -> str:
+    return os.path.join(root, BLOB_DIR_NAME, digest[:2], digest + BLOB_SUFFIX)
+
+
+def _link_target(digest: str) -> str:
+    # 以相對路徑指向實際檔案，整個音樂目錄可以搬移或掛載到不同路徑
+    return os.path.join('..', BLOB_DIR_NAME, digest[:2], digest + BLOB_SUFFIX)
+
+
+def file_digest(root: str, path: str) -> Optional[str]:
+    """取得使用者檔案的內容雜湊；不是指向共用儲存的檔案時回傳 None"""
+    if not os.path.islink(path):
+        return None
+    name = os.path.basename(os.readlink(path))
+    if not name.endswith(BLOB_SUFFIX):
+        return None
+    digest = name[:-len(BLOB_SUFFIX)]
+    return digest if os.path.exists(blob_path(root, digest)) else None
+
+
+def save_upload(root: str, username: str, filename: str, source: BinaryIO) -> dict:
+    """
+    儲存上傳的檔案（阻塞式 I/O，請在 threadpool 中執行），filename 需通過 is_valid_filename
+    回傳 {path, sha256, size, deduplicated}
+    """
+    tmp_dir = os.path.join(root, BLOB_DIR_NAME, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex)
+
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(tmp_path, 'wb') as buffer:
+        while True:
+            data = source.read(READ_SIZE)
+            if not data:
+                break
+            sha256.update(data)
+            buffer.write(data)
+            size += len(data)
+    digest = sha256.hexdigest()
+
+    target = blob_path(root, digest)
+    deduplicated = os.path.exists(target)
+    if deduplicated:
+        os.remove(tmp_path)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(tmp_path, target)
+
+    user_dir = os.path.join(root, username)
+    os.makedirs(user_dir, exist_ok=True)
+    path = os.path.join(user_dir, filename)
+    # 先在暫存目錄建立連結再取代，同名檔案被覆蓋時讀取端不會看到不完整的檔案
+    link_path = os.path.join(tmp_dir, uuid.uuid4().hex)
+    try:
+        os.symlink(_link_target(digest), link_path)
+    except (OSError, NotImplementedError):
+        shutil.copyfile(target, link_path)
+    try:
+        os.replace(link_path, path)
+    except OSError:
+        os.remove(link_path)
+        raise
+
+    return {'path': path, 'sha256': digest, 'size': size, 'deduplicated': deduplicated}
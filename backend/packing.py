@@ -0,0 +1,159 @@
+"""
+燈光影格的欄式壓縮格式
+將 PlayerData 影格轉為每個欄位一條 little-endian uint32 陣列，省去每個影格重複的鍵名
+
+儲存（collection_color_chunks）：
+    columns: {time: Binary, hat: Binary, ..., board: Binary}
+
+傳輸（application/octet-stream，所有整數皆為 little-endian）：
+    magic          4 bytes  b"LDPK"
+    version        uint16   目前為 1
+    field_count    uint16   欄位數（含 time），目前為 16
+    player_count   uint32
+    frame_counts   uint32 * player_count
+    之後依玩家順序，每位玩家依 FRAME_FIELDS 順序接續各欄位的 uint32 陣列
+"""
+
+import struct
+import sys
+from array import array
+from typing import Dict, List, Optional
+
+from bson import Binary
+
+from models import PlayerData
+
+# 影格欄位順序：time 之後依身體部位排列，與 PlayerData 定義一致
+FRAME_FIELDS = tuple(PlayerData.model_fields)
+PART_FIELDS = FRAME_FIELDS[1:]
+
+PACKED_MAGIC = b"LDPK"
+PACKED_VERSION = 1
+PACKED_MEDIA_TYPE = "application/octet-stream"
+
+_HEADER = struct.Struct("<4sHHI")
+_UINT32_MAX = 0xFFFFFFFF
+
+
+def _to_bytes(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array("I", values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(data: bytes) -> array:
+    values = array("I")
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def fits_uint32(frames: List[dict]) -> bool:
+    """所有欄位值是否都能以 uint32 表示"""
+    for frame in frames:
+        for field in FRAME_FIELDS:
+            value = frame[field]
+            if value < 0 or value > _UINT32_MAX:
+                return False
+    return True
+
+
+def pack_columns(frames: List[dict]) -> Dict[str, bytes]:
+    """將影格清單轉為欄位 -> uint32 位元組；數值超出範圍時拋出 OverflowError"""
+    return {
+        field: _to_bytes(array("I", [frame[field] for frame in frames]))
+        for field in FRAME_FIELDS
+    }
+
+
+def pack_arrays(arrays: Dict[str, array], start: int = 0, end: Optional[int] = None) -> Dict[str, bytes]:
+    """將已解析的 uint32 陣列（可指定範圍）轉為欄位位元組"""
+    return {field: _to_bytes(arrays[field][start:end]) for field in FRAME_FIELDS}
+
+
+def unpack_rows(columns: Dict[str, bytes]):
+    """由欄位位元組逐影格取出依 FRAME_FIELDS 順序排列的數值 tuple"""
+    return zip(*[_from_bytes(columns[field]) for field in FRAME_FIELDS])
+
+
+def unpack_columns(columns: Dict[str, bytes]) -> List[dict]:
+    """由欄位位元組還原影格清單，鍵的順序與 PlayerData.model_dump() 相同"""
+    return [dict(zip(FRAME_FIELDS, values)) for values in unpack_rows(columns)]
+
+
+def to_bson_columns(columns: Dict[str, bytes]) -> Dict[str, Binary]:
+    return {field: Binary(data) for field, data in columns.items()}
+
+
+def encode_packed(players_columns: List[Dict[str, bytes]], frame_counts: List[int]) -> bytes:
+    """組成傳輸用的二進位內容"""
+    parts = [
+        _HEADER.pack(PACKED_MAGIC, PACKED_VERSION, len(FRAME_FIELDS), len(frame_counts)),
+        _to_bytes(array("I", frame_counts)),
+    ]
+    for columns in players_columns:
+        for field in FRAME_FIELDS:
+            parts.append(bytes(columns[field]))
+    return b"".join(parts)
+
+
+def packed_size(frame_counts: List[int]) -> int:
+    """encode_packed 輸出的位元組數"""
+    return _HEADER.size + 4 * len(frame_counts) + 4 * len(FRAME_FIELDS) * sum(frame_counts)
+
+
+def decode_packed(data: bytes) -> List[List[dict]]:
+    """解析傳輸用的二進位內容，回傳與 players 相同結構的影格清單"""
+    magic, version, field_count, player_count = _HEADER.unpack_from(data, 0)
+    if magic != PACKED_MAGIC or version != PACKED_VERSION or field_count != len(FRAME_FIELDS):
+        raise ValueError("unsupported packed light table")
+    offset = _HEADER.size
+    frame_counts = _from_bytes(data[offset:offset + 4 * player_count])
+    offset += 4 * player_count
+
+    players = []
+    for frame_count in frame_counts:
+        columns = {}
+        for field in FRAME_FIELDS:
+            columns[field] = data[offset:offset + 4 * frame_count]
+            offset += 4 * frame_count
+        players.append(unpack_columns(columns))
+    return players
+
+
+def packed_player_count(data: bytes) -> int:
+    return _HEADER.unpack_from(data, 0)[3]
+
+
+def packed_player_columns(data: bytes, player: int, start: int = 0, count: Optional[int] = None):
+    """
+    直接由傳輸用的二進位內容取出單一玩家一段影格的欄位位元組，不解析其他玩家
+    回傳 (玩家數, 欄位 -> 位元組)；player 超出範圍時回傳 (玩家數, None)
+    """
+    _, _, _, player_count = _HEADER.unpack_from(data, 0)
+    offset = _HEADER.size
+    frame_counts = _from_bytes(data[offset:offset + 4 * player_count])
+    if not 0 <= player < player_count:
+        return player_count, None
+
+    offset += 4 * player_count + 4 * len(FRAME_FIELDS) * sum(frame_counts[:player])
+    frame_count = frame_counts[player]
+    start = min(max(start, 0), frame_count)
+    end = frame_count if count is None else min(start + max(count, 0), frame_count)
+
+    columns = {}
+    for index, field in enumerate(FRAME_FIELDS):
+        column = offset + 4 * frame_count * index
+        columns[field] = data[column + 4 * start:column + 4 * end]
+    return player_count, columns
+
+
+def packed_player_frames(data: bytes, player: int, start: int = 0, count: Optional[int] = None):
+    """
+    直接由傳輸用的二進位內容取出單一玩家的一段影格，不解析其他玩家
+    回傳 (玩家數, 影格清單)；player 超出範圍時影格清單為空
+    """
+    player_count, columns = packed_player_columns(data, player, start, count)
+    return player_count, [] if columns is None else unpack_columns(columns)
@@ -0,0 +1,191 @@
+"""
+韌體用的 LED 影格編譯
+將光表版本中各部位的關鍵影格（PlayerData）依固定的 tick 展開為每塊板子的 LED 緩衝區，
+板子只需依序輸出，不必在微控制器上計算漸變
+
+輸入與前端編輯器的編碼相同（見 frontend/src/pages/Home.jsx）：
+- time：以 TIME_UNIT_MS 毫秒為單位
+- 顏色：0xRRGGBBXX，XX 的高 7 位元為亮度（0 ~ 127），最低位元為 1 時由此影格線性漸變到同部位的下一個影格
+漸變的計算與 timeline.py 的顏色查詢共用
+
+輸出：每位玩家（一塊板子）一段連續的位元組
+    tick i 位於 i * FRAME_BYTES，內容為 PICO_LED_COUNT 顆 LED 的 R, G, B, A（A 為 0 ~ 255 的亮度）
+    第一個影格之前、以及不在對應表內的 LED 皆為 0
+
+部位與 LED 的對應表（PICO_LED_MAP，JSON）：{"hat": [起始 LED, 結束 LED（不含）], ...}
+未設定時將 board 以外的部位依 PlayerData 的順序平均分配到所有 LED
+
+快取（collection_pico）：
+    version_id, config, player, start_tick, tick_count, total_ticks, data
+每份文件保存 PICO_CHUNK_TICKS 個 tick；config 為編譯設定的雜湊，設定變更後會自動重新編譯。
+第 0 段最後寫入，存在即表示該玩家已編譯完成。版本不會改變，因此快取不需失效，隨版本一起刪除（見 retention.py）
+
+環境變數：
+- PICO_TICK_MS：每個 tick 的毫秒數
+- PICO_LED_COUNT：每塊板子的 LED 數
+- PICO_LED_MAP：部位與 LED 範圍的對應表
+- PICO_CHUNK_TICKS：每份快取文件的 tick 數（單一文件不可超過 16MB BSON 上限）
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import weakref
+from typing import Dict, Optional
+
+import numpy as np
+from bson import Binary
+from starlette.concurrency import run_in_threadpool
+
+import cache
+import packing
+import storage
+import timeline
+from database import collection_pico
+
+PICO_TICK_MS = int(os.getenv('PICO_TICK_MS', '50'))
+PICO_LED_COUNT = int(os.getenv('PICO_LED_COUNT', '256'))
+PICO_CHUNK_TICKS = int(os.getenv('PICO_CHUNK_TICKS', '1024'))
+
+
+def default_led_map(led_count: int) -> Dict[str, list]:
+    parts = timeline.COLOR_PARTS
+    width = led_count // len(parts)
+    return {part: [index * width, (index + 1) * width] for index, part in enumerate(parts)}
+
+
+def _load_led_map(value: Optional[str], led_count: int) -> Dict[str, list]:
+    led_map = json.loads(value) if value else default_led_map(led_count)
+    for part, bounds in led_map.items():
+        if part not in packing.PART_FIELDS:
+            raise ValueError(f"PICO_LED_MAP: unknown part '{part}'")
+        if (not isinstance(bounds, list) or len(bounds) != 2
+                or not all(isinstance(bound, int) for bound in bounds)
+                or not 0 <= bounds[0] <= bounds[1] <= led_count):
+            raise ValueError(f"PICO_LED_MAP: invalid LED range for '{part}': {bounds}")
+    return led_map
+
+
+PICO_LED_MAP = _load_led_map(os.getenv('PICO_LED_MAP'), PICO_LED_COUNT)
+
+FRAME_BYTES = 4 * PICO_LED_COUNT
+MEDIA_TYPE = "application/octet-stream"
+
+# 影響輸出內容與分段方式的設定
+CONFIG = hashlib.sha1(json.dumps({
+    'tick_ms': PICO_TICK_MS,
+    'led_count': PICO_LED_COUNT,
+    'led_map': PICO_LED_MAP,
+    'chunk_ticks': PICO_CHUNK_TICKS,
+}, sort_keys=True).encode()).hexdigest()[:16]
+
+# 同一個 worker 中同時請求相同的玩家時只編譯一次；
+# 鎖在沒有任何請求持有或等待時自動移除，所有同時的請求必定取得同一個鎖
+_locks: 'weakref.WeakValueDictionary[tuple, asyncio.Lock]' = weakref.WeakValueDictionary()
+
+
+# ============================================================================
+# 編譯
+# ============================================================================
+
+def compile_player(columns: Dict[str, bytes]):
+    """
+    將單一玩家的欄位位元組編譯為各部位在每個 tick 的顏色（阻塞式，請在 threadpool 中執行）
+    回傳 (tick 數, 部位 -> (ticks, 4) 陣列)
+    """
+    times = np.frombuffer(columns['time'], dtype='<u4')
+    if len(times) == 0:
+        return 0, {}
+    order = np.argsort(times, kind='stable')
+    times = times[order].astype(np.float64)
+
+    total_ticks = int(times[-1] * timeline.TIME_UNIT_MS // PICO_TICK_MS) + 1
+    tick_times = np.arange(total_ticks, dtype=np.float64) * (PICO_TICK_MS / timeline.TIME_UNIT_MS)
+    parts = {
+        part: timeline.part_colors(times, np.frombuffer(columns[part], dtype='<u4')[order], tick_times)
+        for part in PICO_LED_MAP
+    }
+    return total_ticks, parts
+
+
+def render_ticks(parts: Dict[str, np.ndarray], start: int, end: int) -> bytes:
+    """將各部位的顏色依對應表展開為 tick [start, end) 的 LED 緩衝區"""
+    buffer = np.zeros((end - start, PICO_LED_COUNT, 4), dtype=np.uint8)
+    for part, (first, last) in PICO_LED_MAP.items():
+        buffer[:, first:last, :] = parts[part][start:end, None, :]
+    return buffer.tobytes()
+
+
+async def _compile(version_id, username: str, update_time: str, player: int) -> Optional[dict]:
+    """編譯並寫入單一玩家的所有分段，回傳第 0 段（不含 data）；玩家不存在時回傳 None"""
+    result = await cache.get_packed(username, update_time)
+    if result is None:
+        return None
+    _, columns = packing.packed_player_columns(result[1], player)
+    if columns is None:
+        return None
+
+    total_ticks, parts = await run_in_threadpool(compile_player, columns)
+    base = {'version_id': version_id, 'config': CONFIG, 'player': player}
+    # 舊設定的編譯結果不再使用
+    await collection_pico.delete_many(dict(base, config={'$ne': CONFIG}))
+
+    # 第 0 段最後寫入，讀取端看到第 0 段時其餘分段都已存在
+    starts = list(range(0, total_ticks, PICO_CHUNK_TICKS)) or [0]
+    for start in reversed(starts):
+        end = min(start + PICO_CHUNK_TICKS, total_ticks)
+        data = await run_in_threadpool(render_ticks, parts, start, end) if end > start else b''
+        document = dict(base, start_tick=start, tick_count=end - start, total_ticks=total_ticks, data=Binary(data))
+        await collection_pico.replace_one(dict(base, start_tick=start), document, upsert=True)
+    return dict(base, start_tick=0, total_ticks=total_ticks)
+
+
+async def find_compiled(username: str, update_time: str, player: int) -> Optional[dict]:
+    """
+    取得單一玩家的編譯結果資訊，尚未編譯時先編譯
+    找不到版本或玩家時回傳 None；數值超出 uint32 範圍時拋出 OverflowError
+    """
+    header = await storage.find_color_header(username, update_time)
+    if header is None:
+        return None
+    query = {'version_id': header['_id'], 'config': CONFIG, 'player': player, 'start_tick': 0}
+    projection = {'_id': 0, 'data': 0}
+
+    compiled = await collection_pico.find_one(query, projection)
+    if compiled is not None:
+        return compiled
+    key = (header['_id'], player)
+    lock = _locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        compiled = await collection_pico.find_one(query, projection)
+        if compiled is None:
+            compiled = await _compile(header['_id'], username, update_time, player)
+    return compiled
+
+
+def describe(compiled: dict) -> dict:
+    return {
+        'player': compiled['player'],
+        'tick_ms': PICO_TICK_MS,
+        'led_count': PICO_LED_COUNT,
+        'frame_bytes': FRAME_BYTES,
+        'tick_count': compiled['total_ticks'],
+        'size': compiled['total_ticks'] * FRAME_BYTES,
+        'led_map': PICO_LED_MAP,
+    }
+
+
+async def read_bytes(compiled: dict, start: int, end: int) -> bytes:
+    """讀取編譯結果的位元組範圍 [start, end)，只讀取與範圍重疊的分段"""
+    if end <= start:
+        return b''
+    first_tick = start // FRAME_BYTES // PICO_CHUNK_TICKS * PICO_CHUNK_TICKS
+    last_tick = (end - 1) // FRAME_BYTES
+    cursor = collection_pico.find({
+        'version_id': compiled['version_id'], 'config': CONFIG, 'player': compiled['player'],
+        'start_tick': {'$gte': first_tick, '$lte': last_tick},
+    }, {'_id': 0, 'data': 1}).sort('start_tick', 1)
+    data = b''.join([bytes(chunk['data']) for chunk in await cursor.to_list(length=None)])
+    offset = start - first_tick * FRAME_BYTES
+    return data[offset:offset + end - start]
@@ -0,0 +1,353 @@
+"""
+WebSocket 播放同步
+每位使用者有一個播放工作階段：版本只載入一次（使用 timeline.py 的區間索引），
+伺服器維護共用的播放時鐘，每 PLAYBACK_TICK_MS 計算一次所有玩家、所有部位的顏色，
+只把有改變的部位推送給所有訂閱的預覽畫面與板子，各端不再各自計時而逐漸不同步
+
+訊息（伺服器 -> 用戶端）：
+- 文字（JSON）：
+    {"type": "state", "user", "update_time", "playing", "position_ms", "duration_ms", "tick_ms",
+     "player_count", "parts", "server_time"}     載入、播放、暫停、跳轉時送出
+    {"type": "sync", "client_time", "position_ms", "server_time"}   回覆用戶端的 {"type": "sync", "client_time"}
+- 二進位（所有整數皆為 little-endian）：
+    type        uint8   0 = 完整畫面, 1 = 與上一個 tick 的差異
+    tick        uint32
+    position    uint32  播放位置（毫秒）
+    count       uint16
+    entries     count 個 (player uint16, part uint8, color uint32)
+    part 為 timeline.COLOR_PARTS 的索引，color 為 0xRRGGBBAA（A 為 0 ~ 255 的亮度）
+
+背壓：每個訂閱者有 PLAYBACK_QUEUE_FRAMES 個訊息的佇列，由各自的 task 送出；
+佇列滿時（用戶端太慢）清空佇列、丟棄過期的畫面，下一個 tick 改送 state 與完整畫面讓用戶端重新同步。
+event loop 忙碌而延遲時直接跳到目前時間，不補送過期的 tick。
+相同內容的訊息每個 tick 只編碼一次（全部玩家，或每位玩家各一份），數百個訂閱者只增加送出的成本
+
+閒置：最後一個訂閱者離線後立即停止推送（播放時鐘照常前進，有新的訂閱者時恢復推送），
+PLAYBACK_IDLE_SECONDS 秒內沒有新的訂閱者則移除工作階段，釋放載入的版本
+
+環境變數：
+- PLAYBACK_TICK_MS：推送間隔（毫秒）
+- PLAYBACK_QUEUE_FRAMES：每個訂閱者最多排隊的訊息數
+- PLAYBACK_IDLE_SECONDS：沒有訂閱者的工作階段保留秒數
+"""
+
+import asyncio
+import os
+import struct
+import time
+from typing import Dict, Optional, Set
+
+import numpy as np
+from fastapi import WebSocket
+
+import cache
+import timeline
+
+PLAYBACK_TICK_MS = int(os.getenv('PLAYBACK_TICK_MS', '50'))
+PLAYBACK_QUEUE_FRAMES = int(os.getenv('PLAYBACK_QUEUE_FRAMES', '8'))
+PLAYBACK_IDLE_SECONDS = float(os.getenv('PLAYBACK_IDLE_SECONDS', '60'))
+
+MESSAGE_FULL = 0
+MESSAGE_DELTA = 1
+
+_HEADER = struct.Struct('<BIIH')
+_ENTRY = np.dtype([('player', '<u2'), ('part', 'u1'), ('color', '<u4')])
+
+
+def encode_frame(kind: int, tick: int, position_ms: int, colors: np.ndarray,
+                 players: np.ndarray, parts: np.ndarray) -> bytes:
+    entries = np.empty(len(players), dtype=_ENTRY)
+    entries['player'] = players
+    entries['part'] = parts
+    entries['color'] = colors[players, parts]
+    return _HEADER.pack(kind, tick, position_ms, len(entries)) + entries.tobytes()
+
+
+class Subscriber:
+    """單一 WebSocket 連線；player 為 None 時接收所有玩家，否則只接收該玩家（板子）"""
+
+    def __init__(self, websocket: WebSocket, player: Optional[int] = None):
+        self.websocket = websocket
+        self.player = player
+        self.queue: asyncio.Queue = asyncio.Queue(PLAYBACK_QUEUE_FRAMES)
+        self.resync = True
+        self.dropped = 0
+
+    def offer(self, message) -> bool:
+        """排入訊息；佇列已滿時丟棄所有排隊中的訊息並要求重新同步，回傳是否排入"""
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.dropped += 1
+            self.resync = True
+            return False
+
+    async def send_loop(self):
+        """逐一送出佇列中的訊息，直到連線中斷"""
+        while True:
+            message = await self.queue.get()
+            if isinstance(message, bytes):
+                await self.websocket.send_bytes(message)
+            else:
+                await self.websocket.send_json(message)
+
+
+class Session:
+    """單一使用者的播放工作階段"""
+
+    def __init__(self, username: str):
+        self.username = username
+        self.update_time: Optional[str] = None
+        self.index = None
+        self.duration_ms = 0
+        self.playing = False
+        # 播放中的位置為 _position_ms + (現在 - _started_at)
+        self._position_ms = 0
+        self._started_at = 0.0
+        self.tick = 0
+        self.subscribers: Set[Subscriber] = set()
+        self._previous: Optional[np.ndarray] = None
+        self._task: Optional[asyncio.Task] = None
+        # 沒有訂閱者時排定的移除
+        self._idle: Optional[asyncio.TimerHandle] = None
+
+    # ------------------------------------------------------------------
+    # 時鐘與狀態
+    # ------------------------------------------------------------------
+
+    def position(self) -> int:
+        if not self.playing:
+            return self._position_ms
+        return self._position_ms + int((time.monotonic() - self._started_at) * 1000)
+
+    def state(self) -> dict:
+        return {
+            'type': 'state',
+            'user': self.username,
+            'update_time': self.update_time,
+            'playing': self.playing,
+            'position_ms': min(self.position(), self.duration_ms),
+            'duration_ms': self.duration_ms,
+            'tick_ms': PLAYBACK_TICK_MS,
+            'player_count': len(self.index) if self.index is not None else 0,
+            'parts': list(timeline.COLOR_PARTS),
+            'server_time': int(time.time() * 1000),
+        }
+
+    def sync(self, client_time) -> dict:
+        return {
+            'type': 'sync',
+            'client_time': client_time,
+            'position_ms': self.position(),
+            'server_time': int(time.time() * 1000),
+        }
+
+    # ------------------------------------------------------------------
+    # 控制
+    # ------------------------------------------------------------------
+
+    async def load(self, query_time: str) -> bool:
+        """
+        載入版本並回到開頭（暫停），找不到版本時回傳 False
+        數值超出 uint32 範圍時拋出 OverflowError
+        """
+        update_time = await cache.resolve_query_time('color', self.username, query_time)
+        index = None
+        if update_time is not None:
+            index = await timeline.get_index(self.username, update_time)
+        if index is None:
+            return False
+
+        self._stop()
+        self.update_time = update_time
+        self.index = index
+        last_times = [int(starts[-1]) for player in index for starts, _ in player.values() if len(starts)]
+        self.duration_ms = max(last_times, default=0) * timeline.TIME_UNIT_MS
+        self._position_ms = 0
+        self._previous = None
+        for subscriber in self.subscribers:
+            subscriber.resync = True
+        self._push_frame()
+        return True
+
+    def play(self, position_ms: Optional[int] = None):
+        if self.index is None:
+            raise ValueError("no version loaded")
+        if position_ms is not None:
+            self._position_ms = min(max(position_ms, 0), self.duration_ms)
+            self._started_at = time.monotonic()
+        elif not self.playing and self._position_ms >= self.duration_ms:
+            # 已播放到結尾時從頭開始
+            self._position_ms = 0
+        if not self.playing:
+            self._started_at = time.monotonic()
+            self.playing = True
+            self._start_ticks()
+        self._broadcast_state()
+
+    def pause(self):
+        self._position_ms = min(self.position(), self.duration_ms)
+        self._stop()
+        self._broadcast_state()
+        self._push_frame()
+
+    def seek(self, position_ms: int):
+        if self.index is None:
+            raise ValueError("no version loaded")
+        self._position_ms = min(max(position_ms, 0), self.duration_ms)
+        self._started_at = time.monotonic()
+        self._broadcast_state()
+        if not self.playing:
+            self._push_frame()
+
+    def _start_ticks(self):
+        if self._task is None and self.subscribers:
+            self._task = asyncio.create_task(self._run())
+
+    def _stop_ticks(self):
+        """停止推送，不改變播放狀態"""
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+        self._task = None
+
+    def _stop(self):
+        self._stop_ticks()
+        self.playing = False
+
+    # ------------------------------------------------------------------
+    # 訂閱
+    # ------------------------------------------------------------------
+
+    def subscribe(self, subscriber: Subscriber):
+        """加入訂閱者；下一次推送（暫停中則立即推送）會送出 state 與完整畫面"""
+        self.subscribers.add(subscriber)
+        subscriber.resync = True
+        if self._idle is not None:
+            self._idle.cancel()
+            self._idle = None
+        if self.index is None:
+            subscriber.offer(self.state())
+        elif self.playing:
+            self._start_ticks()
+        else:
+            self._push_frame([subscriber])
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    # ------------------------------------------------------------------
+    # 推送
+    # ------------------------------------------------------------------
+
+    def _broadcast_state(self):
+        state = self.state()
+        for subscriber in list(self.subscribers):
+            subscriber.offer(state)
+
+    def _push_frame(self, targets=None):
+        """計算目前位置的顏色，推送完整畫面或差異給訂閱者"""
+        if self.index is None:
+            return
+        targets = list(self.subscribers) if targets is None else targets
+        position = min(self.position(), self.duration_ms)
+        colors = timeline.to_uint32(timeline.query(self.index, np.array([position]))[:, 0])
+        previous = self._previous
+        self._previous = colors
+        self.tick += 1
+
+        if previous is None or previous.shape != colors.shape:
+            changed_players, changed_parts = np.nonzero(np.ones(colors.shape, dtype=bool))
+        else:
+            changed_players, changed_parts = np.nonzero(colors != previous)
+        all_players, all_parts = np.nonzero(np.ones(colors.shape, dtype=bool))
+
+        # 相同種類、相同玩家的訂閱者共用同一份訊息
+        messages: Dict[tuple, bytes] = {}
+        for subscriber in targets:
+            kind = MESSAGE_FULL if subscriber.resync else MESSAGE_DELTA
+            key = (kind, subscriber.player)
+            if key not in messages:
+                players, parts = (all_players, all_parts) if kind == MESSAGE_FULL else (changed_players, changed_parts)
+                if subscriber.player is not None:
+                    mask = players == subscriber.player
+                    players, parts = players[mask], parts[mask]
+                messages[key] = encode_frame(kind, self.tick, position, colors, players, parts)
+            if kind == MESSAGE_FULL:
+                subscriber.resync = False
+                subscriber.offer(self.state())
+            subscriber.offer(messages[key])
+
+    async def _run(self):
+        """播放中每 PLAYBACK_TICK_MS 推送一次，播放到結尾時暫停"""
+        interval = PLAYBACK_TICK_MS / 1000
+        next_tick = time.monotonic()
+        while self.playing:
+            if self.position() >= self.duration_ms:
+                self._position_ms = self.duration_ms
+                self._push_frame()
+                self._stop()
+                self._broadcast_state()
+                break
+            self._push_frame()
+            next_tick += interval
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                # 落後時跳過過期的 tick，由目前時間重新計算
+                next_tick = time.monotonic()
+                delay = 0
+            await asyncio.sleep(delay)
+
+
+# ============================================================================
+# 工作階段管理
+# ============================================================================
+
+_sessions: Dict[str, Session] = {}
+
+
+def get_session(username: str) -> Session:
+    session = _sessions.get(username)
+    if session is None:
+        session = _sessions[username] = Session(username)
+    return session
+
+
+def _remove(session: Session):
+    if _sessions.get(session.username) is session:
+        del _sessions[session.username]
+    session._stop()
+    if session._idle is not None:
+        session._idle.cancel()
+        session._idle = None
+
+
+def _expire(session: Session):
+    session._idle = None
+    if not session.subscribers:
+        _remove(session)
+
+
+def release_session(session: Session):
+    """
+    使用工作階段之後呼叫：沒有訂閱者時停止推送，未載入版本的工作階段立即移除，
+    否則 PLAYBACK_IDLE_SECONDS 秒後移除（期間有新的訂閱者則取消）
+    """
+    if session.subscribers or _sessions.get(session.username) is not session:
+        return
+    session._stop_ticks()
+    if session.index is None:
+        _remove(session)
+        return
+    if session._idle is not None:
+        session._idle.cancel()
+    session._idle = asyncio.get_running_loop().call_later(PLAYBACK_IDLE_SECONDS, _expire, session)
+
+
+def stop_all():
+    """關閉時停止所有播放"""
+    for session in list(_sessions.values()):
+        _remove(session)
@@ -0,0 +1,168 @@
+"""
+版本保留與清除
+依保留規則刪除過舊的光表版本，連同其分塊、patch、韌體編譯結果與相同時間的原始資料
+
+保留規則（依使用者分別計算，版本以 user + update_time 識別）：
+- 最新的 RETENTION_KEEP_LAST 個版本一律保留
+- 有 pinned 或 tag 標記的版本一律保留（見 /api/versions/{query_time}/pin）
+- 其餘版本在 RETENTION_DAILY_DAYS 天內每天保留最新一個，
+  在 RETENTION_WEEKLY_WEEKS 週內每週保留最新一個，更舊的刪除
+
+被保留的增量版本若以將被刪除的版本為基準，會先轉為完整版本再刪除基準版本
+"""
+
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set
+
+from database import collection_color, collection_color_chunks, collection_color_patches, collection_pico, collection_raw
+import cache
+import catalog
+import storage
+
+RETENTION_KEEP_LAST = int(os.getenv('RETENTION_KEEP_LAST', '5'))
+RETENTION_DAILY_DAYS = int(os.getenv('RETENTION_DAILY_DAYS', '7'))
+RETENTION_WEEKLY_WEEKS = int(os.getenv('RETENTION_WEEKLY_WEEKS', '8'))
+
+# 背景清除間隔（秒），0 表示停用，只能透過管理端點執行
+RETENTION_INTERVAL = int(os.getenv('RETENTION_INTERVAL', '0'))
+
+TIME_FORMAT = "%Y-%m-%d-%H:%M:%S"
+
+
+def _parse_time(update_time: str) -> Optional[datetime]:
+    try:
+        return datetime.strptime(update_time, TIME_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+def select_expired(versions: Iterable[dict], now: datetime,
+                   keep_last: int = RETENTION_KEEP_LAST,
+                   daily_days: int = RETENTION_DAILY_DAYS,
+                   weekly_weeks: int = RETENTION_WEEKLY_WEEKS) -> Set[str]:
+    """
+    依保留規則挑出要刪除的版本
+    versions 為同一使用者的 {update_time, pinned, tag}，回傳要刪除的 update_time
+    """
+    ordered = sorted(versions, key=lambda v: v['update_time'], reverse=True)
+    used_buckets = set()
+    expired = set()
+
+    for index, version in enumerate(ordered):
+        if version.get('pinned') or version.get('tag'):
+            continue
+        time = _parse_time(version['update_time'])
+        if time is None:
+            # 無法判斷時間的版本不刪除
+            continue
+
+        age = now - time
+        if age <= timedelta(days=daily_days):
+            bucket = ('day', time.date())
+        elif age <= timedelta(weeks=weekly_weeks):
+            bucket = ('week', tuple(time.isocalendar())[:2])
+        else:
+            bucket = None
+
+        if index < keep_last:
+            if bucket is not None:
+                used_buckets.add(bucket)
+            continue
+        if bucket is None or bucket in used_buckets:
+            expired.add(version['update_time'])
+        else:
+            used_buckets.add(bucket)
+
+    return expired
+
+
+async def _bson_size(collection, query: dict) -> int:
+    cursor = await collection.aggregate([
+        {'$match': query},
+        {'$group': {'_id': None, 'bytes': {'$sum': {'$bsonSize': '$$ROOT'}}}},
+    ])
+    result = await cursor.to_list(length=1)
+    return result[0]['bytes'] if result else 0
+
+
+async def _list_user_versions(user: str) -> List[dict]:
+    """合併 collection_color 與 collection_raw 的版本清單"""
+    versions: Dict[str, dict] = {}
+    projection = {'_id': 0, 'update_time': 1, 'pinned': 1, 'tag': 1}
+    for collection in (collection_color, collection_raw):
+        cursor = collection.find({'user': user}, projection)
+        for entry in await cursor.to_list(length=None):
+            version = versions.setdefault(entry['update_time'], {'update_time': entry['update_time']})
+            version['pinned'] = version.get('pinned') or entry.get('pinned', False)
+            version['tag'] = version.get('tag') or entry.get('tag')
+    return list(versions.values())
+
+
+async def _detach_children(collection, compact, expired_ids: Set) -> int:
+    """將以被刪除版本為基準、但本身被保留的增量版本轉為完整版本"""
+    count = 0
+    cursor = collection.find({'base_id': {'$in': list(expired_ids)}}, {'_id': 1})
+    for entry in await cursor.to_list(length=None):
+        if entry['_id'] not in expired_ids:
+            await compact(await collection.find_one({'_id': entry['_id']}))
+            count += 1
+    return count
+
+
+async def expire_user_versions(user: str, now: datetime, dry_run: bool = False) -> dict:
+    """清除單一使用者過期的版本，回傳清除報告"""
+    expired_times = select_expired(await _list_user_versions(user), now)
+    report = {'user': user, 'versions': sorted(expired_times), 'documents': 0, 'bytes': 0, 'compacted': 0}
+    if not expired_times:
+        return report
+
+    query = {'user': user, 'update_time': {'$in': list(report['versions'])}}
+    color_ids = {d['_id'] for d in await collection_color.find(query, {'_id': 1}).to_list(length=None)}
+    raw_ids = {d['_id'] for d in await collection_raw.find(query, {'_id': 1}).to_list(length=None)}
+
+    targets = [
+        (collection_color, {'_id': {'$in': list(color_ids)}}),
+        (collection_color_chunks, {'version_id': {'$in': list(color_ids)}}),
+        (collection_color_patches, {'version_id': {'$in': list(color_ids)}}),
+        (collection_pico, {'version_id': {'$in': list(color_ids)}}),
+        (collection_raw, {'_id': {'$in': list(raw_ids)}}),
+    ]
+    for collection, target_query in targets:
+        report['bytes'] += await _bson_size(collection, target_query)
+        report['documents'] += await collection.count_documents(target_query)
+    if dry_run:
+        return report
+
+    report['compacted'] += await _detach_children(collection_color, storage.compact_color_version, color_ids)
+    report['compacted'] += await _detach_children(collection_raw, storage.compact_raw_version, raw_ids)
+
+    # 先刪除表頭，讀取端不會看到缺少分塊的版本
+    for collection, target_query in targets:
+        await collection.delete_many(target_query)
+    await catalog.remove_versions(user, expired_times)
+    cache.invalidate_user(user)
+    return report
+
+
+async def run_retention(user: Optional[str] = None, dry_run: bool = False) -> dict:
+    """
+    對所有（或指定）使用者執行版本清除
+    回傳總計的版本數、文件數與釋放的位元組（BSON 大小）
+    """
+    now = datetime.now()
+    if user is None:
+        users = set(await collection_color.distinct('user')) | set(await collection_raw.distinct('user'))
+    else:
+        users = {user}
+
+    reports = [await expire_user_versions(name, now, dry_run) for name in sorted(users)]
+    reports = [report for report in reports if report['versions']]
+    return {
+        'dry_run': dry_run,
+        'versions_deleted': sum(len(report['versions']) for report in reports),
+        'documents_deleted': sum(report['documents'] for report in reports),
+        'bytes_freed': sum(report['bytes'] for report in reports),
+        'compacted': sum(report['compacted'] for report in reports),
+        'users': reports,
+    }
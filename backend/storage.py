@@ -0,0 +1,530 @@
+"""
+燈光表版本儲存格式
+此檔案負責 collection_color / collection_raw 版本資料的寫入與重組
+
+儲存格式（schema 2）：
+- 表頭文件（collection_color）：user, update_time, schema, player_count, frame_counts, chunk_frames
+  不含 players 欄位，因此時間清單等查詢只會讀到很小的文件
+- 分塊文件（collection_color_chunks）：version_id, player, chunk, start, end, columns
+  每位玩家的影格依 chunk_frames 切成多段，單一文件不會接近 16MB BSON 上限
+  columns 為欄式 uint32 壓縮格式（見 packing.py）；數值超出 uint32 範圍時改存 frames 影格清單
+
+增量版本（patch）：
+- 表頭另有 base_id 與 depth（距完整版本的層數），不含分塊
+- patch 內容存於 collection_color_patches：version_id, player_count, ops（格式見 delta.py）
+- 讀取時由基準版本重組；compact_deltas 會將過深的增量版本轉為完整的分塊版本
+- collection_raw 的增量版本以 base_id, depth, ops 取代 raw_data
+
+舊格式（整份 players 存在同一文件）仍可讀取，可用 migrate_color.py 轉換
+"""
+
+import os
+from typing import Optional
+
+import bson
+from bson import ObjectId
+
+import catalog
+import database
+import delta
+import packing
+from database import collection_color, collection_color_chunks, collection_color_patches, collection_raw
+
+SCHEMA_CHUNKED = 2
+
+# 每個分塊文件最多包含的影格數
+COLOR_CHUNK_FRAMES = int(os.getenv('COLOR_CHUNK_FRAMES', '1000'))
+
+# 增量版本距完整版本達此層數時，由 compact_deltas 轉為完整版本
+DELTA_MAX_DEPTH = int(os.getenv('DELTA_MAX_DEPTH', '8'))
+
+
+def is_chunked(header: dict) -> bool:
+    return header.get('schema') == SCHEMA_CHUNKED
+
+
+def is_delta(header: dict) -> bool:
+    return 'base_id' in header
+
+
+def frame_count(player) -> int:
+    """
+    玩家的影格數
+    player 可為影格清單，或 ingest.py 解析出的欄位 -> uint32 陣列
+    """
+    if isinstance(player, dict):
+        return len(player['time'])
+    return len(player)
+
+
+def chunk_content(player, start: int, end: int) -> dict:
+    if isinstance(player, dict):
+        return {'columns': packing.to_bson_columns(packing.pack_arrays(player, start, end))}
+    part = player[start:end]
+    if packing.fits_uint32(part):
+        return {'columns': packing.to_bson_columns(packing.pack_columns(part))}
+    return {'frames': part}
+
+
+def split_players(players: list, chunk_frames: int = COLOR_CHUNK_FRAMES):
+    """將 players 切成分塊文件（尚未填入 version_id）"""
+    chunks = []
+    for player_index, player in enumerate(players):
+        total = frame_count(player)
+        for chunk_index, start in enumerate(range(0, total, chunk_frames)):
+            end = min(start + chunk_frames, total)
+            chunk = {
+                'player': player_index,
+                'chunk': chunk_index,
+                'start': start,
+                'end': end,
+            }
+            chunk.update(chunk_content(player, start, end))
+            chunks.append(chunk)
+    return chunks
+
+
+def chunk_frames(chunk: dict) -> list:
+    """取得分塊的影格清單"""
+    if 'columns' in chunk:
+        return packing.unpack_columns(chunk['columns'])
+    return chunk['frames']
+
+
+def chunk_columns(chunk: dict) -> dict:
+    """取得分塊的欄式資料；舊的影格清單分塊會即時轉換，數值超出範圍時拋出 OverflowError"""
+    if 'columns' in chunk:
+        return chunk['columns']
+    return packing.pack_columns(chunk['frames'])
+
+
+def build_header(user: str, update_time: str, players: list,
+                 chunk_frames: int = COLOR_CHUNK_FRAMES) -> dict:
+    return {
+        'user': user,
+        'update_time': update_time,
+        'schema': SCHEMA_CHUNKED,
+        'player_count': len(players),
+        'frame_counts': [frame_count(player) for player in players],
+        'chunk_frames': chunk_frames,
+    }
+
+
+async def save_color_version(user: str, update_time: str, players: list):
+    """
+    以分塊格式寫入一個版本
+    players 的每位玩家可為影格清單，或 ingest.py 解析出的 uint32 陣列
+    先寫入分塊再寫入表頭，表頭可見時所有分塊必定已存在
+    """
+    header = build_header(user, update_time, players)
+    header['_id'] = ObjectId()
+
+    chunks = await _write_chunks(header['_id'], players)
+    await database.insert_version(collection_color, header)
+    await catalog.record_version(header, _bson_size([header] + chunks))
+    return header
+
+
+def _bson_size(documents: list) -> int:
+    return sum(len(bson.encode(document)) for document in documents)
+
+
+async def _write_chunks(version_id, players: list, replace: bool = False) -> list:
+    """寫入版本的分塊並回傳；replace 時先清除既有分塊，確保中斷後可重複執行"""
+    if replace:
+        await collection_color_chunks.delete_many({'version_id': version_id})
+    chunks = split_players(players)
+    for chunk in chunks:
+        chunk['version_id'] = version_id
+    if chunks:
+        await collection_color_chunks.insert_many(chunks, ordered=False)
+    return chunks
+
+
+def slice_content(content: dict, start: int, end: int) -> dict:
+    """取出分塊內容（columns 或 frames）中 [start, end) 的影格"""
+    if 'columns' in content:
+        return {'columns': {
+            field: bytes(data[4 * start:4 * end]) for field, data in content['columns'].items()
+        }}
+    return {'frames': content['frames'][start:end]}
+
+
+async def save_staged_version(header: dict, parts) -> dict:
+    """
+    由分段上傳的內容寫入一個完整版本（見 uploads.py）
+    header 需已包含 _id 與 frame_counts；parts 為依 player, start 排序且連續的
+    {player, start, end, columns | frames} async iterator，每次只處理一段
+    先清除同一 _id 的分塊再寫入，中斷後可重複執行；表頭最後寫入
+    """
+    await collection_color_chunks.delete_many({'version_id': header['_id']})
+    size = _bson_size([header])
+    chunk_index = {}
+    async for part in parts:
+        chunks = []
+        for offset in range(0, part['end'] - part['start'], COLOR_CHUNK_FRAMES):
+            end = min(offset + COLOR_CHUNK_FRAMES, part['end'] - part['start'])
+            index = chunk_index.get(part['player'], 0)
+            chunk_index[part['player']] = index + 1
+            chunk = {
+                'version_id': header['_id'],
+                'player': part['player'],
+                'chunk': index,
+                'start': part['start'] + offset,
+                'end': part['start'] + end,
+            }
+            content = slice_content(part, offset, end)
+            if 'columns' in content:
+                content['columns'] = packing.to_bson_columns(content['columns'])
+            chunk.update(content)
+            chunks.append(chunk)
+        if chunks:
+            await collection_color_chunks.insert_many(chunks, ordered=False)
+            size += _bson_size(chunks)
+
+    await database.insert_version(collection_color, header)
+    await catalog.record_version(header, size)
+    return header
+
+
+async def find_color_header(username: str, query_time: str):
+    """取得版本表頭；舊格式文件會排除 players 欄位"""
+    return await database.find_version(collection_color, username, query_time, {'players': 0})
+
+
+async def _load_chunks(version_id, player: Optional[int] = None,
+                       start: int = 0, end: Optional[int] = None):
+    query = {'version_id': version_id}
+    if player is not None:
+        query['player'] = player
+    if start > 0:
+        query['end'] = {'$gt': start}
+    if end is not None:
+        query['start'] = {'$lt': end}
+    cursor = collection_color_chunks.find(
+        query, {'_id': 0, 'player': 1, 'start': 1, 'frames': 1, 'columns': 1}
+    )
+    return await cursor.sort([('player', 1), ('start', 1)]).to_list(length=None)
+
+
+async def iter_chunks(version_id, batch_size: int = 16):
+    """依玩家、起始影格順序逐一讀取版本的分塊，不一次載入整個版本"""
+    cursor = collection_color_chunks.find(
+        {'version_id': version_id}, {'_id': 0, 'player': 1, 'start': 1, 'frames': 1, 'columns': 1}
+    ).sort([('player', 1), ('start', 1)]).batch_size(batch_size)
+    async for chunk in cursor:
+        yield chunk
+
+
+async def _find_header_by_id(version_id):
+    return await collection_color.find_one({'_id': version_id}, {'players': 0})
+
+
+async def _load_patch(header: dict):
+    patch = await collection_color_patches.find_one({'version_id': header['_id']})
+    ops = [
+        {'player': op['player'], 'start': op['start'], 'end': op['end'], 'frames': chunk_frames(op)}
+        for op in patch['ops']
+    ]
+    return patch.get('player_count'), ops
+
+
+async def _load_players(header: dict) -> list:
+    """取得版本所有玩家的影格清單，增量版本會由基準版本重組"""
+    if is_delta(header):
+        base = await _find_header_by_id(header['base_id'])
+        player_count, ops = await _load_patch(header)
+        return delta.apply_color_ops(await _load_players(base), player_count, ops)
+
+    if not is_chunked(header):
+        document = await collection_color.find_one({'_id': header['_id']}, {'players': 1})
+        return document.get('players') or []
+
+    players = [[] for _ in range(header['player_count'])]
+    for chunk in await _load_chunks(header['_id']):
+        players[chunk['player']].extend(chunk_frames(chunk))
+    return players
+
+
+async def load_player(header: dict, player: int) -> list:
+    """取得版本中單一玩家的影格清單，玩家不存在時回傳空清單"""
+    if is_delta(header):
+        player_count, ops = await _load_patch(header)
+        frames = []
+        if player_count is None or player < player_count:
+            base = await _find_header_by_id(header['base_id'])
+            frames = await load_player(base, player)
+        return delta.apply_player_ops(frames, player, ops)
+
+    if not is_chunked(header):
+        result = await database.find_player_frames(
+            collection_color, header['user'], header['update_time'], player
+        )
+        return result[1] if result else []
+
+    frames = []
+    for chunk in await _load_chunks(header['_id'], player):
+        frames.extend(chunk_frames(chunk))
+    return frames
+
+
+async def load_color_version(username: str, query_time: str):
+    """
+    取得完整版本，回傳與舊格式相同的文件結構（_id, user, update_time, players）
+    找不到時回傳 None
+    """
+    header = await find_color_header(username, query_time)
+    if header is None:
+        return None
+    if not is_chunked(header):
+        document = await database.find_version(collection_color, username, header['update_time'])
+        players = document.get('players') or []
+    else:
+        players = await _load_players(header)
+
+    return {
+        '_id': header['_id'],
+        'user': header['user'],
+        'update_time': header['update_time'],
+        'players': players,
+    }
+
+
+async def load_player_frames(username: str, query_time: str, player: int,
+                             start: int = 0, count: Optional[int] = None):
+    """
+    取得單一玩家的影格（可指定範圍），只讀取與範圍重疊的分塊
+    回傳 None 表示找不到版本，否則回傳 (玩家總數, 影格清單)
+    """
+    header = await find_color_header(username, query_time)
+    if header is None:
+        return None
+    return await load_header_player_frames(header, player, start=start, count=count)
+
+
+async def load_header_player_frames(header: dict, player: int, start: int = 0, count: Optional[int] = None):
+    """同 load_player_frames，由已取得的表頭讀取"""
+    if not is_chunked(header):
+        return await database.find_player_frames(
+            collection_color, header['user'], header['update_time'], player, start=start, count=count
+        )
+
+    player_count = header['player_count']
+    if not 0 <= player < player_count:
+        return player_count, []
+
+    end = None if count is None else start + count
+    if is_delta(header):
+        frames = await load_player(header, player)
+        return player_count, frames[start:end]
+
+    frames = []
+    first_start = None
+    for chunk in await _load_chunks(header['_id'], player, start, end):
+        if first_start is None:
+            first_start = chunk['start']
+        frames.extend(chunk_frames(chunk))
+
+    if first_start is None:
+        return player_count, []
+    offset = start - first_start
+    return player_count, frames[offset:] if end is None else frames[offset:end - first_start]
+
+
+async def load_packed_version(username: str, query_time: str):
+    """
+    取得版本的二進位壓縮內容（格式見 packing.py），直接串接分塊中已壓縮的欄位
+    找不到時回傳 None，否則回傳 (表頭, 位元組)
+    """
+    header = await find_color_header(username, query_time)
+    if header is None:
+        return None
+
+    if not is_chunked(header):
+        document = await database.find_version(collection_color, username, header['update_time'])
+        players = document.get('players') or []
+        players_columns = [packing.pack_columns(frames) for frames in players]
+        return header, packing.encode_packed(players_columns, [len(frames) for frames in players])
+
+    players_columns = [
+        {field: bytearray() for field in packing.FRAME_FIELDS}
+        for _ in range(header['player_count'])
+    ]
+    if is_delta(header):
+        players = await _load_players(header)
+        players_columns = [packing.pack_columns(frames) for frames in players]
+        return header, packing.encode_packed(players_columns, header['frame_counts'])
+
+    for chunk in await _load_chunks(header['_id']):
+        columns = chunk_columns(chunk)
+        target = players_columns[chunk['player']]
+        for field in packing.FRAME_FIELDS:
+            target[field] += columns[field]
+
+    return header, packing.encode_packed(players_columns, header['frame_counts'])
+
+
+# ============================================================================
+# 舊格式轉換
+# ============================================================================
+
+async def migrate_legacy_version(document: dict, dry_run: bool = False) -> int:
+    """
+    將單一舊格式文件轉為分塊格式，沿用原本的 _id 作為表頭
+    回傳寫入的分塊數量
+    """
+    players = document.get('players') or []
+    if dry_run:
+        return len(split_players(players))
+
+    chunks = await _write_chunks(document['_id'], players, replace=True)
+
+    header = build_header(document['user'], document['update_time'], players)
+    await collection_color.update_one(
+        {'_id': document['_id']},
+        {'$set': header, '$unset': {'players': ''}}
+    )
+    await catalog.record_version(header, _bson_size([header] + chunks))
+    return len(chunks)
+
+
+# ============================================================================
+# 增量版本（patch）
+# ============================================================================
+
+async def _frame_counts(header: dict) -> list:
+    if is_chunked(header):
+        return header['frame_counts']
+    return [len(frames) for frames in await _load_players(header)]
+
+
+async def save_color_patch(user: str, update_time: str, base: dict,
+                           player_count: Optional[int], ops: list):
+    """
+    以 patch 形式寫入一個相對於 base 表頭的新版本
+    ops 的 frames 為 ingest.py 解析後的玩家資料；與基準版本不符時拋出 delta.PatchError
+    """
+    frame_counts = delta.check_color_ops(
+        await _frame_counts(base), player_count,
+        [dict(op, length=frame_count(op['frames'])) for op in ops]
+    )
+
+    header = {
+        '_id': ObjectId(),
+        'user': user,
+        'update_time': update_time,
+        'schema': SCHEMA_CHUNKED,
+        'player_count': len(frame_counts),
+        'frame_counts': frame_counts,
+        'chunk_frames': COLOR_CHUNK_FRAMES,
+        'base_id': base['_id'],
+        'depth': base.get('depth', 0) + 1,
+    }
+    patch = {
+        'version_id': header['_id'],
+        'player_count': player_count,
+        'ops': [
+            dict(
+                {'player': op['player'], 'start': op['start'], 'end': op['end']},
+                **chunk_content(op['frames'], 0, frame_count(op['frames']))
+            )
+            for op in ops
+        ],
+    }
+    await collection_color_patches.insert_one(patch)
+    await database.insert_version(collection_color, header)
+    await catalog.record_version(header, _bson_size([header, patch]))
+    return header
+
+
+async def compact_color_version(header: dict):
+    """將增量版本重組後寫為完整的分塊版本，沿用原本的 _id"""
+    players = await _load_players(header)
+    chunks = await _write_chunks(header['_id'], players, replace=True)
+    await collection_color.update_one(
+        {'_id': header['_id']},
+        {
+            '$set': {'frame_counts': [len(frames) for frames in players], 'depth': 0},
+            '$unset': {'base_id': ''},
+        }
+    )
+    await collection_color_patches.delete_one({'version_id': header['_id']})
+
+    header = await _find_header_by_id(header['_id'])
+    await catalog.record_version(header, _bson_size([header] + chunks))
+
+
+async def _load_raw_text(document: dict) -> str:
+    if 'base_id' not in document:
+        return document['raw_data']
+    base = await collection_raw.find_one({'_id': document['base_id']})
+    return delta.apply_text_ops(await _load_raw_text(base), document['ops'])
+
+
+async def load_raw_version(username: str, query_time: str):
+    """取得原始資料版本，增量版本會重組出 raw_data；找不到時回傳 None"""
+    document = await database.find_version(collection_raw, username, query_time)
+    if document is None:
+        return None
+    # 只回傳版本內容，pinned / tag 等可變的標記不包含在內（回應可長期快取）
+    return {
+        '_id': document['_id'],
+        'user': document['user'],
+        'update_time': document['update_time'],
+        'raw_data': await _load_raw_text(document),
+    }
+
+
+async def save_raw_patch(user: str, update_time: str, base: dict, ops: list):
+    """以 patch 形式寫入原始資料版本；與基準版本不符時拋出 delta.PatchError"""
+    delta.apply_text_ops(await _load_raw_text(base), ops)
+    document = {
+        'user': user,
+        'update_time': update_time,
+        'base_id': base['_id'],
+        'depth': base.get('depth', 0) + 1,
+        'ops': [{'start': op['start'], 'end': op['end'], 'text': op['text']} for op in ops],
+    }
+    await database.insert_version(collection_raw, document)
+    return document
+
+
+async def compact_raw_version(document: dict):
+    raw_data = await _load_raw_text(document)
+    await collection_raw.update_one(
+        {'_id': document['_id']},
+        {'$set': {'raw_data': raw_data, 'depth': 0}, '$unset': {'base_id': '', 'ops': ''}}
+    )
+
+
+async def _chain_depth(collection, document: dict) -> int:
+    """實際距完整版本的層數（基準版本被轉換後，記錄的 depth 可能偏大）"""
+    depth = 0
+    while 'base_id' in document:
+        depth += 1
+        document = await collection.find_one({'_id': document['base_id']}, {'base_id': 1})
+    return depth
+
+
+async def compact_deltas(max_depth: int = DELTA_MAX_DEPTH):
+    """
+    將距完整版本達 max_depth 層的增量版本轉為完整版本
+    依 update_time 由舊到新處理，回傳轉換的 (光表, 原始資料) 版本數
+    """
+    query = {'base_id': {'$exists': True}, 'depth': {'$gte': max_depth}}
+    counts = []
+
+    for collection, compact in ((collection_color, compact_color_version),
+                                (collection_raw, compact_raw_version)):
+        count = 0
+        cursor = collection.find(query, {'_id': 1, 'base_id': 1}).sort('update_time', 1)
+        for entry in await cursor.to_list(length=None):
+            depth = await _chain_depth(collection, entry)
+            if depth < max_depth:
+                await collection.update_one({'_id': entry['_id']}, {'$set': {'depth': depth}})
+                continue
+            await compact(await collection.find_one({'_id': entry['_id']}))
+            count += 1
+        counts.append(count)
+
+    return tuple(counts)
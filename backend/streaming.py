@@ -0,0 +1,98 @@
+"""
+光表版本的串流 JSON 輸出
+不建立完整的文件與 JSON 字串，依玩家、分塊逐段輸出，記憶體用量與版本大小無關
+
+輸出內容與 /items/{username}/{query_time} 一般回應的 JSON 完全相同（包含空白與鍵的順序），
+因此可共用相同的 ETag
+"""
+
+import json
+from typing import AsyncIterator, Iterable, Optional
+
+import packing
+import storage
+
+# 與 JSONResponse 相同的緊湊格式
+_FRAME_TEMPLATE = "{" + ",".join(f'"{field}":%d' for field in packing.FRAME_FIELDS) + "}"
+
+
+def _json(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def rows_json(rows: Iterable[tuple]) -> str:
+    """將依 FRAME_FIELDS 順序排列的數值 tuple 轉為以逗號分隔的影格 JSON"""
+    return ",".join(_FRAME_TEMPLATE % row for row in rows)
+
+
+def _frames_json(frames: list) -> str:
+    return rows_json(tuple(frame[field] for field in packing.FRAME_FIELDS) for frame in frames)
+
+
+def _chunk_json(chunk: dict) -> str:
+    if 'columns' in chunk:
+        return rows_json(packing.unpack_rows(chunk['columns']))
+    return _frames_json(chunk['frames'])
+
+
+async def _iter_chunked_players(header: dict) -> AsyncIterator[str]:
+    """完整分塊版本：單一 cursor 依序讀取分塊，一次只保留一個分塊"""
+    current = -1
+    first_frame = True
+    async for chunk in storage.iter_chunks(header['_id']):
+        # 沒有影格的玩家沒有分塊，補上空陣列
+        while current < chunk['player']:
+            yield ("]," if current >= 0 else "") + "["
+            current += 1
+            first_frame = True
+        content = _chunk_json(chunk)
+        if content:
+            yield content if first_frame else "," + content
+            first_frame = False
+    while current < header['player_count'] - 1:
+        yield ("]," if current >= 0 else "") + "["
+        current += 1
+    if current >= 0:
+        yield "]"
+
+
+async def _iter_players_one_by_one(header: dict, player_count: int) -> AsyncIterator[str]:
+    """增量與舊格式版本：逐位玩家重組，一次只保留一位玩家的影格"""
+    for player in range(player_count):
+        frames = await storage.load_player(header, player)
+        yield ("," if player else "") + "[" + _frames_json(frames) + "]"
+
+
+async def _legacy_player_count(header: dict) -> int:
+    result = await storage.load_player_frames(header['user'], header['update_time'], 0, count=1)
+    return result[0] if result else 0
+
+
+async def iter_color_version(username: str, query_time: str) -> Optional[AsyncIterator[bytes]]:
+    """
+    回傳逐段輸出版本 JSON 的 async iterator，找不到版本時回傳 None
+    表頭在呼叫時讀取，因此找不到版本可在開始回應前得知
+    """
+    header = await storage.find_color_header(username, query_time)
+    if header is None:
+        return None
+
+    if storage.is_chunked(header) and not storage.is_delta(header):
+        players = _iter_chunked_players(header)
+    elif storage.is_chunked(header):
+        players = _iter_players_one_by_one(header, header['player_count'])
+    else:
+        players = _iter_players_one_by_one(header, await _legacy_player_count(header))
+
+    async def generate():
+        yield (
+            '{"_id":' + _json(str(header['_id']))
+            + ',"user":' + _json(header['user'])
+            + ',"update_time":' + _json(header['update_time'])
+            + ',"players":['
+        ).encode()
+        async for part in players:
+            yield part.encode()
+        yield b"]}"
+
+    return generate()
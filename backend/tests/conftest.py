@@ -0,0 +1,181 @@
+"""
+測試共用設定
+需要資料庫的測試以 mongomock 在記憶體中執行：匯入 database.py 之前將 pymongo.AsyncMongoClient
+換成包裝 mongomock 的非同步介面，測試不需要 MongoDB 伺服器。
+mongomock 沒有 $bsonSize，在此以 bson.encode 補上。
+"""
+
+import os
+import shutil
+import tempfile
+
+import bson
+import mongomock
+import mongomock.aggregate
+import pymongo
+import pytest
+
+os.environ.setdefault('MUSIC_FILE_PATH', tempfile.mkdtemp(prefix='lightdance-music-'))
+os.environ.setdefault('AUTH_SECRET', 'test-secret')
+
+
+# ============================================================================
+# mongomock 的非同步介面
+# ============================================================================
+
+class FakeCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def skip(self, count):
+        self._cursor = self._cursor.skip(count)
+        return self
+
+    def limit(self, count):
+        self._cursor = self._cursor.limit(count)
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    async def to_list(self, length=None):
+        return list(self._cursor)
+
+    async def explain(self):
+        return {'queryPlanner': {'winningPlan': {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN'}}}}
+
+    async def close(self):
+        pass
+
+    def __aiter__(self):
+        self._iterator = iter(self._cursor)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    def __init__(self, collection):
+        self._collection = collection
+        self.name = collection.name
+
+    def find(self, *args, **kwargs):
+        return FakeCursor(self._collection.find(*args, **kwargs))
+
+    async def aggregate(self, pipeline, **kwargs):
+        return FakeCursor(iter(list(self._collection.aggregate(pipeline))))
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+class FakeDatabase:
+    def __init__(self, database):
+        self._database = database
+
+    def __getitem__(self, name):
+        return FakeCollection(self._database[name])
+
+    async def command(self, *args, **kwargs):
+        return {'ok': 1}
+
+    async def list_collection_names(self):
+        return self._database.list_collection_names()
+
+
+class FakeAsyncMongoClient:
+    def __init__(self, *args, **kwargs):
+        self._client = mongomock.MongoClient()
+        self.admin = FakeDatabase(self._client.admin)
+
+    def __getitem__(self, name):
+        return FakeDatabase(self._client[name])
+
+    async def close(self):
+        pass
+
+
+def _handle_type_operator(parser, operator, values, original=mongomock.aggregate._Parser._handle_type_operator):
+    if operator == '$bsonSize':
+        return len(bson.encode(parser.parse(values)))
+    return original(parser, operator, values)
+
+
+mongomock.aggregate.type_operators.append('$bsonSize')
+mongomock.aggregate._Parser._handle_type_operator = _handle_type_operator
+pymongo.AsyncMongoClient = FakeAsyncMongoClient
+
+
+# ============================================================================
+# fixtures
+# ============================================================================
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    """每個測試前清空資料庫、音樂目錄與各模組的記憶體快取"""
+    import auth
+    import cache
+    import database
+
+    for name in database.db._database.list_collection_names():
+        database.db._database[name].delete_many({})
+    music_path = os.environ['MUSIC_FILE_PATH']
+    for name in os.listdir(music_path):
+        shutil.rmtree(os.path.join(music_path, name))
+    cache.version_cache.discard(lambda key: True)
+    cache._latest_times.clear()
+    auth._users.clear()
+    yield
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """上傳時間以秒為單位，測試中連續的上傳改用每次遞增一秒的時間，避免相同的 update_time"""
+    import itertools
+
+    import main
+
+    ticks = itertools.count(1)
+    monkeypatch.setattr(main, 'strftime', lambda fmt, t=None: '2026-01-01-00:%02d:%02d' % divmod(next(ticks), 60))
+
+
+def make_frames(count, seed=0, start=0):
+    """time 為 start, start + 1, ... 的隨機影格"""
+    import random
+
+    from packing import FRAME_FIELDS
+
+    rng = random.Random(seed)
+    return [{field: (start + index if field == 'time' else rng.getrandbits(32)) for field in FRAME_FIELDS}
+            for index in range(count)]
+
+
+def login(client, username='dancer', password='secret'):
+    """建立使用者並登入，回傳 Authorization 標頭"""
+    import database
+
+    database.user_list._collection.insert_one({'username': username, 'password': password, 'disabled': False})
+    response = client.post('/api/token', data={'username': username, 'password': password})
+    return {'Authorization': f"Bearer {response.json()['access_token']}"}
@@ -0,0 +1,63 @@
+"""auth.py 的令牌簽發與驗證"""
+
+import asyncio
+import base64
+import json
+
+import pytest
+
+import auth
+from models import UserInDB
+
+USER = UserInDB(username='dancer', password='secret', disabled=False)
+
+
+def encode(part) -> str:
+    return base64.urlsafe_b64encode(json.dumps(part).encode()).rstrip(b'=').decode()
+
+
+def test_issued_token_verifies():
+    claims = auth.verify_token(auth.issue_token(USER))
+    assert claims['sub'] == 'dancer'
+    assert claims['pwd'] == auth.password_fingerprint('secret')
+    assert 'secret' not in json.dumps(claims)
+
+
+def test_expired_token_is_rejected():
+    assert auth.verify_token(auth.issue_token(USER, ttl=-1)) is None
+
+
+def test_tampered_claims_are_rejected():
+    header, claims, signature = auth.issue_token(USER).split('.')
+    forged = dict(auth.verify_token(f'{header}.{claims}.{signature}'), sub='admin')
+    assert auth.verify_token(f'{header}.{encode(forged)}.{signature}') is None
+
+
+def test_tampered_signature_is_rejected():
+    token = auth.issue_token(USER)
+    assert auth.verify_token(token[:-2] + ('AA' if token[-2:] != 'AA' else 'BB')) is None
+
+
+def test_unsigned_header_is_rejected():
+    _, claims, signature = auth.issue_token(USER).split('.')
+    assert auth.verify_token(f"{encode({'alg': 'none', 'typ': 'JWT'})}.{claims}.{signature}") is None
+
+
+@pytest.mark.parametrize('token', ['', 'abc', 'a.b', 'a.b.c.d', '!!!.###.$$$'])
+def test_malformed_tokens_are_rejected(token):
+    assert auth.verify_token(token) is None
+
+
+def test_authenticate_uses_cached_user_and_password_fingerprint(monkeypatch):
+    monkeypatch.setattr(auth, 'AUTH_USER_CACHE_TTL', 30)
+    token = auth.issue_token(USER)
+    auth.remember_user(USER)
+    try:
+        user = asyncio.run(auth.authenticate(token))
+        assert (user.username, user.disabled) == ('dancer', False)
+
+        # 修改密碼後先前的令牌失效
+        auth.remember_user(UserInDB(username='dancer', password='changed', disabled=False))
+        assert asyncio.run(auth.authenticate(token)) is None
+    finally:
+        auth.invalidate_user('dancer')
@@ -0,0 +1,76 @@
+"""benchmarks/bench_api.py 的測量、比較，以及以小型光表在行程中跑完所有項目"""
+
+import argparse
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import database
+from benchmarks import bench_api
+from packing import FRAME_FIELDS
+
+
+class FakeResponse:
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+
+def test_make_show_zeroes_unused_parts():
+    players = json.loads(bench_api.make_show(2, 5, 1, 1, 0))['players']
+    assert [len(player) for player in players] == [5, 5]
+    for frame in players[0]:
+        assert list(frame) == list(FRAME_FIELDS)
+        assert all(frame[field] == 0 for field in FRAME_FIELDS[2:])
+
+
+def test_measure_counts_errors_and_bytes():
+    async def send(i):
+        await asyncio.sleep(0)
+        return FakeResponse(500 if i == 3 else 200, b'x' * 10)
+
+    result = asyncio.run(bench_api.measure(send, 10, 3, warmup=2))
+    assert (result['requests'], result['errors'], result['response_bytes']) == (10, 1, 10)
+    assert result['latency_ms']['p50'] <= result['latency_ms']['p99'] <= result['latency_ms']['max']
+    assert 'cold_ms' in result
+    assert bench_api.summarize([], 0, 0, 0)['latency_ms'] is None
+
+
+def test_compare_reports_regressions():
+    def result(p50, p99):
+        return {'latency_ms': {'p50': p50, 'p99': p99}}
+
+    baseline = {'meta': {'commit': 'abc'}, 'results': {'fast': result(10, 20), 'slow': result(10, 20), 'new': None}}
+    current = {'fast': result(11, 21), 'slow': result(10, 30), 'new': result(1, 1), 'missing': result(1, 1)}
+    assert bench_api.compare(baseline, current, 0.2) == ['slow']
+
+
+def test_all_scenarios_run_in_process():
+    import main
+
+    args = argparse.Namespace(
+        players=2, frames=30, parts=3, interval=1, seed=0, uploads=2, requests=4,
+        concurrency=2, warmup=1, music_kb=1, only=None,
+    )
+
+    async def run():
+        async with main.app.router.lifespan_context(main.app):
+            await database.user_list.insert_one({'username': 'bench', 'password': 'bench', 'disabled': False})
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+                headers = await bench_api.login(client, 'bench', 'bench')
+                return await bench_api.run_scenarios(client, 'bench', headers, args)
+
+    results = asyncio.run(run())
+    assert list(results) == list(bench_api.SCENARIOS)
+    assert all(result['errors'] == 0 for result in results.values())
+    assert results['upload_items']['requests'] == 2
+    assert results['items_full']['requests'] == 4 and results['items_full']['response_bytes'] > 0
+
+
+@pytest.mark.parametrize('db', ['lightdance', 'production'])
+def test_in_process_run_refuses_other_databases(db):
+    with pytest.raises(SystemExit):
+        bench_api.configure_in_process(argparse.Namespace(db=db, mongo_uri='mongodb://localhost'))
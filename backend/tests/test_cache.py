@@ -0,0 +1,115 @@
+"""cache.py 的版本快取：LRU、LATEST 解析、同時未命中只讀取一次與大版本的分塊讀取"""
+
+import asyncio
+
+import cache
+import storage
+from conftest import make_frames
+
+
+def test_lru_evicts_least_recently_used_by_bytes():
+    lru = cache.LRUCache(10)
+    lru.put('a', b'aaaa', 4)
+    lru.put('b', b'bbbb', 4)
+    assert lru.get('a') == b'aaaa'
+    lru.put('c', b'cccc', 4)
+    assert 'b' not in lru and 'a' in lru and 'c' in lru
+    assert lru.stats()['bytes'] == 8 and lru.evictions == 1
+
+    # 超過上限的項目不放入
+    lru.put('d', b'd' * 11, 11)
+    assert 'd' not in lru
+    # 相同 key 覆寫時不重複計算大小
+    lru.put('a', b'aa', 2)
+    assert lru.bytes == 6
+
+    assert lru.get('missing') is None
+    assert (lru.hits, lru.misses) == (1, 1)
+    assert lru.discard(lambda key: key in ('a', 'c')) == 2 and lru.bytes == 0
+
+
+def test_contains_does_not_touch_order_or_stats():
+    lru = cache.LRUCache(8)
+    lru.put('a', b'aaaa', 4)
+    lru.put('b', b'bbbb', 4)
+    assert 'a' in lru
+    lru.put('c', b'cccc', 4)
+    assert 'a' not in lru
+    assert (lru.hits, lru.misses) == (0, 0)
+
+
+def test_latest_is_cached_until_invalidated():
+    asyncio.run(storage.save_color_version('alice', '2026-01-01-00:00:01', [make_frames(2)]))
+    assert asyncio.run(cache.resolve_query_time('color', 'alice', 'LATEST')) == '2026-01-01-00:00:01'
+
+    asyncio.run(storage.save_color_version('alice', '2026-01-01-00:00:02', [make_frames(2)]))
+    assert asyncio.run(cache.resolve_query_time('color', 'alice', 'LATEST')) == '2026-01-01-00:00:01'
+    cache.invalidate_latest('alice')
+    assert asyncio.run(cache.resolve_query_time('color', 'alice', 'LATEST')) == '2026-01-01-00:00:02'
+
+    assert asyncio.run(cache.resolve_query_time('color', 'nobody', 'LATEST')) is None
+    assert asyncio.run(cache.resolve_query_time('color', 'nobody', 'fixed')) == 'fixed'
+
+
+def test_concurrent_misses_load_once():
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b'content'
+
+    async def run():
+        return await asyncio.gather(*(cache._cached(('items', 'bob', 't'), load) for _ in range(5)))
+
+    assert asyncio.run(run()) == [b'content'] * 5
+    assert len(calls) == 1
+    assert cache.version_cache.get(('items', 'bob', 't')) == b'content'
+    assert not cache._loading
+
+
+def test_cancelled_request_does_not_cancel_shared_load():
+    async def load():
+        await asyncio.sleep(0.01)
+        return b'content'
+
+    async def run():
+        first = asyncio.ensure_future(cache._cached(('items', 'carol', 't'), load))
+        second = asyncio.ensure_future(cache._cached(('items', 'carol', 't'), load))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == b'content'
+
+
+def test_player_frames_are_sliced_from_cached_version():
+    players = [make_frames(10, seed=1), make_frames(6, seed=2)]
+    asyncio.run(storage.save_color_version('dave', '2026-01-01-00:00:01', players))
+
+    assert asyncio.run(cache.get_player_frames('dave', 'LATEST', 1, start=2, count=3)) == (2, players[1][2:5])
+    assert ('packed', 'dave', '2026-01-01-00:00:01') in cache.version_cache
+    assert asyncio.run(cache.get_player_frames('dave', 'LATEST', 5)) == (2, [])
+    assert asyncio.run(cache.get_player_frames('nobody', 'LATEST', 0)) is None
+
+
+def test_player_frames_of_oversized_version_read_chunks(monkeypatch):
+    players = [make_frames(50, seed=3)]
+    asyncio.run(storage.save_color_version('erin', '2026-01-01-00:00:01', players))
+    monkeypatch.setattr(cache.version_cache, 'max_bytes', 64)
+
+    async def fail(*args, **kwargs):
+        raise AssertionError('整個版本不應被讀取')
+
+    monkeypatch.setattr(storage, 'load_packed_version', fail)
+    assert asyncio.run(cache.get_player_frames('erin', 'LATEST', 0, start=40)) == (1, players[0][40:])
+    assert ('packed', 'erin', '2026-01-01-00:00:01') not in cache.version_cache
+
+
+def test_invalidate_user_drops_cached_versions():
+    asyncio.run(storage.save_color_version('frank', '2026-01-01-00:00:01', [make_frames(3)]))
+    assert asyncio.run(cache.get_items_json('frank', 'LATEST')) is not None
+    assert ('items', 'frank', '2026-01-01-00:00:01') in cache.version_cache
+    cache.invalidate_user('frank')
+    assert ('items', 'frank', '2026-01-01-00:00:01') not in cache.version_cache
+    assert ('color', 'frank') not in cache._latest_times
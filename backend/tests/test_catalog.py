@@ -0,0 +1,89 @@
+"""catalog.py 的版本目錄：重建、分頁與活躍使用者"""
+
+import asyncio
+
+from bson import ObjectId
+
+import catalog
+import database
+import indexes
+import storage
+from conftest import make_frames
+
+
+def legacy(user, update_time, player_counts):
+    return {'_id': ObjectId(), 'user': user, 'update_time': update_time,
+            'players': [make_frames(count) for count in player_counts]}
+
+
+def test_rebuild_keeps_one_entry_per_duplicate_timestamp():
+    asyncio.run(indexes.ensure_indexes())
+    color = database.collection_color._collection
+    first = legacy('alice', '2025-05-01-10:00:00', [3])
+    color.insert_many([
+        first,
+        legacy('alice', '2025-05-01-10:00:00', [5, 5]),
+        legacy('alice', '2025-05-01-10:00:01', [1]),
+        legacy('bob', '2025-05-01-10:00:00', [2]),
+    ])
+
+    assert asyncio.run(catalog.rebuild()) == 3
+    entries, _ = asyncio.run(catalog.list_versions())
+    assert [(e['user'], e['update_time']) for e in entries] == [
+        ('alice', '2025-05-01-10:00:01'), ('alice', '2025-05-01-10:00:00'), ('bob', '2025-05-01-10:00:00'),
+    ]
+    # 保留最早寫入的一筆
+    assert entries[1]['frame_count'] == 3
+    # 重建可重複執行
+    assert asyncio.run(catalog.rebuild()) == 3
+
+
+def test_rebuild_counts_chunked_versions_and_their_chunks():
+    header = asyncio.run(storage.save_color_version('carol', '2025-05-02-00:00:00', [make_frames(4), make_frames(2)]))
+    database.collection_catalog._collection.delete_many({})
+    assert asyncio.run(catalog.rebuild()) == 1
+    entry = database.collection_catalog._collection.find_one({'user': 'carol'})
+    assert (entry['player_count'], entry['frame_count'], entry['delta']) == (2, 6, False)
+    assert entry['size'] > len(str(header))
+
+
+def test_list_versions_pages_with_cursor():
+    for index in range(5):
+        asyncio.run(catalog.record_version({'user': 'dave', 'update_time': f'2025-05-03-00:00:0{index}'}, 10))
+    asyncio.run(catalog.record_version({'user': 'erin', 'update_time': '2025-05-03-00:00:00'}, 10))
+
+    seen, cursor = [], None
+    while True:
+        entries, cursor = asyncio.run(catalog.list_versions(limit=2, cursor=cursor))
+        seen += [(e['user'], e['update_time']) for e in entries]
+        if cursor is None:
+            break
+    assert seen == [('dave', f'2025-05-03-00:00:0{i}') for i in (4, 3, 2, 1, 0)] + [('erin', '2025-05-03-00:00:00')]
+
+    entries, cursor = asyncio.run(catalog.list_versions('dave', limit=10))
+    assert len(entries) == 5 and cursor is None
+
+
+def test_record_version_updates_existing_entry():
+    header = {'user': 'frank', 'update_time': '2025-05-04-00:00:00', 'player_count': 1, 'frame_counts': [3]}
+    asyncio.run(catalog.record_version(header, 10))
+    asyncio.run(catalog.record_version(dict(header, frame_counts=[7]), 20))
+    entries, _ = asyncio.run(catalog.list_versions('frank'))
+    assert [(e['size'], e['frame_count']) for e in entries] == [(20, 7)]
+
+
+def test_active_users_orders_by_latest_upload():
+    for user, update_time in [('a', '2025-06-01-00:00:00'), ('b', '2025-06-03-00:00:00'),
+                              ('a', '2025-06-02-00:00:00'), ('c', '2025-01-01-00:00:00')]:
+        asyncio.run(catalog.record_version({'user': user, 'update_time': update_time}, 1))
+    assert asyncio.run(catalog.active_users('2025-05-01-00:00:00', 10)) == ['b', 'a']
+    assert asyncio.run(catalog.active_users('2025-05-01-00:00:00', 1)) == ['b']
+
+
+def test_decode_cursor_rejects_garbage():
+    for cursor in ['!!', 'W10=', 'eyJhIjogMX0=']:
+        try:
+            catalog.decode_cursor(cursor)
+        except ValueError:
+            continue
+        raise AssertionError(cursor)
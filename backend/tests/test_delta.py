@@ -0,0 +1,118 @@
+"""delta.py 的 patch 套用，以及壓縮時重新切塊（storage.split_players）的還原"""
+
+import pytest
+
+import delta
+import storage
+from packing import FRAME_FIELDS
+
+
+def frames(count, start=0, value=0):
+    return [dict({field: value for field in FRAME_FIELDS}, time=start + index) for index in range(count)]
+
+
+def lengths(ops):
+    return [dict(op, length=len(op['frames'])) for op in ops]
+
+
+def test_apply_color_ops_replaces_ranges_in_order():
+    players = [frames(5), frames(3)]
+    ops = [
+        {'player': 0, 'start': 1, 'end': 3, 'frames': frames(1, 100, 7)},
+        {'player': 1, 'start': 3, 'end': 3, 'frames': frames(2, 200, 8)},
+        {'player': 0, 'start': 0, 'end': 1, 'frames': []},
+    ]
+    result = delta.apply_color_ops(players, None, ops)
+    assert [frame['time'] for frame in result[0]] == [100, 3, 4]
+    assert [frame['time'] for frame in result[1]] == [0, 1, 2, 200, 201]
+    # 基準版本不被修改
+    assert len(players[0]) == 5
+
+
+def test_apply_color_ops_resizes_and_appends_players():
+    players = [frames(2), frames(2), frames(2)]
+    ops = [{'player': 1, 'start': 0, 'end': 0, 'frames': frames(1, 9)}]
+    result = delta.apply_color_ops(players, 1, ops + [{'player': 1, 'start': 0, 'end': 0, 'frames': frames(1)}])
+    assert len(result) == 2
+    result = delta.apply_color_ops(players, 4, [])
+    assert [len(player) for player in result] == [2, 2, 2, 0]
+
+
+def test_check_color_ops_matches_apply():
+    players = [frames(5), frames(3)]
+    ops = [
+        {'player': 0, 'start': 1, 'end': 4, 'frames': frames(6)},
+        {'player': 2, 'start': 0, 'end': 0, 'frames': frames(2)},
+        {'player': 1, 'start': 0, 'end': 3, 'frames': []},
+    ]
+    counts = delta.check_color_ops([5, 3], None, lengths(ops))
+    assert counts == [len(player) for player in delta.apply_color_ops(players, None, ops)]
+
+
+@pytest.mark.parametrize('op', [
+    {'player': 0, 'start': 2, 'end': 1},
+    {'player': 0, 'start': 0, 'end': 6},
+    {'player': 0, 'start': -1, 'end': 1},
+    {'player': 0, 'start': True, 'end': 1},
+    {'player': 3, 'start': 0, 'end': 0},
+    {'player': '0', 'start': 0, 'end': 0},
+])
+def test_check_color_ops_rejects_bad_ranges(op):
+    with pytest.raises(delta.PatchError):
+        delta.check_color_ops([5, 3], None, [dict(op, length=0)])
+
+
+def test_check_color_ops_rejects_bad_player_count():
+    with pytest.raises(delta.PatchError):
+        delta.check_color_ops([5], -1, [])
+
+
+def test_apply_player_ops_matches_full_apply():
+    players = [frames(4), frames(4)]
+    ops = [
+        {'player': 1, 'start': 0, 'end': 2, 'frames': frames(1, 50)},
+        {'player': 0, 'start': 3, 'end': 4, 'frames': frames(2, 60)},
+        {'player': 1, 'start': 2, 'end': 3, 'frames': []},
+    ]
+    full = delta.apply_color_ops(players, None, ops)
+    for player in range(2):
+        assert delta.apply_player_ops(players[player], player, ops) == full[player]
+
+
+def test_apply_text_ops_counts_code_points():
+    assert delta.apply_text_ops('燈光秀abc', [{'start': 2, 'end': 3, 'text': 'X'}, {'start': 0, 'end': 0, 'text': '>'}]) \
+        == '>燈光Xabc'
+
+
+@pytest.mark.parametrize('op', [
+    {'start': 0, 'end': 10, 'text': ''},
+    {'start': 1, 'end': 0, 'text': ''},
+    {'start': 0, 'end': 0, 'text': 1},
+    {'end': 0, 'text': ''},
+])
+def test_apply_text_ops_rejects_bad_ops(op):
+    with pytest.raises(delta.PatchError):
+        delta.apply_text_ops('abc', [op])
+
+
+@pytest.mark.parametrize('chunk_frames', [1, 3, 1000])
+def test_compacted_chunks_restore_patched_players(chunk_frames):
+    players = [frames(7, value=5), frames(0), frames(4, value=0xFFFFFFFF)]
+    ops = [
+        {'player': 0, 'start': 2, 'end': 5, 'frames': frames(1, 90, 1)},
+        {'player': 3, 'start': 0, 'end': 0, 'frames': frames(3, 10, 2)},
+    ]
+    patched = delta.apply_color_ops(players, None, ops)
+    chunks = storage.split_players(patched, chunk_frames)
+    restored = [[] for _ in patched]
+    for chunk in sorted(chunks, key=lambda chunk: (chunk['player'], chunk['chunk'])):
+        assert chunk['end'] - chunk['start'] <= chunk_frames
+        restored[chunk['player']].extend(storage.chunk_frames(chunk))
+    assert restored == patched
+
+
+def test_chunks_keep_out_of_range_values_as_frames():
+    players = [frames(2, value=-1)]
+    chunks = storage.split_players(players, 10)
+    assert 'frames' in chunks[0]
+    assert storage.chunk_frames(chunks[0]) == players[0]
@@ -0,0 +1,102 @@
+"""diff.py 的版本比對，與逐時間點取樣的結果對照"""
+
+import random
+
+import numpy as np
+
+import diff
+import packing
+import timeline
+from packing import FRAME_FIELDS
+
+
+def color(r, g, b, brightness=127, fade=0):
+    return (r << 24) | (g << 16) | (b << 8) | (brightness << 1) | fade
+
+
+def frame(time, **values):
+    return dict({field: 0 for field in FRAME_FIELDS}, time=time, **values)
+
+
+def index_of(players):
+    data = packing.encode_packed([packing.pack_columns(frames) for frames in players], [len(f) for f in players])
+    return timeline.build_index(data)
+
+
+HAT = timeline.COLOR_PARTS.index('hat')
+
+
+def test_identical_versions_have_no_changes():
+    index = index_of([[frame(0, hat=color(1, 2, 3)), frame(5, face=color(4, 5, 6, fade=1))]])
+    result = diff.diff_indexes(index, index)
+    assert result['changes'] == []
+    assert result['changed_players'] == []
+
+
+def test_single_changed_range():
+    old = [[frame(0, hat=color(255, 0, 0)), frame(10, hat=color(0, 255, 0)), frame(20, hat=0)]]
+    new = [[frame(0, hat=color(255, 0, 0)), frame(10, hat=color(0, 0, 255)), frame(20, hat=0)]]
+    result = diff.diff_indexes(index_of(old), index_of(new))
+    assert result['changes'] == [[0, HAT, 10 * timeline.TIME_UNIT_MS, 20 * timeline.TIME_UNIT_MS,
+                                   color(0, 255, 0), color(0, 0, 255)]]
+
+
+def test_change_lasting_to_the_end():
+    result = diff.diff_indexes(index_of([[frame(0, hat=1 << 8)]]), index_of([[frame(0, hat=1 << 8), frame(4, hat=0)]]))
+    assert result['changes'] == [[0, HAT, 4 * timeline.TIME_UNIT_MS, None, 1 << 8, 0]]
+
+
+def test_split_frames_are_not_changes():
+    red = color(255, 0, 0)
+    old = index_of([[frame(2, hat=red)]])
+    new = index_of([[frame(2, hat=red), frame(5, hat=red), frame(9, hat=red)]])
+    assert diff.diff_indexes(old, new)['changes'] == []
+
+
+def test_added_player_compares_with_darkness():
+    old = index_of([[frame(0)]])
+    new = index_of([[frame(0)], [frame(3, face=color(9, 9, 9))]])
+    result = diff.diff_indexes(old, new)
+    assert result['player_counts'] == [1, 2]
+    assert result['changed_players'] == [1]
+    assert result['changes'] == [[1, timeline.COLOR_PARTS.index('face'), 3 * timeline.TIME_UNIT_MS, None,
+                                   0, color(9, 9, 9)]]
+
+
+def test_player_filter_and_truncation():
+    old = index_of([[frame(t, hat=t << 8) for t in range(10)], [frame(0)]])
+    new = index_of([[frame(t, hat=(t + 1) << 8) for t in range(10)], [frame(0, hat=5 << 8)]])
+    assert diff.diff_indexes(old, new, players=[1])['changed_players'] == [1]
+    result = diff.diff_indexes(old, new, max_changes=3)
+    assert result['truncated']
+    assert len(result['changes']) == 3
+
+
+def _random_player(rng, frame_count):
+    palette = [0, color(255, 0, 0), color(255, 0, 0, fade=1), color(0, 0, 255, 60, fade=1), color(0, 0, 255, 60)]
+    time, frames = 0, []
+    for _ in range(frame_count):
+        time += rng.choice([0, 1, 1, 2, 5])
+        frames.append(dict({part: rng.choice(palette) for part in FRAME_FIELDS}, time=time))
+    return frames
+
+
+def test_ranges_cover_every_sampled_difference():
+    rng = random.Random(0)
+    for _ in range(50):
+        old = [_random_player(rng, rng.randint(0, 10)) for _ in range(2)]
+        new = [[dict(item) for item in frames] for frames in old]
+        for frames in new:
+            for item in frames:
+                if rng.random() < 0.2:
+                    item[rng.choice(timeline.COLOR_PARTS)] = color(0, 255, 0, fade=rng.randint(0, 1))
+        old_index, new_index = index_of(old), index_of(new)
+        changes = diff.diff_indexes(old_index, new_index)['changes']
+
+        # 以半個時間單位取樣，包含漸變中的時間點
+        samples = np.arange(0, 2 * 60) * timeline.TIME_UNIT_MS // 2
+        differs = (timeline.query(old_index, samples) != timeline.query(new_index, samples)).any(axis=3)
+        covered = np.zeros_like(differs)
+        for player, part, start, end, _, _ in changes:
+            covered[player, (samples >= start) & (samples < (np.inf if end is None else end)), part] = True
+        assert not (differs & ~covered).any()
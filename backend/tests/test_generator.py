@@ -0,0 +1,41 @@
+"""generator.py 的隨機與測試光表"""
+
+import json
+
+import pytest
+
+import generator
+import packing
+
+
+def test_test_mode_colors_do_not_fade():
+    rows = generator.generate_player('test', 0, 3, 300)
+    assert rows[0].tolist() == list(range(300))
+    assert not (rows[1:] & 1).any()
+
+
+def test_random_mode_is_reproducible_and_sliceable():
+    rows = generator.generate_player('random', 7, 1, 50, interval=3)
+    assert (rows == generator.generate_player('random', 7, 1, 50, interval=3)).all()
+    assert (rows[:, 10:20] == generator.generate_player('random', 7, 1, 50, interval=3, start=10, end=20)).all()
+    gaps = rows[0, 1:].astype(int) - rows[0, :-1]
+    assert rows[0, 0] == 0 and gaps.min() >= 1 and gaps.max() <= 6
+
+
+@pytest.mark.parametrize('mode', generator.MODES)
+def test_json_and_packed_outputs_match(mode, monkeypatch):
+    monkeypatch.setattr(generator, '_JSON_BLOCK_FRAMES', 7)
+    players = json.loads(b''.join(generator.iter_json(mode, 3, 2, 20, start=5, end=18)))['players']
+    assert [len(player) for player in players] == [13, 13]
+    content = generator.packed(mode, 3, 2, 20, start=5, end=18)
+    assert [packing.packed_player_frames(content, player)[1] for player in range(2)] == players
+
+
+def test_check_request_limits(monkeypatch):
+    monkeypatch.setattr(generator, 'GENERATOR_MAX_FRAMES', 100)
+    generator.check_request('test', 10, 10, 1)
+    for args in [('other', 1, 1, 1), ('test', 0, 1, 1), ('test', 11, 10, 1), ('test', 1, 1, 0), ('test', 1, 1, 2 ** 31)]:
+        with pytest.raises(ValueError):
+            generator.check_request(*args)
+    with pytest.raises(ValueError):
+        generator.check_request('random', 1, 1, 1, seed=-1)
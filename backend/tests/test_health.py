@@ -0,0 +1,119 @@
+"""health.py 的啟動重試、預熱與就緒檢查"""
+
+import asyncio
+import time
+
+import pytest
+
+import cache
+import database
+import health
+import indexes
+import storage
+from conftest import make_frames
+
+
+@pytest.fixture(autouse=True)
+def fresh_state():
+    saved = dict(health.state)
+    health.state.update(database=False, setup=False, failed=False, warmup='disabled',
+                        warmed_users=0, attempts=0, error=None)
+    yield
+    health.state.clear()
+    health.state.update(saved)
+
+
+@pytest.fixture
+def no_wait(monkeypatch):
+    """重試的等待不實際延遲（只用於沒有背景 task 的測試，否則背景迴圈會空轉）"""
+    sleep = asyncio.sleep
+
+    async def skip(delay, *args, **kwargs):
+        return await sleep(0, *args, **kwargs)
+
+    monkeypatch.setattr(asyncio, 'sleep', skip)
+
+
+def failing(times, error=ConnectionError):
+    """前 times 次呼叫拋出 error，之後成功；回傳 (函式, 呼叫紀錄)"""
+    calls = []
+
+    async def call():
+        calls.append(1)
+        if len(calls) <= times:
+            raise error('not yet')
+    return call, calls
+
+
+def test_wait_for_database_retries_ping(monkeypatch, no_wait):
+    ping, calls = failing(2)
+    monkeypatch.setattr(database, 'ping', ping)
+    asyncio.run(health.wait_for_database())
+    assert health.state['attempts'] == 3 and health.state['database'] and health.state['error'] is None
+
+
+def test_next_delay_is_capped(monkeypatch):
+    monkeypatch.setattr(health, 'STARTUP_RETRY_MAX_DELAY', 5)
+    assert [health._next_delay(delay) for delay in (1, 2, 4, 5)] == [2, 4, 5, 5]
+
+
+def test_transient_setup_errors_are_retried(no_wait):
+    setup, calls = failing(2)
+    asyncio.run(health.start_up(setup))
+    assert len(calls) == 3
+    assert health.state['setup'] and not health.state['failed'] and health.state['error'] is None
+
+
+def test_query_plan_error_is_permanent():
+    setup, calls = failing(5, indexes.QueryPlanError)
+    asyncio.run(health.start_up(setup))
+    assert len(calls) == 1
+    assert health.state['failed'] and not health.state['setup']
+    assert health.state['error'].startswith('QueryPlanError')
+    ready, report = asyncio.run(health.readiness())
+    assert not ready and report['status'] == 'failed'
+
+
+def test_warm_up_loads_latest_versions_of_active_users(monkeypatch):
+    now = time.strftime("%Y-%m-%d-%H:%M:%S", time.localtime())
+    old = time.strftime("%Y-%m-%d-%H:%M:%S", time.localtime(time.time() - 400 * 86400))
+    asyncio.run(storage.save_color_version('active', now, [make_frames(3)]))
+    asyncio.run(storage.save_color_version('idle', old, [make_frames(3)]))
+    monkeypatch.setattr(health, 'WARMUP_USERS', 5)
+    health.state['warmup'] = 'pending'
+
+    async def setup():
+        pass
+
+    asyncio.run(health.start_up(setup))
+    assert health.state['warmup'] == 'done' and health.state['warmed_users'] == 1
+    assert ('items', 'active', now) in cache.version_cache
+    assert ('packed', 'active', now) in cache.version_cache
+    assert not any(key[1] == 'idle' for key in cache.version_cache._entries)
+
+
+def test_readiness_reports_each_stage(monkeypatch):
+    ready, report = asyncio.run(health.readiness())
+    assert not ready and report['status'] == 'starting'
+
+    health.state.update(setup=True, warmup='running')
+    assert asyncio.run(health.readiness())[1]['status'] == 'starting'
+
+    health.state['warmup'] = 'timeout'
+    ready, report = asyncio.run(health.readiness())
+    assert ready and report['status'] == 'ready' and report['database']
+
+    ping, _ = failing(1)
+    monkeypatch.setattr(database, 'ping', ping)
+    ready, report = asyncio.run(health.readiness())
+    assert not ready and report['status'] == 'unavailable' and report['error'].startswith('ConnectionError')
+
+
+def test_health_endpoints(client):
+    assert client.get('/api/health/live').json()['status'] == 'alive'
+    for _ in range(100):
+        response = client.get('/api/health/ready')
+        if response.status_code == 200:
+            break
+        assert response.json()['status'] == 'starting'
+    assert response.status_code == 200 and response.json()['status'] == 'ready'
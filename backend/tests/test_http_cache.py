@@ -0,0 +1,80 @@
+"""http_cache.py：ETag / 304、壓縮與 Range"""
+
+import gzip
+
+import pytest
+
+import http_cache
+from conftest import login, make_frames
+
+
+def test_etag_matches_ignores_weak_prefix_and_encoding_suffix():
+    etag = http_cache.version_etag('items', 'alice', '2026-01-01-00:00:01')
+    assert etag != http_cache.version_etag('raw', 'alice', '2026-01-01-00:00:01')
+    assert http_cache.etag_matches(etag, etag)
+    assert http_cache.etag_matches('W/' + http_cache._encoded_etag(etag, 'gzip'), etag)
+    assert http_cache.etag_matches(f'"other", {etag}', etag)
+    assert http_cache.etag_matches('*', etag)
+    assert not http_cache.etag_matches('"other"', etag)
+    assert not http_cache.etag_matches(None, etag)
+
+
+def test_select_encoding():
+    assert http_cache.select_encoding(None) is None
+    assert http_cache.select_encoding('identity') is None
+    assert http_cache.select_encoding('gzip') == 'gzip'
+    assert http_cache.select_encoding('gzip;q=0') is None
+    assert http_cache.select_encoding('*;q=0.5, br;q=0') == 'gzip'
+
+
+def test_parse_range():
+    assert http_cache.parse_range(None, 100) is None
+    assert http_cache.parse_range('bytes=10-19', 100) == (10, 20)
+    assert http_cache.parse_range('bytes=90-', 100) == (90, 100)
+    assert http_cache.parse_range('bytes=-30', 100) == (70, 100)
+    assert http_cache.parse_range('bytes=90-200', 100) == (90, 100)
+    assert http_cache.parse_range('bytes=0-1,5-6', 100) is None
+    assert http_cache.parse_range('bytes=x-y', 100) is None
+    with pytest.raises(ValueError):
+        http_cache.parse_range('bytes=100-', 100)
+
+
+def test_items_revalidate_with_304_and_gzip(client, clock):
+    headers = login(client)
+    client.post('/api/upload_items', json={'players': [make_frames(20)]}, headers=headers)
+
+    response = client.get('/api/items/dancer/LATEST', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Cache-Control'] == f'public, max-age={http_cache.HTTP_LATEST_MAX_AGE}'
+    etag = response.headers['ETag']
+    assert etag.endswith('-gzip"')
+    body = response.json()
+    assert body['players'] == [make_frames(20)]
+
+    plain = client.get('/api/items/dancer/LATEST', headers={'Accept-Encoding': 'identity'})
+    assert plain.headers['ETag'] != etag and 'Content-Encoding' not in plain.headers
+    assert plain.json() == body
+
+    update_time = body['update_time']
+    fixed = client.get(f'/api/items/dancer/{update_time}', headers={'If-None-Match': etag})
+    assert fixed.status_code == 304
+    assert fixed.headers['Cache-Control'] == http_cache.IMMUTABLE_CACHE_CONTROL
+
+    # 新版本上傳後 LATEST 的 ETag 改變
+    client.post('/api/upload_items', json={'players': [make_frames(3)]}, headers=headers)
+    assert client.get('/api/items/dancer/LATEST', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_compressed_content_is_cached_per_version(client, clock):
+    headers = login(client)
+    client.post('/api/upload_items', json={'players': [make_frames(5)]}, headers=headers)
+    first = client.get('/api/items/dancer/LATEST', headers={'Accept-Encoding': 'gzip'})
+    second = client.get('/api/items/dancer/LATEST', headers={'Accept-Encoding': 'gzip'})
+    assert first.content == second.content
+
+    import cache
+    keys = [key for key in cache.version_cache._entries if key[0] == 'items.gzip']
+    assert len(keys) == 1
+    assert gzip.decompress(cache.version_cache.get(keys[0])) == cache.version_cache.get(('items',) + keys[0][1:])
+
@@ -0,0 +1,60 @@
+"""indexes.py 的索引建立與查詢計畫檢查"""
+
+import asyncio
+
+import pytest
+
+import database
+import indexes
+
+
+def test_ensure_indexes_creates_every_index():
+    asyncio.run(indexes.ensure_indexes())
+    for collection, keys, options in indexes.INDEXES:
+        info = database.db._database[collection.name].index_information()
+        matching = [index for index in info.values() if index['key'] == keys]
+        assert matching, (collection.name, keys)
+        if options.get('unique'):
+            assert matching[0].get('unique')
+
+
+def test_ensure_indexes_is_idempotent():
+    asyncio.run(indexes.ensure_indexes())
+    asyncio.run(indexes.ensure_indexes())
+
+
+def test_hot_queries_cover_indexed_collections():
+    names = [name for name, _ in indexes._hot_queries()]
+    assert len(names) == len(set(names))
+    for _, make_cursor in indexes._hot_queries():
+        make_cursor()
+
+
+def test_plan_stages_walks_nested_plans():
+    plan = {'stage': 'LIMIT', 'inputStage': {'stage': 'FETCH', 'inputStages': [{'stage': 'IXSCAN'}, {'stage': 'COLLSCAN'}]}}
+    assert list(indexes._plan_stages(plan)) == ['LIMIT', 'FETCH', 'IXSCAN', 'COLLSCAN']
+
+
+class _Plan:
+    def __init__(self, stage):
+        self.stage = stage
+
+    async def explain(self):
+        return {'queryPlanner': {'winningPlan': {'stage': 'SORT', 'inputStage': {'stage': self.stage}}}}
+
+
+def _with_plans(monkeypatch, stages):
+    monkeypatch.setattr(indexes, '_hot_queries', lambda: [(name, lambda s=stage: _Plan(s)) for name, stage in stages])
+
+
+def test_check_query_plans_reports_collscans(monkeypatch):
+    _with_plans(monkeypatch, [('good', 'IXSCAN'), ('bad', 'COLLSCAN')])
+    assert asyncio.run(indexes.check_query_plans(strict=False)) == ['bad']
+
+
+def test_check_query_plans_strict_raises(monkeypatch):
+    _with_plans(monkeypatch, [('bad', 'COLLSCAN')])
+    with pytest.raises(indexes.QueryPlanError):
+        asyncio.run(indexes.check_query_plans(strict=True))
+    _with_plans(monkeypatch, [('good', 'IXSCAN')])
+    assert asyncio.run(indexes.check_query_plans(strict=True)) == []
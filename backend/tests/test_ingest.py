@@ -0,0 +1,75 @@
+"""ingest.py 的快速解析必須與 PlayerData 逐影格驗證接受、拒絕相同的輸入"""
+
+import pytest
+from pydantic import ValidationError
+
+import ingest
+from models import PlayerData
+from packing import FRAME_FIELDS
+
+
+def frame(time=0, **values):
+    data = {field: 0 for field in FRAME_FIELDS}
+    data['time'] = time
+    data.update(values)
+    return data
+
+
+def by_model(player):
+    try:
+        return [PlayerData(**item).model_dump() for item in player]
+    except (ValidationError, TypeError):
+        return 'rejected'
+
+
+def by_ingest(player):
+    try:
+        parsed = ingest.parse_player(player)
+    except (ValidationError, TypeError):
+        return 'rejected'
+    if isinstance(parsed, dict):
+        return [dict(zip(FRAME_FIELDS, values)) for values in zip(*(parsed[field] for field in FRAME_FIELDS))]
+    return parsed
+
+
+CASES = {
+    'valid': [frame(0, hat=0xFF0000FF), frame(1, face=0xFFFFFFFF)],
+    'empty': [],
+    'bool': [frame(0, hat=True), frame(1, hat=False)],
+    'negative': [frame(0, hat=-1)],
+    'negative time': [frame(-5)],
+    'over uint32': [frame(0, hat=2 ** 32)],
+    'big int': [frame(0, hat=2 ** 40)],
+    'integral float': [frame(0, hat=1.0)],
+    'fractional float': [frame(0, hat=1.5)],
+    'numeric string': [frame(0, hat='5')],
+    'string': [frame(0, hat='red')],
+    'none': [frame(0, hat=None)],
+    'missing field': [{field: 0 for field in FRAME_FIELDS if field != 'board'}],
+    'missing time': [{field: 0 for field in FRAME_FIELDS if field != 'time'}],
+    'extra fields': [dict(frame(0), extra=1, another='x')],
+    'second frame bad': [frame(0), frame(1, hat='x')],
+    'item not object': [[0] * len(FRAME_FIELDS)],
+    'item is number': [1],
+}
+
+
+@pytest.mark.parametrize('player', CASES.values(), ids=CASES.keys())
+def test_parse_player_matches_model(player):
+    assert by_ingest(player) == by_model(player)
+
+
+def test_parse_player_uses_columns_for_plain_ints():
+    parsed = ingest.parse_player([frame(0, hat=1), frame(1, hat=2)])
+    assert isinstance(parsed, dict)
+    assert list(parsed['hat']) == [1, 2]
+
+
+def test_parse_player_rejects_non_list():
+    with pytest.raises((ValidationError, TypeError)):
+        ingest.parse_player({'time': 0})
+
+
+def test_parse_players_rejects_any_bad_player():
+    with pytest.raises(ValidationError):
+        ingest.parse_players([[frame(0)], [frame(0, hat='x')]])
@@ -0,0 +1,92 @@
+"""music_catalog.py 的音樂目錄：清單、搜尋、分頁與重新掃描"""
+
+import asyncio
+import io
+import json
+import os
+
+import music_catalog
+import music_store
+import waveform
+from conftest import login
+
+
+def record(user, filename, sha256=None):
+    asyncio.run(music_catalog.record_upload(user, filename, 10, sha256))
+
+
+def names(entries):
+    return [(entry['user'], entry['filename']) for entry in entries]
+
+
+def test_list_pages_across_users():
+    for user, filename in [('bob', 'b.mp3'), ('alice', 'z.mp3'), ('alice', 'a.mp3'), ('carol', 'c.mp3')]:
+        record(user, filename)
+
+    seen, cursor = [], None
+    while True:
+        entries, cursor = asyncio.run(music_catalog.list_music(limit=3, cursor=cursor))
+        seen += names(entries)
+        if cursor is None:
+            break
+    assert seen == [('alice', 'a.mp3'), ('alice', 'z.mp3'), ('bob', 'b.mp3'), ('carol', 'c.mp3')]
+
+    entries, cursor = asyncio.run(music_catalog.list_music('alice', limit=1))
+    entries, cursor = asyncio.run(music_catalog.list_music('alice', limit=1, cursor=cursor))
+    assert names(entries) == [('alice', 'z.mp3')] and cursor is None
+
+
+def test_search_is_case_insensitive_and_literal():
+    for filename in ['Opening.mp3', 'ending.mp3', 'open (remix).mp3']:
+        record('alice', filename)
+    entries, _ = asyncio.run(music_catalog.list_music(search='OPEN'))
+    assert names(entries) == [('alice', 'Opening.mp3'), ('alice', 'open (remix).mp3')]
+    entries, _ = asyncio.run(music_catalog.list_music(search='(remix'))
+    assert names(entries) == [('alice', 'open (remix).mp3')]
+
+
+def test_reupload_replaces_entry_and_duration_fills_all_copies():
+    record('alice', 'a.mp3', 'old')
+    record('alice', 'a.mp3', 'new')
+    record('bob', 'b.mp3', 'new')
+    asyncio.run(music_catalog.set_duration('new', 12.5))
+    entries, _ = asyncio.run(music_catalog.list_music())
+    assert [(entry['sha256'], entry['duration']) for entry in entries] == [('new', 12.5), ('new', 12.5)]
+
+
+def test_rebuild_scans_user_directories(tmp_path):
+    root = str(tmp_path)
+    saved = music_store.save_upload(root, 'alice', 'a.mp3', io.BytesIO(b'ID3 a'))
+    music_store.save_upload(root, 'bob', 'b.mp3', io.BytesIO(b'ID3 b'))
+    # 手動複製、沒有內容雜湊的舊檔案
+    with open(os.path.join(root, 'bob', 'legacy.mp3'), 'wb') as file:
+        file.write(b'ID3 legacy')
+    with open(waveform.peaks_path(root, saved['sha256']), 'w') as file:
+        json.dump({'duration': 3.0}, file)
+    record('ghost', 'gone.mp3')
+
+    assert asyncio.run(music_catalog.rebuild(root)) == 3
+    entries, _ = asyncio.run(music_catalog.list_music())
+    assert names(entries) == [('alice', 'a.mp3'), ('bob', 'b.mp3'), ('bob', 'legacy.mp3')]
+    assert entries[0]['duration'] == 3.0 and entries[0]['size'] == 5
+    assert entries[2]['sha256'] is None
+
+
+def test_music_list_endpoints(client):
+    headers = login(client)
+    for filename in ['b.mp3', 'a.mp3']:
+        response = client.post('/api/upload_music', files={'file': (filename, b'ID3' + filename.encode(), 'audio/mpeg')},
+                               headers=headers)
+        assert response.status_code == 200
+
+    first = client.get('/api/get_music_list/dancer?limit=1').json()
+    assert first['music_list'] == ['a.mp3'] and first['next_cursor']
+    second = client.get(f"/api/get_music_list/dancer?limit=1&cursor={first['next_cursor']}").json()
+    assert second['music_list'] == ['b.mp3'] and second['next_cursor'] is None
+
+    everyone = client.get('/api/get_music_list?search=B').json()
+    assert everyone['music_lists'] == {'dancer': ['b.mp3']}
+    assert everyone['entries'][0]['size'] == len(b'ID3b.mp3')
+
+    assert client.get('/api/get_music_list?limit=0').status_code == 400
+    assert client.get('/api/get_music_list?cursor=!!').status_code == 400
@@ -0,0 +1,37 @@
+"""music_store.py 的內容定址儲存"""
+
+import io
+import os
+
+import pytest
+
+import music_store
+
+
+@pytest.mark.parametrize('name', ['song.mp3', 'a b.mp3', '歌.mp3', 'x..mp3'])
+def test_valid_filenames(name):
+    assert music_store.is_valid_filename(name)
+
+
+@pytest.mark.parametrize('name', ['', '.', '..', '.blobs', '.hidden.mp3', 'dir/song.mp3'])
+def test_invalid_filenames(name):
+    assert not music_store.is_valid_filename(name)
+
+
+def test_save_upload_shares_identical_content(tmp_path):
+    root = str(tmp_path)
+    first = music_store.save_upload(root, 'alice', 'a.mp3', io.BytesIO(b'ID3 data'))
+    second = music_store.save_upload(root, 'bob', 'b.mp3', io.BytesIO(b'ID3 data'))
+    assert (first['deduplicated'], second['deduplicated']) == (False, True)
+    assert first['sha256'] == second['sha256']
+    with open(second['path'], 'rb') as saved:
+        assert saved.read() == b'ID3 data'
+    assert music_store.file_digest(root, first['path']) == first['sha256']
+
+
+def test_save_upload_cleans_up_when_target_is_a_directory(tmp_path):
+    root = str(tmp_path)
+    os.makedirs(os.path.join(root, 'alice', 'taken.mp3', 'inside'))
+    with pytest.raises(OSError):
+        music_store.save_upload(root, 'alice', 'taken.mp3', io.BytesIO(b'data'))
+    assert os.listdir(os.path.join(root, music_store.BLOB_DIR_NAME, 'tmp')) == []
@@ -0,0 +1,75 @@
+"""packing.py 欄式壓縮格式的往返轉換"""
+
+import random
+
+import pytest
+
+import packing
+from packing import FRAME_FIELDS
+
+
+def random_frames(count, seed):
+    rng = random.Random(seed)
+    return [{field: (index if field == 'time' else rng.getrandbits(32)) for field in FRAME_FIELDS}
+            for index in range(count)]
+
+
+PLAYERS = [random_frames(50, 1), [], random_frames(7, 2)]
+
+
+def encode(players):
+    return packing.encode_packed([packing.pack_columns(frames) for frames in players], [len(f) for f in players])
+
+
+def test_pack_columns_round_trip():
+    frames = random_frames(20, 3)
+    assert packing.unpack_columns(packing.pack_columns(frames)) == frames
+
+
+def test_unpacked_keys_follow_model_order():
+    assert list(packing.unpack_columns(packing.pack_columns(random_frames(1, 4)))[0]) == list(FRAME_FIELDS)
+
+
+def test_encode_decode_round_trip():
+    data = encode(PLAYERS)
+    assert data[:4] == packing.PACKED_MAGIC
+    assert packing.decode_packed(data) == PLAYERS
+    assert packing.packed_player_count(data) == len(PLAYERS)
+    assert packing.packed_size([len(frames) for frames in PLAYERS]) == len(data)
+
+
+@pytest.mark.parametrize('player, start, count', [
+    (0, 0, None), (0, 10, 10), (0, 45, 10), (0, 60, 5), (1, 0, 10), (2, 3, None), (0, -5, 3), (0, 2, -1),
+])
+def test_packed_player_frames_slices_like_a_list(player, start, count):
+    data = encode(PLAYERS)
+    frames = PLAYERS[player]
+    begin = min(max(start, 0), len(frames))
+    end = len(frames) if count is None else min(begin + max(count, 0), len(frames))
+    assert packing.packed_player_frames(data, player, start, count) == (len(PLAYERS), frames[begin:end])
+
+
+def test_packed_player_frames_out_of_range_player():
+    assert packing.packed_player_frames(encode(PLAYERS), 3) == (len(PLAYERS), [])
+
+
+def test_pack_arrays_matches_pack_columns():
+    frames = random_frames(12, 5)
+    columns = packing.pack_columns(frames)
+    arrays = {field: packing._from_bytes(data) for field, data in columns.items()}
+    assert packing.pack_arrays(arrays, 2, 9) == packing.pack_columns(frames[2:9])
+
+
+def test_out_of_range_values():
+    frames = [dict(random_frames(1, 6)[0], hat=-1)]
+    assert not packing.fits_uint32(frames)
+    assert packing.fits_uint32(random_frames(3, 7))
+    with pytest.raises(OverflowError):
+        packing.pack_columns(frames)
+
+
+def test_decode_rejects_other_formats():
+    data = bytearray(encode(PLAYERS))
+    data[:4] = b'XXXX'
+    with pytest.raises(ValueError):
+        packing.decode_packed(bytes(data))
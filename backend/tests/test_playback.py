@@ -0,0 +1,79 @@
+"""playback.py 的播放同步與 WebSocket 端點"""
+
+import asyncio
+
+import pytest
+
+import playback
+from conftest import login, make_frames
+
+
+@pytest.fixture(autouse=True)
+def clean_sessions():
+    yield
+    playback.stop_all()
+
+
+def test_offer_drops_queue_and_requests_resync_when_full(monkeypatch):
+    monkeypatch.setattr(playback, 'PLAYBACK_QUEUE_FRAMES', 2)
+
+    async def run():
+        subscriber = playback.Subscriber(None)
+        subscriber.resync = False
+        assert subscriber.offer(b'1') and subscriber.offer(b'2')
+        assert not subscriber.offer(b'3')
+        return subscriber
+
+    subscriber = asyncio.run(run())
+    assert subscriber.queue.empty() and subscriber.resync and subscriber.dropped == 3
+
+
+def test_encode_frame_layout():
+    import numpy as np
+
+    colors = np.array([[1, 2], [3, 4]], dtype=np.uint32)
+    content = playback.encode_frame(playback.MESSAGE_DELTA, 7, 250, colors, np.array([1]), np.array([0]))
+    kind, tick, position, count = playback._HEADER.unpack_from(content)
+    assert (kind, tick, position, count) == (playback.MESSAGE_DELTA, 7, 250, 1)
+    entry = np.frombuffer(content, dtype=playback._ENTRY, offset=playback._HEADER.size)
+    assert entry.tolist() == [(1, 0, 3)]
+
+
+def test_socket_ignores_binary_and_invalid_messages(client):
+    with client.websocket_connect('/api/playback/dancer/ws') as websocket:
+        assert websocket.receive_json()['type'] == 'state'
+        websocket.send_bytes(b'\x00\x01')
+        websocket.send_text('not json')
+        websocket.send_json(['sync'])
+        websocket.send_json({'type': 'sync', 'client_time': 123})
+        reply = websocket.receive_json()
+        assert reply['type'] == 'sync' and reply['client_time'] == 123
+    # 最後一個訂閱者離線，未載入版本的工作階段立即移除
+    assert 'dancer' not in playback._sessions
+
+
+def test_loaded_version_sends_state_and_full_frame(client, clock):
+    headers = login(client)
+    client.post('/api/upload_items', json={'players': [make_frames(3), make_frames(2, seed=1)]}, headers=headers)
+    response = client.post('/api/playback/dancer', json={'action': 'load', 'query_time': 'LATEST'}, headers=headers)
+    assert response.status_code == 200
+
+    with client.websocket_connect('/api/playback/dancer/ws?player=1') as websocket:
+        state = websocket.receive_json()
+        assert state['type'] == 'state' and state['player_count'] == 2 and not state['playing']
+        frame = websocket.receive_bytes()
+        kind, tick, position, count = playback._HEADER.unpack_from(frame)
+        assert (kind, position, count) == (playback.MESSAGE_FULL, 0, len(state['parts']))
+
+        client.post('/api/playback/dancer', json={'action': 'seek', 'position_ms': 1}, headers=headers)
+        assert websocket.receive_json()['position_ms'] == 1
+        kind, _, position, _ = playback._HEADER.unpack_from(websocket.receive_bytes())
+        assert (kind, position) == (playback.MESSAGE_DELTA, 1)
+
+    # 載入版本的工作階段保留到 PLAYBACK_IDLE_SECONDS 之後
+    assert playback._sessions['dancer']._idle is not None
+
+
+def test_only_owner_or_admin_controls_playback(client):
+    response = client.post('/api/playback/dancer', json={'action': 'pause'}, headers=login(client, 'someone'))
+    assert response.status_code == 403
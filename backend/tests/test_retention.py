@@ -0,0 +1,57 @@
+"""retention.select_expired 的保留規則"""
+
+from datetime import datetime, timedelta
+
+import retention
+
+NOW = datetime(2026, 3, 1, 12, 0, 0)
+
+
+def version(days_ago=0.0, hours_ago=0.0, **flags):
+    time = NOW - timedelta(days=days_ago, hours=hours_ago)
+    return dict(update_time=time.strftime(retention.TIME_FORMAT), **flags)
+
+
+def expired(versions, **rules):
+    rules = dict(dict(keep_last=0, daily_days=7, weekly_weeks=8), **rules)
+    return retention.select_expired(versions, NOW, **rules)
+
+
+def test_keep_last_versions_are_kept():
+    versions = [version(days_ago=400 + index) for index in range(5)]
+    result = expired(versions, keep_last=2)
+    assert result == {v['update_time'] for v in versions[2:]}
+
+
+def test_one_version_per_day_within_daily_window():
+    latest, earlier = version(days_ago=1, hours_ago=1), version(days_ago=1, hours_ago=3)
+    other_day = version(days_ago=3)
+    assert expired([earlier, other_day, latest]) == {earlier['update_time']}
+
+
+def test_one_version_per_week_within_weekly_window():
+    week = NOW - timedelta(weeks=3)
+    monday = week - timedelta(days=week.weekday())
+    first, second = monday + timedelta(days=1), monday + timedelta(days=3)
+    versions = [{'update_time': t.strftime(retention.TIME_FORMAT)} for t in (first, second)]
+    assert expired(versions) == {versions[0]['update_time']}
+
+
+def test_versions_older_than_weekly_window_expire():
+    old = version(days_ago=100)
+    assert expired([old]) == {old['update_time']}
+
+
+def test_pinned_tagged_and_unparsable_versions_are_kept():
+    versions = [
+        version(days_ago=100, pinned=True),
+        version(days_ago=101, tag='final'),
+        {'update_time': 'not-a-time'},
+    ]
+    assert expired(versions) == set()
+
+
+def test_keep_last_counts_toward_buckets():
+    # 最新的版本佔用當天的保留名額，同一天較舊的版本因此被刪除
+    newest, same_day = version(hours_ago=1), version(hours_ago=2)
+    assert expired([same_day, newest], keep_last=1) == {same_day['update_time']}
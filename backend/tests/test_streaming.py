@@ -0,0 +1,64 @@
+"""streaming.py 的串流輸出必須與一般回應的 JSON 完全相同"""
+
+import asyncio
+
+from bson import ObjectId
+
+import cache
+import database
+import storage
+import streaming
+from conftest import login, make_frames
+
+
+def collect(username, query_time):
+    async def run():
+        stream = await streaming.iter_color_version(username, query_time)
+        return b''.join([part async for part in stream])
+    return asyncio.run(run())
+
+
+def expected(username, update_time):
+    return asyncio.run(cache.get_items_json(username, update_time))
+
+
+def test_chunked_version_matches_json_response():
+    # 跨越多個分塊、中間有沒有影格的玩家
+    players = [make_frames(storage.COLOR_CHUNK_FRAMES * 2 + 5, seed=1), [], make_frames(3, seed=2), []]
+    asyncio.run(storage.save_color_version('alice', '2026-01-01-00:00:01', players))
+    assert collect('alice', 'LATEST') == expected('alice', '2026-01-01-00:00:01')
+
+
+def test_version_without_players():
+    asyncio.run(storage.save_color_version('bob', '2026-01-01-00:00:01', []))
+    assert collect('bob', 'LATEST') == expected('bob', '2026-01-01-00:00:01')
+
+
+def test_delta_version_matches_json_response():
+    base = asyncio.run(storage.save_color_version('carol', '2026-01-01-00:00:01', [make_frames(10), make_frames(4)]))
+    ops = [{'player': 0, 'start': 2, 'end': 5, 'frames': make_frames(1, seed=9, start=2)}]
+    asyncio.run(storage.save_color_patch('carol', '2026-01-01-00:00:02', base, None, ops))
+    assert collect('carol', '2026-01-01-00:00:02') == expected('carol', '2026-01-01-00:00:02')
+
+
+def test_legacy_version_matches_json_response():
+    database.collection_color._collection.insert_one({
+        '_id': ObjectId(), 'user': 'dave', 'update_time': '2026-01-01-00:00:01',
+        'players': [make_frames(4), make_frames(2, seed=3)],
+    })
+    assert collect('dave', 'LATEST') == expected('dave', '2026-01-01-00:00:01')
+
+
+def test_missing_version_returns_none():
+    assert asyncio.run(streaming.iter_color_version('nobody', 'LATEST')) is None
+
+
+def test_stream_endpoint_uses_weak_etag(client, clock):
+    headers = login(client)
+    client.post('/api/upload_items', json={'players': [make_frames(5)]}, headers=headers)
+    response = client.get('/api/items/dancer/LATEST?stream=true', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['ETag'].startswith('W/"')
+    assert response.json()['players'] == [make_frames(5)]
+    revalidated = client.get('/api/items/dancer/LATEST?stream=true', headers={'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304
@@ -0,0 +1,71 @@
+"""timeline.py 的區間索引與顏色計算"""
+
+import numpy as np
+import pytest
+
+import packing
+import timeline
+from packing import FRAME_FIELDS
+
+
+def color(r, g, b, brightness=127, fade=0):
+    return (r << 24) | (g << 16) | (b << 8) | (brightness << 1) | fade
+
+
+def frame(time, **values):
+    return dict({field: 0 for field in FRAME_FIELDS}, time=time, **values)
+
+
+def index_of(players):
+    data = packing.encode_packed([packing.pack_columns(frames) for frames in players], [len(f) for f in players])
+    return timeline.build_index(data)
+
+
+def test_index_keeps_only_colour_changes():
+    red = color(255, 0, 0)
+    index = index_of([[frame(0, hat=red), frame(1, hat=red), frame(2, hat=0), frame(3, hat=0)]])
+    starts, values = index[0]['hat']
+    assert starts.tolist() == [0, 2]
+    assert values.tolist() == [red, 0]
+    assert set(index[0]) == set(timeline.COLOR_PARTS)
+    assert 'board' not in index[0]
+
+
+def test_index_keeps_frames_after_a_fade():
+    fading = color(255, 0, 0, fade=1)
+    starts, _ = index_of([[frame(0, hat=fading), frame(4, hat=fading), frame(8, hat=fading)]])[0]['hat']
+    assert starts.tolist() == [0, 4, 8]
+
+
+def test_index_sorts_frames_by_time():
+    starts, values = index_of([[frame(5, hat=2), frame(1, hat=4)]])[0]['hat']
+    assert starts.tolist() == [1, 5]
+    assert values.tolist() == [4, 2]
+
+
+def test_part_colors_steps_fades_and_holds():
+    times = np.array([2, 4, 6], dtype=np.uint32)
+    values = np.array([color(200, 0, 0), color(0, 0, 0, fade=1), color(100, 0, 0)], dtype=np.uint32)
+    result = timeline.part_colors(times, values, np.array([0, 2, 3, 4, 5, 6, 100], dtype=np.float64))
+    assert result[:, 0].tolist() == [0, 200, 200, 0, 50, 100, 100]
+    assert result[0].tolist() == [0, 0, 0, 0]
+    assert result[1, 3] == 255
+
+
+def test_query_shape_and_player_filter():
+    index = index_of([[frame(0, hat=color(1, 2, 3))], [frame(0, face=color(4, 5, 6))]])
+    times = timeline.sample_times(None, 0, 100, 50)
+    result = timeline.query(index, times)
+    assert result.shape == (2, 3, len(timeline.COLOR_PARTS), 4)
+    assert timeline.to_uint32(result)[0, 0, timeline.COLOR_PARTS.index('hat')] == 0x010203FF
+    only = timeline.query(index, times, [1])
+    assert (only[0] == result[1]).all()
+
+
+@pytest.mark.parametrize('args', [
+    (-1, None, None, None), (None, None, None, None), (None, 5, 1, 1), (None, 0, 10, 0),
+    (None, 0, timeline.TIMELINE_MAX_SAMPLES, 1),
+])
+def test_sample_times_rejects_bad_parameters(args):
+    with pytest.raises(ValueError):
+        timeline.sample_times(*args)
@@ -0,0 +1,139 @@
+"""uploads.py 的分段上傳：續傳、commit 的重複呼叫與並行"""
+
+import asyncio
+
+import pytest
+
+import catalog
+import database
+import storage
+import uploads
+from conftest import login, make_frames
+
+
+def create_items_session(frame_counts):
+    return asyncio.run(uploads.create_session('alice', 'items', frame_counts=frame_counts))
+
+
+def put(session, player, start, frames):
+    return asyncio.run(uploads.put_player_part(session, player, start, frames))
+
+
+def test_parts_replace_overlaps_and_report_missing_ranges():
+    session = create_items_session([10, 0])
+    frames = make_frames(10)
+    put(session, 0, 0, frames[:4])
+    put(session, 0, 6, frames[6:])
+    status = asyncio.run(uploads.session_status(session))
+    assert status['missing'] == ['player 0: missing frames [4, 6)', 'player 1: no parts']
+
+    # 與 [0, 4) 及 [6, 10) 重疊，兩者都被取代
+    put(session, 0, 2, frames[2:7])
+    put(session, 1, 0, [])
+    status = asyncio.run(uploads.session_status(session))
+    assert [(p['player'], p['start'], p['end']) for p in status['parts']] == [(0, 2, 7), (1, 0, 0)]
+    assert status['missing'] == ['player 0: missing frames [0, 2)', 'player 0: has 7 of 10 frames']
+
+
+def test_commit_writes_version_and_removes_session():
+    session = create_items_session([5, 3])
+    players = [make_frames(5, seed=1), make_frames(3, seed=2)]
+    put(session, 0, 0, players[0][:2])
+    put(session, 0, 2, players[0][2:])
+    put(session, 1, 0, players[1])
+
+    assert asyncio.run(uploads.commit_session(session, '2026-01-01-00:00:01')) == '2026-01-01-00:00:01'
+    document = asyncio.run(storage.load_color_version('alice', 'LATEST'))
+    assert document['players'] == players
+    assert asyncio.run(uploads.find_session('alice', str(session['_id']))) is None
+    assert not database.collection_upload_parts._collection.count_documents({})
+    entries, _ = asyncio.run(catalog.list_versions('alice'))
+    assert [e['frame_count'] for e in entries] == [8]
+
+    with pytest.raises(uploads.UploadError, match='already finished'):
+        asyncio.run(uploads.commit_session(session, '2026-01-01-00:00:02'))
+
+
+def test_incomplete_commit_keeps_session_and_releases_claim():
+    session = create_items_session([5])
+    put(session, 0, 0, make_frames(3))
+    with pytest.raises(uploads.UploadError, match='has 3 of 5 frames'):
+        asyncio.run(uploads.commit_session(session, '2026-01-01-00:00:01'))
+    stored = asyncio.run(uploads.find_session('alice', str(session['_id'])))
+    assert stored['update_time'] is None and stored['committing'] is None
+
+    put(session, 0, 3, make_frames(2, start=3))
+    assert asyncio.run(uploads.commit_session(session, '2026-01-01-00:00:02')) == '2026-01-01-00:00:02'
+
+
+def test_concurrent_commits_write_one_version(monkeypatch):
+    session = create_items_session([4])
+    put(session, 0, 0, make_frames(4))
+    save_staged_version = storage.save_staged_version
+
+    async def slow_save(header, parts):
+        await asyncio.sleep(0.01)
+        return await save_staged_version(header, parts)
+
+    monkeypatch.setattr(storage, 'save_staged_version', slow_save)
+
+    async def run():
+        return await asyncio.gather(
+            uploads.commit_session(session, '2026-01-01-00:00:01'),
+            uploads.commit_session(session, '2026-01-01-00:00:02'),
+            return_exceptions=True,
+        )
+
+    first, second = asyncio.run(run())
+    assert first == '2026-01-01-00:00:01'
+    assert isinstance(second, uploads.CommitInProgress)
+    assert database.collection_color._collection.count_documents({'user': 'alice'}) == 1
+
+
+def test_retry_after_interrupted_commit_records_catalog(monkeypatch):
+    session = create_items_session([4])
+    put(session, 0, 0, make_frames(4))
+    record_version = catalog.record_version
+
+    async def interrupted(header, size):
+        raise ConnectionError('interrupted')
+
+    # 表頭已寫入、目錄摘要尚未寫入時中斷
+    monkeypatch.setattr(catalog, 'record_version', interrupted)
+    with pytest.raises(ConnectionError):
+        asyncio.run(uploads.commit_session(session, '2026-01-01-00:00:01'))
+    monkeypatch.setattr(catalog, 'record_version', record_version)
+
+    assert asyncio.run(uploads.commit_session(session, '2026-01-01-00:00:09')) == '2026-01-01-00:00:01'
+    entries, _ = asyncio.run(catalog.list_versions('alice'))
+    assert [(e['update_time'], e['frame_count']) for e in entries] == [('2026-01-01-00:00:01', 4)]
+    assert entries[0]['size'] > 0
+
+
+def test_raw_session_joins_parts_in_order():
+    session = asyncio.run(uploads.create_session('alice', 'raw'))
+    asyncio.run(uploads.put_raw_part(session, 1, 'world'))
+    assert asyncio.run(uploads.session_status(session))['missing'] == ['missing part 0']
+    asyncio.run(uploads.put_raw_part(session, 0, 'hello '))
+    asyncio.run(uploads.commit_session(session, '2026-01-01-00:00:01'))
+    assert asyncio.run(storage.load_raw_version('alice', 'LATEST'))['raw_data'] == 'hello world'
+
+
+def test_upload_session_endpoints(client, clock):
+    headers = login(client)
+    frames = make_frames(6)
+    session = client.post('/api/upload_sessions', json={'kind': 'items', 'frame_counts': [6]}, headers=headers).json()
+    session_id = session['session_id']
+
+    assert client.put(f'/api/upload_sessions/{session_id}/players/0?start=0', json=frames[:3], headers=headers).status_code == 200
+    assert client.post(f'/api/upload_sessions/{session_id}/commit', headers=headers).status_code == 400
+    assert client.put(f'/api/upload_sessions/{session_id}/players/0?start=3', json=frames[3:], headers=headers).status_code == 200
+    assert client.put(f'/api/upload_sessions/{session_id}/players/1', json=frames, headers=headers).status_code == 400
+
+    response = client.post(f'/api/upload_sessions/{session_id}/commit', headers=headers)
+    assert response.status_code == 200
+    assert client.get('/api/items/dancer/LATEST').json()['players'] == [frames]
+    assert client.get(f'/api/upload_sessions/{session_id}', headers=headers).status_code == 404
+    # 其他使用者看不到工作階段
+    other = client.post('/api/upload_sessions', json={'kind': 'raw'}, headers=headers).json()['session_id']
+    assert client.get(f'/api/upload_sessions/{other}', headers=login(client, 'someone')).status_code == 404
@@ -0,0 +1,154 @@
+"""waveform.py 的峰值計算；以輸出檔案原始內容的腳本代替 ffmpeg"""
+
+import asyncio
+import json
+import os
+import stat
+import sys
+
+import numpy as np
+import pytest
+
+import waveform
+from conftest import login
+
+FAKE_FFMPEG = f"""#!{sys.executable}
+import sys, time
+content = open(sys.argv[sys.argv.index('-i') + 1], 'rb').read()
+if content.startswith(b'BAD'):
+    sys.stderr.write('invalid data')
+    sys.exit(1)
+if content.startswith(b'SLOW'):
+    time.sleep(30)
+sys.stdout.buffer.write(content)
+"""
+
+
+@pytest.fixture
+def ffmpeg(tmp_path, monkeypatch):
+    path = tmp_path / 'ffmpeg'
+    path.write_text(FAKE_FFMPEG)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(waveform, 'WAVEFORM_FFMPEG', str(path))
+    monkeypatch.setattr(waveform, 'available', True)
+    monkeypatch.setattr(waveform, 'failed', set())
+    return path
+
+
+def reference_peaks(samples, block):
+    data = []
+    for start in range(0, len(samples), block):
+        part = samples[start:start + block]
+        data += [int(min(part)) >> 8, int(max(part)) >> 8]
+    return data
+
+
+def test_block_and_merge_peaks_match_reference():
+    samples = np.random.default_rng(0).integers(-32768, 32768, 1000, dtype=np.int16)
+    finest = waveform._block_peaks(samples, 64)
+    assert finest.tolist() == reference_peaks(samples, 64)
+    merged = waveform._merge_peaks(finest, 4)
+    assert merged[0::2].tolist() == [min(finest[0::2][i:i + 4]) for i in range(0, len(finest) // 2, 4)]
+    assert merged[1::2].tolist() == [max(finest[1::2][i:i + 4]) for i in range(0, len(finest) // 2, 4)]
+    assert waveform._block_peaks(samples[:0], 64).tolist() == []
+
+
+def test_compute_peaks_reads_in_parts(ffmpeg, tmp_path, monkeypatch):
+    monkeypatch.setattr(waveform, 'READ_SIZE', 2 * 64 * 3)
+    samples = np.random.default_rng(1).integers(-32768, 32768, 64 * 50 + 7, dtype=np.int16)
+    path = tmp_path / 'song.mp3'
+    path.write_bytes(samples.astype('<i2').tobytes() + b'\x01')
+
+    peaks = asyncio.run(waveform.compute_peaks(str(path)))
+    assert peaks['duration'] == len(samples) / waveform.WAVEFORM_SAMPLE_RATE
+    assert [level['samples_per_peak'] for level in peaks['levels']] == list(waveform.LEVELS)
+    for level in peaks['levels']:
+        assert level['data'] == reference_peaks(samples, level['samples_per_peak'])
+        assert level['length'] == len(level['data']) // 2
+
+
+def test_decode_failure_raises_decode_error(ffmpeg, tmp_path):
+    path = tmp_path / 'bad.mp3'
+    path.write_bytes(b'BAD')
+    with pytest.raises(waveform.DecodeError, match='invalid data'):
+        asyncio.run(waveform.compute_peaks(str(path)))
+
+
+def test_timeout_kills_ffmpeg(ffmpeg, tmp_path, monkeypatch):
+    monkeypatch.setattr(waveform, 'WAVEFORM_TIMEOUT', 0.5)
+    path = tmp_path / 'slow.mp3'
+    path.write_bytes(b'SLOW')
+    processes = []
+    create = asyncio.create_subprocess_exec
+
+    async def track(*args, **kwargs):
+        processes.append(await create(*args, **kwargs))
+        return processes[-1]
+
+    monkeypatch.setattr(asyncio, 'create_subprocess_exec', track)
+    with pytest.raises(TimeoutError):
+        asyncio.run(waveform.compute_peaks(str(path)))
+    assert processes[0].returncode is not None
+
+
+def run_worker_once(root, digest):
+    async def run():
+        worker = asyncio.create_task(waveform.run_worker())
+        await asyncio.sleep(0)
+        waveform.enqueue(root, digest)
+        for _ in range(200):
+            if (root, digest) not in waveform._pending:
+                break
+            await asyncio.sleep(0.01)
+        worker.cancel()
+
+    asyncio.run(run())
+
+
+def write_blob(root, content):
+    import hashlib
+
+    digest = hashlib.sha256(content).hexdigest()
+    path = waveform.music_store.blob_path(str(root), digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(content)
+    return digest
+
+
+def test_worker_blacklists_only_decode_failures(ffmpeg, tmp_path, monkeypatch):
+    bad = write_blob(tmp_path, b'BAD')
+    run_worker_once(str(tmp_path), bad)
+    assert (str(tmp_path), bad) in waveform.failed
+
+    monkeypatch.setattr(waveform, 'WAVEFORM_TIMEOUT', 0.2)
+    slow = write_blob(tmp_path, b'SLOW')
+    run_worker_once(str(tmp_path), slow)
+    assert (str(tmp_path), slow) not in waveform.failed
+    assert waveform.enqueue(str(tmp_path), slow)
+
+    good = write_blob(tmp_path, np.zeros(256, dtype='<i2').tobytes())
+    run_worker_once(str(tmp_path), good)
+    assert json.loads(waveform.load_peaks(str(tmp_path), good))['sha256'] == good
+
+
+def test_peaks_endpoint_etag_depends_on_encoding(client, ffmpeg):
+    import time
+
+    headers = login(client)
+    content = np.arange(-2048, 2048, dtype='<i2').tobytes()
+    client.post('/api/upload_music', files={'file': ('song.mp3', content, 'audio/mpeg')}, headers=headers)
+    # 峰值由 lifespan 啟動的 worker 計算
+    for _ in range(200):
+        plain = client.get('/api/get_music_peaks/dancer/song.mp3', headers={'Accept-Encoding': 'identity'})
+        if plain.status_code != 202:
+            break
+        time.sleep(0.01)
+
+    gzipped = client.get('/api/get_music_peaks/dancer/song.mp3', headers={'Accept-Encoding': 'gzip'})
+    assert gzipped.status_code == plain.status_code == 200
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert gzipped.headers['ETag'] != plain.headers['ETag']
+    assert gzipped.json() == plain.json()
+    assert client.get('/api/get_music_peaks/dancer/song.mp3',
+                      headers={'If-None-Match': gzipped.headers['ETag']}).status_code == 304
@@ -0,0 +1,152 @@
+"""
+光表版本的顏色查詢
+為版本建立區間索引，一次回答「某個時間點」或「一段時間內每隔 dt」所有玩家、所有部位的顏色，
+3D 預覽、拖曳時間軸與硬體同步不需要下載整個版本
+
+影格的意義與前端編輯器相同（見 frontend/src/pages/Home.jsx）：
+- time 以 TIME_UNIT_MS 毫秒為單位，部位的顏色由該影格起持續到同部位的下一個影格
+- 顏色為 0xRRGGBBXX，XX 的高 7 位元為亮度，最低位元為 1 時線性漸變到下一個影格的顏色
+- 第一個影格之前為 0（熄滅），最後一個影格之後維持最後的顏色
+
+區間索引：每位玩家、每個部位只保留顏色改變的影格（與前一個影格相同且前一個不漸變的影格可合併），
+查詢時以二分搜尋找到所在區間。索引保存在 cache.py 的版本快取中，版本刪除時一併移除
+
+環境變數：
+- TIMELINE_MAX_SAMPLES：單一查詢的 玩家數 x 時間點數 上限
+"""
+
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+import cache
+import packing
+
+TIMELINE_MAX_SAMPLES = int(os.getenv('TIMELINE_MAX_SAMPLES', '200000'))
+
+TIME_UNIT_MS = 50
+
+# 有顏色的部位（board 不是燈光部位）
+COLOR_PARTS = tuple(part for part in packing.PART_FIELDS if part != 'board')
+
+# 每個部位的區間：(區間起點 time, 區間起點的顏色)
+PartIntervals = Tuple[np.ndarray, np.ndarray]
+
+
+def part_colors(times: np.ndarray, values: np.ndarray, sample_times: np.ndarray) -> np.ndarray:
+    """
+    單一部位在各時間點的顏色，times 需已排序（單位與 sample_times 相同）
+    回傳形狀為 (時間點數, 4) 的 uint8 陣列：R, G, B, A（A 為 0 ~ 255 的亮度）
+    """
+    index = np.searchsorted(times, sample_times, side='right') - 1
+    current = np.maximum(index, 0)
+    following = np.minimum(current + 1, len(times) - 1)
+
+    # 每個影格的 R, G, B 與 7 位元亮度
+    channels = np.stack(
+        [(values >> 24) & 0xFF, (values >> 16) & 0xFF, (values >> 8) & 0xFF, (values & 0xFF) >> 1], axis=1
+    ).astype(np.float64)
+    span = (times[following] - times[current]).astype(np.float64)
+    fading = (values[current] & 1).astype(bool) & (span > 0)
+    fraction = np.where(fading, (sample_times - times[current]) / np.where(span > 0, span, 1), 0.0)[:, None]
+
+    color = channels[current] * (1 - fraction) + channels[following] * fraction
+    color[:, 3] *= 255 / 127
+    color[index < 0] = 0
+    return np.floor(color + 0.5).astype(np.uint8)
+
+
+# ============================================================================
+# 區間索引
+# ============================================================================
+
+def _part_intervals(times: np.ndarray, values: np.ndarray) -> PartIntervals:
+    # 與前一個影格顏色相同、且前一個影格不漸變時，這個影格不會改變顏色
+    keep = np.ones(len(values), dtype=bool)
+    keep[1:] = (values[1:] != values[:-1]) | ((values[:-1] & 1) == 1)
+    return times[keep], values[keep]
+
+
+def build_index(data: bytes) -> List[Dict[str, PartIntervals]]:
+    """由欄式壓縮內容（packing.py）建立每位玩家、每個部位的區間（阻塞式，請在 threadpool 中執行）"""
+    index = []
+    for player in range(packing.packed_player_count(data)):
+        _, columns = packing.packed_player_columns(data, player)
+        times = np.frombuffer(columns['time'], dtype='<u4')
+        order = np.argsort(times, kind='stable')
+        times = times[order]
+        index.append({
+            part: _part_intervals(times, np.frombuffer(columns[part], dtype='<u4')[order])
+            for part in COLOR_PARTS
+        })
+    return index
+
+
+def index_size(index: List[Dict[str, PartIntervals]]) -> int:
+    return sum(starts.nbytes + values.nbytes for player in index for starts, values in player.values())
+
+
+async def get_index(username: str, update_time: str) -> Optional[List[Dict[str, PartIntervals]]]:
+    """
+    取得版本的區間索引，找不到版本時回傳 None
+    數值超出 uint32 範圍時拋出 OverflowError
+    """
+    key = ('timeline', username, update_time)
+    index = cache.version_cache.get(key)
+    if index is None:
+        result = await cache.get_packed(username, update_time)
+        if result is None:
+            return None
+        index = await run_in_threadpool(build_index, result[1])
+        cache.version_cache.put(key, index, index_size(index))
+    return index
+
+
+# ============================================================================
+# 查詢
+# ============================================================================
+
+def sample_times(t: Optional[int], t0: Optional[int], t1: Optional[int], dt: Optional[int]) -> np.ndarray:
+    """
+    將查詢參數（毫秒）轉為時間點陣列：指定 t 時為單一時間點，否則為 t0, t0 + dt, ..., <= t1
+    參數不合法時拋出 ValueError
+    """
+    if t is not None:
+        if t < 0:
+            raise ValueError("t must not be negative")
+        return np.array([t], dtype=np.int64)
+    if t0 is None or t1 is None:
+        raise ValueError("specify t, or t0 and t1")
+    if t0 < 0 or t1 < t0:
+        raise ValueError("t0 must not be negative and t1 must not be before t0")
+    if dt is None or dt < 1:
+        raise ValueError("dt must be positive")
+    if (t1 - t0) // dt + 1 > TIMELINE_MAX_SAMPLES:
+        raise ValueError(f"too many time points, limit is {TIMELINE_MAX_SAMPLES}")
+    return np.arange(t0, t1 + 1, dt, dtype=np.int64)
+
+
+def query(index: List[Dict[str, PartIntervals]], times_ms: np.ndarray,
+          players: Optional[List[int]] = None) -> np.ndarray:
+    """
+    查詢各玩家、各時間點、各部位的顏色（阻塞式，請在 threadpool 中執行）
+    回傳形狀為 (玩家數, 時間點數, len(COLOR_PARTS), 4) 的 uint8 陣列
+    """
+    players = range(len(index)) if players is None else players
+    if len(players) * len(times_ms) > TIMELINE_MAX_SAMPLES:
+        raise ValueError(f"players x time points must not exceed {TIMELINE_MAX_SAMPLES}")
+    result = np.zeros((len(players), len(times_ms), len(COLOR_PARTS), 4), dtype=np.uint8)
+    units = times_ms / TIME_UNIT_MS
+    for row, player in enumerate(players):
+        for column, part in enumerate(COLOR_PARTS):
+            starts, values = index[player][part]
+            if len(starts):
+                result[row, :, column] = part_colors(starts, values, units)
+    return result
+
+
+def to_uint32(colors: np.ndarray) -> np.ndarray:
+    """將 RGBA 位元組轉為 0xRRGGBBAA 整數（A 為 0 ~ 255 的亮度）"""
+    return colors.astype('>u1').view('>u4')[..., 0]
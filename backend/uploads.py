@@ -0,0 +1,305 @@
+"""
+分段上傳（可續傳）
+大型光表與原始資料可拆成多段上傳，每段到達時即驗證並暫存，全部到齊後一次寫入為一個版本
+
+流程：
+1. 建立上傳工作階段（kind 為 items 或 raw），光表需指定 player_count
+2. 上傳各段：
+   - items：單一玩家從 start 開始的一段影格（PlayerData 清單，由 ingest.py 驗證）
+     重新上傳時會取代與其重疊的舊段落，因此中斷後可用相同或不同的切法補傳
+   - raw：依序編號的字串片段，依 index 串接
+3. 查詢工作階段可得知已收到的段落，用於續傳
+4. commit 檢查段落完整後寫入版本；版本 _id 在建立工作階段時即決定，
+   commit 中斷後重新呼叫不會產生重複的版本；同時收到多個 commit 時只有一個會寫入
+
+暫存資料：
+- collection_upload_sessions：user, kind, version_id, player_count, frame_counts, update_time, committing, expires_at
+- collection_upload_parts：session_id, player, start, end, columns | frames（items）或 index, text（raw）
+兩者皆以 expires_at 的 TTL 索引自動清除（見 indexes.py）
+
+環境變數：
+- UPLOAD_SESSION_TTL：工作階段保留秒數
+- UPLOAD_PART_MAX_FRAMES：單段最多影格數（單一暫存文件不可超過 16MB BSON 上限）
+- UPLOAD_COMMIT_TIMEOUT：commit 的期限秒數，處理中的程序中斷後，重新呼叫 commit 需等待此時間
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+
+import catalog
+import database
+import storage
+from database import collection_color, collection_raw, collection_upload_parts, collection_upload_sessions
+
+UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', '86400'))
+UPLOAD_PART_MAX_FRAMES = int(os.getenv('UPLOAD_PART_MAX_FRAMES', '20000'))
+UPLOAD_COMMIT_TIMEOUT = int(os.getenv('UPLOAD_COMMIT_TIMEOUT', '600'))
+
+KINDS = ('items', 'raw')
+
+
+class UploadError(ValueError):
+    """段落內容不正確或工作階段尚未完整"""
+
+
+class CommitInProgress(UploadError):
+    """同一個工作階段的另一個 commit 正在寫入版本"""
+
+
+# ============================================================================
+# 工作階段
+# ============================================================================
+
+async def create_session(user: str, kind: str, player_count: Optional[int] = None,
+                         frame_counts: Optional[List[int]] = None) -> dict:
+    if kind not in KINDS:
+        raise UploadError(f"unknown upload kind: {kind}")
+    if kind == 'items':
+        if frame_counts is not None and player_count is None:
+            player_count = len(frame_counts)
+        if type(player_count) is not int or player_count < 0:
+            raise UploadError("player_count is required for items uploads")
+        if frame_counts is not None and (
+                len(frame_counts) != player_count or any(type(n) is not int or n < 0 for n in frame_counts)):
+            raise UploadError("frame_counts must list one non-negative count per player")
+
+    session = {
+        '_id': ObjectId(),
+        'user': user,
+        'kind': kind,
+        'version_id': ObjectId(),
+        'player_count': player_count,
+        'frame_counts': frame_counts,
+        'update_time': None,
+        'expires_at': datetime.now(timezone.utc) + timedelta(seconds=UPLOAD_SESSION_TTL),
+    }
+    await collection_upload_sessions.insert_one(session)
+    return session
+
+
+async def find_session(user: str, session_id: str) -> Optional[dict]:
+    """取得使用者自己的工作階段，不存在（或已過期、已完成）時回傳 None"""
+    try:
+        object_id = ObjectId(session_id)
+    except (InvalidId, TypeError):
+        return None
+    return await collection_upload_sessions.find_one({'_id': object_id, 'user': user})
+
+
+async def delete_session(session: dict):
+    await collection_upload_parts.delete_many({'session_id': session['_id']})
+    await collection_upload_sessions.delete_one({'_id': session['_id']})
+
+
+async def _list_parts(session: dict) -> List[dict]:
+    """列出已收到的段落（不含內容）"""
+    if session['kind'] == 'items':
+        projection, order = {'_id': 0, 'player': 1, 'start': 1, 'end': 1}, [('player', 1), ('start', 1)]
+    else:
+        projection, order = {'_id': 0, 'index': 1, 'length': 1}, [('index', 1)]
+    cursor = collection_upload_parts.find({'session_id': session['_id']}, projection).sort(order)
+    return await cursor.to_list(length=None)
+
+
+def _check_items_parts(session: dict, parts: List[dict]) -> List[str]:
+    """回傳段落缺漏的說明；空清單表示已完整"""
+    problems = []
+    frame_counts = session.get('frame_counts')
+    by_player = {player: [] for player in range(session['player_count'])}
+    for part in parts:
+        by_player.setdefault(part['player'], []).append(part)
+
+    for player, player_parts in sorted(by_player.items()):
+        if not player_parts:
+            problems.append(f"player {player}: no parts")
+            continue
+        position = 0
+        for part in player_parts:
+            if part['start'] != position:
+                problems.append(f"player {player}: missing frames [{position}, {part['start']})")
+            position = part['end']
+        if frame_counts is not None and position != frame_counts[player]:
+            problems.append(f"player {player}: has {position} of {frame_counts[player]} frames")
+    return problems
+
+
+def _check_raw_parts(parts: List[dict]) -> List[str]:
+    if not parts:
+        return ["no parts"]
+    indexes = {part['index'] for part in parts}
+    return [f"missing part {index}" for index in range(max(indexes) + 1) if index not in indexes]
+
+
+async def session_status(session: dict) -> dict:
+    """回傳工作階段的狀態與已收到的段落，用於續傳"""
+    parts = await _list_parts(session)
+    if session['kind'] == 'items':
+        problems = _check_items_parts(session, parts)
+    else:
+        problems = _check_raw_parts(parts)
+    return {
+        'session_id': str(session['_id']),
+        'kind': session['kind'],
+        'player_count': session.get('player_count'),
+        'frame_counts': session.get('frame_counts'),
+        'expires_at': session['expires_at'],
+        'parts': parts,
+        'missing': problems,
+    }
+
+
+# ============================================================================
+# 段落
+# ============================================================================
+
+async def put_player_part(session: dict, player: int, start: int, frames) -> dict:
+    """
+    暫存單一玩家從 start 開始的一段影格，frames 為 ingest.parse_player 的結果
+    與此段重疊的舊段落會被取代
+    """
+    if session['kind'] != 'items':
+        raise UploadError("not an items upload session")
+    if not 0 <= player < session['player_count']:
+        raise UploadError(f"invalid player {player}")
+    count = storage.frame_count(frames)
+    if start < 0:
+        raise UploadError(f"invalid start {start}")
+    if count > UPLOAD_PART_MAX_FRAMES:
+        raise UploadError(f"part has {count} frames, limit is {UPLOAD_PART_MAX_FRAMES}")
+    end = start + count
+
+    part = {
+        'session_id': session['_id'],
+        'player': player,
+        'start': start,
+        'end': end,
+        'expires_at': session['expires_at'],
+    }
+    part.update(storage.chunk_content(frames, 0, count))
+    # 取代重疊的段落；長度為 0 的段落只取代相同起點的段落
+    await collection_upload_parts.delete_many({
+        'session_id': session['_id'], 'player': player,
+        '$or': [{'start': start}, {'start': {'$lt': end}, 'end': {'$gt': start}}],
+    })
+    await collection_upload_parts.insert_one(part)
+    return {'player': player, 'start': start, 'end': end}
+
+
+async def put_raw_part(session: dict, index: int, text: str) -> dict:
+    if session['kind'] != 'raw':
+        raise UploadError("not a raw upload session")
+    if index < 0:
+        raise UploadError(f"invalid part index {index}")
+    await collection_upload_parts.replace_one(
+        {'session_id': session['_id'], 'index': index},
+        {'session_id': session['_id'], 'index': index, 'length': len(text), 'text': text,
+         'expires_at': session['expires_at']},
+        upsert=True
+    )
+    return {'index': index, 'length': len(text)}
+
+
+# ============================================================================
+# 完成上傳
+# ============================================================================
+
+async def _iter_item_parts(session: dict):
+    cursor = collection_upload_parts.find(
+        {'session_id': session['_id']}, {'_id': 0, 'player': 1, 'start': 1, 'end': 1, 'columns': 1, 'frames': 1}
+    ).sort([('player', 1), ('start', 1)]).batch_size(4)
+    async for part in cursor:
+        yield part
+
+
+async def _commit_items(session: dict, update_time: str):
+    parts = await _list_parts(session)
+    problems = _check_items_parts(session, parts)
+    if problems:
+        raise UploadError("; ".join(problems))
+
+    frame_counts = [0] * session['player_count']
+    for part in parts:
+        frame_counts[part['player']] = part['end']
+    header = {
+        '_id': session['version_id'],
+        'user': session['user'],
+        'update_time': update_time,
+        'schema': storage.SCHEMA_CHUNKED,
+        'player_count': session['player_count'],
+        'frame_counts': frame_counts,
+        'chunk_frames': storage.COLOR_CHUNK_FRAMES,
+    }
+    await storage.save_staged_version(header, _iter_item_parts(session))
+
+
+async def _commit_raw(session: dict, update_time: str):
+    problems = _check_raw_parts(await _list_parts(session))
+    if problems:
+        raise UploadError("; ".join(problems))
+
+    cursor = collection_upload_parts.find({'session_id': session['_id']}, {'_id': 0, 'text': 1}).sort('index', 1)
+    raw_data = "".join([part['text'] for part in await cursor.to_list(length=None)])
+    await database.insert_version(collection_raw, {
+        '_id': session['version_id'],
+        'user': session['user'],
+        'update_time': update_time,
+        'raw_data': raw_data,
+    })
+
+
+async def _claim_session(session_id, update_time: str) -> dict:
+    """
+    取得工作階段的 commit 權，同一時間只有一個 commit 寫入版本
+    committing 為此次 commit 的期限，處理中的程序中斷而逾期後，重新呼叫的 commit 可以接手
+    """
+    now = datetime.now(timezone.utc)
+    session = await collection_upload_sessions.find_one_and_update(
+        {'_id': session_id, '$or': [{'committing': None}, {'committing': {'$lt': now}}]},
+        {'$set': {'committing': now + timedelta(seconds=UPLOAD_COMMIT_TIMEOUT)}},
+        return_document=ReturnDocument.AFTER
+    )
+    if session is None:
+        if await collection_upload_sessions.find_one({'_id': session_id}, {'_id': 1}) is None:
+            raise UploadError("upload session already finished")
+        raise CommitInProgress("upload session is being committed")
+    if session['update_time'] is None:
+        # 第一次 commit 時決定 update_time，重新 commit 沿用相同的時間
+        session['update_time'] = update_time
+        await collection_upload_sessions.update_one({'_id': session_id}, {'$set': {'update_time': update_time}})
+    return session
+
+
+async def commit_session(session: dict, update_time: str) -> str:
+    """
+    將工作階段寫入為一個版本並清除暫存資料，回傳版本的 update_time
+    段落不完整時拋出 UploadError，其他 commit 處理中時拋出 CommitInProgress；
+    先前的 commit 已寫入版本時補上目錄摘要（可能在寫入表頭後中斷）並完成清除
+    """
+    session = await _claim_session(session['_id'], update_time)
+    update_time = session['update_time']
+
+    try:
+        if session['kind'] == 'items':
+            header = await collection_color.find_one({'_id': session['version_id']})
+            if header is None:
+                await _commit_items(session, update_time)
+            else:
+                await catalog.record_stored_version(header)
+        elif await collection_raw.find_one({'_id': session['version_id']}, {'_id': 1}) is None:
+            await _commit_raw(session, update_time)
+    except UploadError:
+        await collection_upload_sessions.update_one(
+            {'_id': session['_id']}, {'$set': {'update_time': None, 'committing': None}}
+        )
+        raise
+    except Exception:
+        await collection_upload_sessions.update_one({'_id': session['_id']}, {'$set': {'committing': None}})
+        raise
+
+    await delete_session(session)
+    return update_time
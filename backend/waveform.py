@@ -0,0 +1,208 @@
+"""
+音樂波形峰值預先計算
+上傳音樂後由背景 worker 以 ffmpeg 解碼，計算多種解析度的峰值並存成 JSON，
+前端時間軸可直接載入，不必下載並解碼整個 MP3
+
+峰值檔與內容定址的音樂檔放在一起（見 music_store.py），相同內容只計算一次：
+    {MUSIC_FILE_PATH}/.blobs/{hash 前兩碼}/{hash}.peaks.json
+
+格式：
+    {
+        "sha256": ..., "sample_rate": 8000, "duration": 秒數, "bits": 8,
+        "levels": [{"samples_per_peak": 64, "length": N, "data": [min0, max0, min1, max1, ...]}, ...]
+    }
+data 為 -128 ~ 127 的整數（16 位元樣本取高 8 位元），每個峰值涵蓋 samples_per_peak 個樣本
+
+需要系統安裝 ffmpeg（Docker 映像已包含）；未安裝時峰值端點回傳 503
+
+環境變數：
+- WAVEFORM_FFMPEG：ffmpeg 執行檔路徑
+- WAVEFORM_SAMPLE_RATE：解碼取樣率
+- WAVEFORM_TIMEOUT：單一檔案解碼的時間上限（秒），逾時結束 ffmpeg，下次請求時重試
+"""
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+import music_store
+
+logger = logging.getLogger(__name__)
+
+WAVEFORM_FFMPEG = os.getenv('WAVEFORM_FFMPEG', 'ffmpeg')
+WAVEFORM_SAMPLE_RATE = int(os.getenv('WAVEFORM_SAMPLE_RATE', '8000'))
+WAVEFORM_TIMEOUT = float(os.getenv('WAVEFORM_TIMEOUT', '300'))
+
+# 各解析度每個峰值涵蓋的樣本數，後一層由前一層合併而成
+LEVELS = (64, 256, 1024, 4096)
+PEAKS_SUFFIX = '.peaks.json'
+
+# 每次由 ffmpeg 讀取的位元組數（需為 2 * LEVELS[0] 的倍數）
+READ_SIZE = 2 * LEVELS[0] * 512
+
+_queue: Optional[asyncio.Queue] = None
+_pending = set()
+# ffmpeg 無法解碼的檔案，不再重試；逾時或寫入失敗等暫時性錯誤不列入，下次請求時重試
+failed = set()
+
+# ffmpeg 無法執行時設為 False，峰值端點回傳 503
+available = True
+
+
+class DecodeError(RuntimeError):
+    """ffmpeg 無法解碼檔案"""
+
+
+def peaks_path(root: str, digest: str) -> str:
+    blob = music_store.blob_path(root, digest)
+    return blob[:-len(music_store.BLOB_SUFFIX)] + PEAKS_SUFFIX
+
+
+def _fold(minimums: np.ndarray, maximums: np.ndarray, size: int) -> np.ndarray:
+    """每 size 個取最小值與最大值，min / max 交錯排列；最後一組可不足 size 個"""
+    peaks = np.empty(2 * -(-len(minimums) // size), dtype=minimums.dtype)
+    if len(peaks):
+        starts = np.arange(0, len(minimums), size)
+        peaks[0::2] = np.minimum.reduceat(minimums, starts)
+        peaks[1::2] = np.maximum.reduceat(maximums, starts)
+    return peaks
+
+
+def _block_peaks(samples: np.ndarray, block: int) -> np.ndarray:
+    """每 block 個 16 位元樣本取 (min, max)，轉為 8 位元"""
+    samples = (samples >> 8).astype(np.int8)
+    return _fold(samples, samples, block)
+
+
+def _merge_peaks(data: np.ndarray, factor: int) -> np.ndarray:
+    """將較細的 (min, max) 峰值每 factor 個合併為一個"""
+    return _fold(data[0::2], data[1::2], factor)
+
+
+async def _read_peaks(stream: asyncio.StreamReader):
+    """逐段讀取 PCM 並計算最細一層的峰值，回傳 (峰值, 樣本數)"""
+    parts = []
+    sample_count = 0
+    remainder = b''
+    while True:
+        data = await stream.read(READ_SIZE)
+        if not data:
+            break
+        data = remainder + data
+        # 除了最後一段，每段都以完整的 LEVELS[0] 個樣本為單位，各段的峰值可直接串接
+        usable = len(data) - len(data) % (2 * LEVELS[0])
+        remainder = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype='<i2')
+        parts.append(_block_peaks(samples, LEVELS[0]))
+        sample_count += len(samples)
+
+    samples = np.frombuffer(remainder[:len(remainder) - len(remainder) % 2], dtype='<i2')
+    parts.append(_block_peaks(samples, LEVELS[0]))
+    sample_count += len(samples)
+    return np.concatenate(parts), sample_count
+
+
+async def _decode(process):
+    """讀取 ffmpeg 的輸出直到結束；stderr 同時讀取，避免 ffmpeg 因 stderr 緩衝區已滿而停住"""
+    (finest, sample_count), stderr = await asyncio.gather(_read_peaks(process.stdout), process.stderr.read())
+    return finest, sample_count, stderr, await process.wait()
+
+
+async def compute_peaks(path: str) -> dict:
+    """
+    以 ffmpeg 將音樂解碼為單聲道 16 位元 PCM，逐段計算峰值，不保留整段音訊
+    ffmpeg 不存在時拋出 FileNotFoundError，解碼失敗時拋出 DecodeError；
+    超過 WAVEFORM_TIMEOUT 秒時結束 ffmpeg 並拋出 TimeoutError
+    """
+    process = await asyncio.create_subprocess_exec(
+        WAVEFORM_FFMPEG, '-v', 'error', '-i', path,
+        '-f', 's16le', '-acodec', 'pcm_s16le', '-ac', '1', '-ar', str(WAVEFORM_SAMPLE_RATE), '-',
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        finest, sample_count, stderr, returncode = await asyncio.wait_for(_decode(process), WAVEFORM_TIMEOUT)
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    if returncode != 0:
+        raise DecodeError(f"ffmpeg failed for {path}: {stderr.decode(errors='replace').strip()}")
+
+    levels = [finest]
+    for previous, current in zip(LEVELS, LEVELS[1:]):
+        levels.append(_merge_peaks(levels[-1], current // previous))
+
+    return {
+        'sample_rate': WAVEFORM_SAMPLE_RATE,
+        'duration': sample_count / WAVEFORM_SAMPLE_RATE,
+        'bits': 8,
+        'levels': [
+            {'samples_per_peak': samples_per_peak, 'length': len(data) // 2, 'data': data.tolist()}
+            for samples_per_peak, data in zip(LEVELS, levels)
+        ],
+    }
+
+
+def _write_json(path: str, content: dict):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(content, file, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def load_peaks(root: str, digest: str) -> Optional[bytes]:
+    """讀取已計算的峰值 JSON，尚未計算時回傳 None"""
+    try:
+        with open(peaks_path(root, digest), 'rb') as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
+
+
+# ============================================================================
+# 背景 worker
+# ============================================================================
+
+def enqueue(root: str, digest: str) -> bool:
+    """排入峰值計算，已計算或已在佇列中時不重複排入；回傳是否在等待計算"""
+    if os.path.exists(peaks_path(root, digest)):
+        return False
+    if (root, digest) in failed:
+        return False
+    if (root, digest) not in _pending and _queue is not None and available:
+        _pending.add((root, digest))
+        _queue.put_nowait((root, digest))
+    return True
+
+
+async def run_worker(on_done: Optional[Callable[[str, float], Awaitable]] = None):
+    """
+    由 lifespan 啟動，逐一處理佇列中的音樂檔
+    on_done(sha256, duration) 在峰值寫入後呼叫（用於更新音樂目錄）
+    """
+    global _queue, available
+    _queue = asyncio.Queue()
+    while True:
+        root, digest = await _queue.get()
+        try:
+            peaks = await compute_peaks(music_store.blob_path(root, digest))
+            peaks['sha256'] = digest
+            await run_in_threadpool(_write_json, peaks_path(root, digest), peaks)
+            if on_done is not None:
+                await on_done(digest, peaks['duration'])
+        except FileNotFoundError:
+            available = False
+            logger.warning("Waveform peaks disabled: '%s' not found", WAVEFORM_FFMPEG)
+        except DecodeError as e:
+            failed.add((root, digest))
+            logger.warning("Waveform peaks failed for %s: %s", digest, e)
+        except Exception:
+            logger.exception("Waveform peaks failed for %s, retrying on the next request", digest)
+        finally:
+            _pending.discard((root, digest))